@@ -1,8 +1,23 @@
-from xml.etree.ElementTree import ElementTree, tostring, indent
+from os import cpu_count, stat
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.etree.ElementTree import ElementTree
 from subprocess import run, CalledProcessError, TimeoutExpired
-from PyLyX.data.data import LYX_EXE, VERSION, CUR_FORMAT, BACKUP_DIR
+from PyLyX.data.data import LYX_EXE, VERSION, CUR_FORMAT
 from PyLyX.objects.loader import load
-from PyLyX.xhtml.converter import convert
+from PyLyX.objects.cache import cached_load
+from PyLyX.objects.writer import write_lyx
+from PyLyX.objects.LyXobj import changes_count
+from PyLyX.objects.incremental import document_units, changed_units, attributes, splice
+from PyLyX.objects.backups import backup as store_backup, versions as backup_versions, restore
+from PyLyX.objects.index import KindIndex
+from PyLyX.objects.fulltext import TextIndex
+from PyLyX.objects.replace import replace_many
+from PyLyX.objects.selector import select
+from PyLyX.xhtml.converter import convert, convert_stream
+from PyLyX.xhtml.pipeline import WhitespaceStage
+from PyLyX.xhtml.writer import XHTMLWriter
+from PyLyX.xhtml.includes import convert_includes, run_document
 from PyLyX.xhtml.helper import CSS_FOLDER
 from PyLyX.package_helper import correct_name, default_path, run_correct_brackets
 from PyLyX.init_helper import *
@@ -21,20 +36,74 @@ class LyX:
             raise TypeError(f'full_path must be a string, not {type(full_path)}.')
         self.__full_path = correct_name(full_path, '.lyx')
         self.__writeable = bool(writeable)
+        self.__index = self.__text_index = None
 
         if exists(self.__full_path):
             if doc_obj is not None:
                 raise FileExistsError(f'file {self.__full_path} is exists.')
-            self.__doc = load(self.__full_path)
+            self.__doc = cached_load(self.__full_path)
             if not self.__writeable:
                 self.__doc.set('original_file', self.__full_path)
+            self.__mark_saved()
         elif type(doc_obj) is Environment:
             if not doc_obj.is_command('document'):
                 raise TypeError(f'invalid document object: command of {doc_obj} is not "document", but {doc_obj.command()}.')
             self.__doc = doc_obj
+            self.__saved, self.__stat, self.__units, self.__attributes = 0, None, None, None
         else:
             raise TypeError(f'{full_path} is not valid path, and type of {doc_obj} is not {Environment.NAME}.')
 
+    def __getstate__(self):
+        # the units and the index refer to objects of the document, which are pickled with the document only.
+        state = self.__dict__.copy()
+        state['_LyX__units'] = state['_LyX__index'] = state['_LyX__text_index'] = state['_LyX__attributes'] = None
+        state['_LyX__stat'] = self.__stat if self.__changed_units() == [] else None
+        return state
+
+    def __setstate__(self, state):
+        # the times of changes are counted in any process separately, so a document which was changed (and not saved)
+        # before it was pickled is written whole in its next save.
+        self.__dict__.update(state)
+        self.__saved = changes_count()
+        if self.__stat is not None and len(self.__doc) > 1:
+            self.__units = document_units(self.__doc)
+            self.__attributes = [attributes(unit) for unit in self.__units] + [self.__doc.items()]
+
+    def __mark_saved(self):
+        """
+        Remember the state of the file and the document, for saving only their differences next time.
+        """
+        info = stat(self.__full_path)
+        self.__stat = info.st_size, info.st_mtime_ns
+        self.__saved = changes_count()
+        self.__units = document_units(self.__doc) if len(self.__doc) > 1 else None
+        self.__attributes = None
+        if self.__units is not None:
+            self.__attributes = [attributes(unit) for unit in self.__units] + [self.__doc.items()]
+
+    def __changed_units(self) -> list | None:
+        """
+        :return: Indexes of the units (see objects/incremental.py) which were changed since the last load or save,
+                 or None if the whole document must be written again.
+        """
+        if self.__units is None or not exists(self.__full_path):
+            return None
+        info = stat(self.__full_path)
+        if (info.st_size, info.st_mtime_ns) != self.__stat or str(self.__doc.get('lyxformat', CUR_FORMAT)) != str(CUR_FORMAT):
+            return None
+        elif self.__doc.items() != self.__attributes[-1]:
+            return None
+        elif changes_count() == self.__saved:
+            return [i for i, unit in enumerate(self.__units) if attributes(unit) != self.__attributes[i]]
+        else:
+            return changed_units(self.__doc, self.__units, self.__saved, self.__attributes)
+
+    def is_changed(self) -> bool:
+        """
+        :return: Was the document changed since it was loaded or saved?
+        """
+        return self.__changed_units() != []
+
     def save_as(self, path: str):
         """
         Save the LyX document object in a given path.
@@ -47,43 +116,76 @@ class LyX:
             path = correct_name(path, '.lyx')
             with open(path, 'x', encoding='utf8') as file:
                 file.write(PREFIX)
-                file.write(self.__doc.obj2lyx())
+                write_lyx(self.__doc, file)
 
-    def save(self, backup=True):
+    def save(self, backup=True, force=False):
         """
         Save the LyX document in its current path.
+        If the document was not changed since it was loaded or saved, nothing is done.
+        If only the header or some top-level layouts were changed, only they are written again,
+        into their places in the file's code.
         :param backup: do you want backup the old version of the LyX document?
+        :param force: write the whole document again, even if no change was found.
         """
         if not self.__writeable:
             raise Exception(f'{self} is not writeable.')
         else:
+            indexes = None if force else self.__changed_units()
+            if indexes == []:
+                return
             if backup:
                 self.backup()
+            code = None
+            if indexes is not None:
+                with open(self.__full_path, 'r', encoding='utf8') as file:
+                    code = splice(file.read(), self.__units, indexes)
             path = self.__full_path + '_'
             if exists(path):
                 remove(path)
             with open(path, 'x', encoding='utf8') as file:
-                file.write(PREFIX)
-                if self.__doc.get('lyxformat', CUR_FORMAT) != CUR_FORMAT:
-                    run_correct_brackets(self.__doc)
-                file.write(self.__doc.obj2lyx())
+                if code is not None:
+                    file.write(code)
+                else:
+                    file.write(PREFIX)
+                    if str(self.__doc.get('lyxformat', CUR_FORMAT)) != str(CUR_FORMAT):
+                        run_correct_brackets(self.__doc)
+                    write_lyx(self.__doc, file)
             if exists(self.__full_path):
                 remove(self.__full_path)
             rename(self.__full_path + '_', self.__full_path)
+            self.__mark_saved()
 
     def backup(self) -> bool:
         """
-        Backup the old version of the LyX document in the buckup directory.
-        If the backup directory is not define, use the Downloads directory instead.
+        Backup the old version of the LyX document in the backups store (see objects/backups.py),
+        in the buckup directory. If the backup directory is not define, use the Downloads directory instead.
+        Only the top-level layouts which were changed since older versions are saved again.
         :return: True if buckup was success, False else.
         """
         if exists(self.__full_path):
-            name = split(self.__full_path)[1]
-            copy(self.__full_path, join(BACKUP_DIR, name))
+            store_backup(self.__full_path)
             return True
         else:
             return False
 
+    def versions(self) -> list:
+        """
+        :return: List of the backed up versions of the LyX document, from the oldest (see objects/backups.py).
+        """
+        return backup_versions(self.__full_path)
+
+    def restore(self, version=-1):
+        """
+        Restore a backed up version of the LyX document, and load it again.
+        The current version is backed up first, so the restore may be undone.
+        :param version: the version's number, as in versions() (-1 is the last version).
+        """
+        if not self.__writeable:
+            raise Exception(f'{self} is not writeable.')
+        restore(self.__full_path, version)
+        self.__doc = cached_load(self.__full_path)
+        self.__mark_saved()
+
     def get_path(self) -> str:
         """
         :return: the file's path.
@@ -147,7 +249,8 @@ class LyX:
         return False
 
     def export2xhtml(self, output_path='', css_files=(), css_folder=CSS_FOLDER, css_copy: bool | None = None, js_files=(), js_in_head=False,
-                     remove_old: bool | None = None, keep_data=False, replaces: dict | None = None):
+                     remove_old: bool | None = None, keep_data=False, replaces: dict | None = None, stream=True,
+                     workers=1):
         """
         Export the LyX document to xhtml by the PyLyX package.
         :param output_path: path for save the exporting file.
@@ -159,14 +262,30 @@ class LyX:
         :param remove_old: do you want to remove the old xhtml version (if exists)?
         :param keep_data: do you want save data from the LyX file, which is unnecessary for xhtml?
         :param replaces: a dictionary of string replaces (useful when you want change the xhtml file path)
+        :param stream: do you want write the xhtml file while it is converted? (if False convert the whole document first)
+                       the output is the same, but the converted document is not kept in memory.
+        :param workers: number of processes for converting the included LyX files and the sections of the document
+                        (1 for converting them in this process), see xhtml/parallel.py. On Windows, call it under an "if __name__ == '__main__':" guard.
         """
         output_path = default_path(self.__full_path, '.xhtml', output_path)
         old_file_remove(output_path, remove_old)
-        root, info = convert(self.__doc, css_files, css_folder, js_files, js_in_head, keep_data, replaces)
-        xhtml_style(root, output_path, css_copy, info)
-        indent(root)
+        convert_includes(self.__doc, self.__full_path, workers, keep_data, replaces)
+        if stream:
+            def style(root, info):
+                xhtml_style(root, output_path, css_copy, info, whitespaces=False)
+            try:
+                with open(output_path, 'wb') as f:
+                    run_document(self.__full_path, convert_stream, self.__doc, f, css_files, css_folder, js_files,
+                                 js_in_head, keep_data, replaces, [WhitespaceStage()], style, workers=workers)
+            except Exception:
+                remove(output_path)
+                raise
+            return True
+        root, info = run_document(self.__full_path, convert, self.__doc, css_files, css_folder, js_files, js_in_head,
+                                  keep_data, replaces, [WhitespaceStage()], workers)
+        xhtml_style(root, output_path, css_copy, info, whitespaces=False)
         with open(output_path, 'wb') as f:
-            f.write(tostring(root, encoding='utf8'))
+            XHTMLWriter(f).element(root)
         return True
 
     def export2xml(self, output_path=''):
@@ -184,13 +303,60 @@ class LyX:
         """
         Find the first element which has a given query in its text or tail.
         :param query: query for search.
-        :param command: search in elements with this command only.
+        :param command: search in elements with this command only (by the index of the document).
         :param category: search in elements with these command and category only.
         :param details: search in elements with these command category, and details only.
         :return: the first element which has a given query in its text or tail (None if there is no such element).
+                 Elements of given command are found also if the query is in their sub-elements.
+                 If the full-text index was built (see text_index()), it is used for queries without command.
         """
+        if command:
+            return self.index().find(query, command, category, details)
+        elif query and self.__text_index is not None and self.__text_index.root() is self.__doc[1]:
+            return self.__text_index.find(query)
         return rec_find(self.__doc[1], query, command, category, details)
 
+    def index(self) -> KindIndex:
+        """
+        :return: The index of the document's body by the kinds of its objects (see objects/index.py).
+                 It is built in the first query, and again after any change of the body's structure.
+        """
+        if self.__index is None or self.__index.root() is not self.__doc[1]:
+            self.__index = KindIndex(self.__doc[1])
+        return self.__index
+
+    def text_index(self) -> TextIndex:
+        """
+        :return: The full-text index of the document's body (see objects/fulltext.py).
+                 It is built in the first call, and then find() uses it too.
+        """
+        if self.__text_index is None or self.__text_index.root() is not self.__doc[1]:
+            self.__text_index = TextIndex(self.__doc[1])
+        return self.__text_index
+
+    def search(self, query: str) -> list:
+        """
+        Find all the elements which have a given query in their text or tail, by the full-text index.
+        :param query: query for search.
+        :return: List of (path, element) of the elements, in the document order.
+        """
+        return self.text_index().search_paths(query)
+
+    def select(self, selector: str):
+        """
+        Find the elements which match a selector, like "layout:Section > inset:Formula" (see objects/selector.py).
+        :param selector: the selector.
+        :return: Generator of the elements of the document which match the selector, in the document order.
+        """
+        return select(self.__doc, selector)
+
+    def sections(self, category='') -> list:
+        """
+        :param category: the sections' category, like "Section" (all the sections if it is empty).
+        :return: List of the Containers of the document's sections, in the document order.
+        """
+        return self.index().sections(category)
+
     def find_and_replace(self, old_str, new_str, command: str | None = None, category: str | None = None, details: str | None = None, backup=True):
         """
         Find and replace any occurrence of given string with another given string.
@@ -204,7 +370,30 @@ class LyX:
         if backup:
             self.backup()
         rec_find_and_replace(self.__doc, old_str, new_str, command, category, details)
-        self.save()
+        self.save(backup=False)
+
+    def find_and_replace_many(self, patterns, command: str | None = None, category: str | None = None, details: str | None = None,
+                              dry_run=False, backup=True) -> list:
+        """
+        Find and replace many patterns in one traversal of the document, with one backup and one save.
+        :param patterns: iterable of (old, new) pairs: old is a string, or a regular expression (re.compile());
+                         new is a string (a template for a regular expression, as in re.sub()) or a function of a match.
+                         Strings are replaced at once (the longest one in any position), then the regular expressions by order.
+        :param command: find and replace in elements with this command only.
+        :param category: find and replace in elements with these command and category only.
+        :param details: find and replace in elements with these command category, and details only.
+        :param dry_run: count the replacements without changing the document (nor backing up and saving it).
+        :param backup: do you want backup the old version of the LyX document?
+        :return: List of the numbers of replacements, by the patterns' order.
+        """
+        if dry_run:
+            return replace_many(self.__doc, patterns, command, category, details, dry_run=True)
+        if backup:
+            self.backup()
+        counts = replace_many(self.__doc, patterns, command, category, details)
+        if any(counts):
+            self.save(backup=False)
+        return counts
 
     def update_version(self, backup=True) -> bool:
         """
@@ -220,6 +409,50 @@ class LyX:
             updated_now = False
         else:
             self.export('lyx')
-            self.__doc = load(self.__full_path)
+            self.__doc = cached_load(self.__full_path)
+            self.__mark_saved()
             updated_now = True
         return updated_now
+
+
+def safe_open(full_path: str, writeable=True):
+    """
+    :return: LyX object of an existing file, or the exception which was raised while loading it.
+    """
+    try:
+        if not exists(full_path):
+            raise FileNotFoundError(f'file {full_path} is not exists.')
+        return LyX(full_path, writeable)
+    except Exception as e:
+        return e
+
+
+def load_many(paths, workers: int | None = None, writeable=True, ordered=True):
+    """
+    Load many LyX files, in parallel processes.
+    On Windows, call it under an "if __name__ == '__main__':" guard.
+    :param paths: paths of .lyx files.
+    :param workers: number of processes (default: the number of processors).
+    :param writeable: do you want to write over the files?
+    :param ordered: do you want the results in the order of paths? (if False, they are yielded as they complete)
+    :return: If ordered, list of LyX objects in the order of paths; a file which could not be loaded has the raised
+             exception instead. Else, generator of (path, LyX object or exception) tuples in the order of completion.
+    """
+    paths = list(paths)
+    workers = workers if workers else cpu_count()
+    if ordered:
+        chunk = max(1, len(paths) // (4 * workers))
+        with ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(safe_open, paths, repeat(writeable), chunksize=chunk))
+    else:
+        return load_completed(paths, workers, writeable)
+
+
+def load_completed(paths: list, workers: int, writeable=True):
+    """
+    :return: Generator of (path, LyX object or exception) tuples, in the order of completion.
+    """
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(safe_open, path, writeable): path for path in paths}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1,45 @@
+"""
+Benchmark of the document builder.
+
+Usage: python bench_builder.py
+Documents of growing numbers of paragraphs are built by LyX.append() (rec_append()), which searches the tree
+in any call, and by a DocumentBuilder, which appends in O(1) and checks the tree once.
+"""
+
+from PyLyX.objects.Environment import Environment
+from PyLyX.objects.builder import DocumentBuilder
+from PyLyX.init_helper import rec_append
+from PyLyX.benchmarks.helper import timed
+
+SIZES = (250, 500, 1000, 2000)
+
+
+def question(i: int) -> Environment:
+    paragraph = Environment('layout', 'Standard', text=f'Question {i}: solve ')
+    paragraph.append(Environment('inset', 'Formula', text=f'$x^{{2}}={i}$'))
+    return paragraph
+
+
+def by_rec_append(size: int):
+    body = Environment('body')
+    for i in range(size):
+        rec_append(body, question(i))
+    return body
+
+
+def by_builder(size: int):
+    builder = DocumentBuilder(Environment('body'))
+    for i in range(size):
+        builder.append(question(i))
+    return builder.build()
+
+
+def main(sizes=SIZES):
+    for size in sizes:
+        _, slow = timed(by_rec_append, size, repeat=1)
+        _, fast = timed(by_builder, size)
+        print(f'{size} paragraphs: {slow:.3f}s by rec_append(), {fast:.3f}s by DocumentBuilder')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark of the LyX loader.
+
+Usage: python bench_loader.py [lyx_file]
+If no file is given, a large synthetic document is generated.
+The loader is also stressed with lists nested in depths of thousands,
+and with formula-heavy documents (long display formulas and a long preamble).
+The nesting checks are timed with the NESTING table of registry.py, and with the rules computed any time.
+The nested documents are checked: all of their levels are loaded, and they are loaded again the same from their LyX code.
+"""
+
+from sys import argv
+from os import remove
+from os.path import join
+from tempfile import gettempdir
+from tracemalloc import start, stop, get_traced_memory
+from PyLyX.objects.loader import load, tokenize, TOKENS
+from PyLyX.objects.registry import NESTING
+from PyLyX.init_helper import PREFIX
+from PyLyX.benchmarks.helper import generate, generate_nested, nested_levels, timed
+
+DEPTHS = (1000, 2000, 4000, 8000)
+FORMULA_LINES = (100, 1000, 10000)
+
+
+def bench_tokenize(lines: list):
+    TOKENS.clear()
+    for line in lines:
+        tokenize(line)
+
+
+def nesting_pairs(root) -> list:
+    """
+    :return: List of (object, father) for any object of root and any of its ancestors, as the loader checks them.
+    """
+    pairs = []
+    stack = [(root, [])]
+    while stack:
+        e, ancestors = stack.pop()
+        pairs.extend((e, father) for father in ancestors)
+        ancestors = ancestors[-8:] + [e]
+        stack.extend((sub, ancestors) for sub in e)
+    return pairs
+
+
+def check_rules(pairs: list):
+    for obj, father in pairs:
+        obj.nesting_rule(father)
+
+
+def check_table(pairs: list):
+    for obj, father in pairs:
+        obj.is_nestable_in(father)
+
+
+def bench_rules(path: str):
+    """
+    Time the nesting checks of a loaded document, and its loading with an empty NESTING table and with a full one.
+    """
+    NESTING.clear()
+    _, cold = timed(load, path, repeat=1)
+    root, warm = timed(load, path)
+    for e in root.iter():
+        e.open()
+    pairs = nesting_pairs(root)
+    _, rules = timed(check_rules, pairs)
+    _, table = timed(check_table, pairs)
+    print(f'nesting checks: {len(pairs)} checks in {rules:.3f}s by the rules, in {table:.3f}s by the table '
+          f'({len(NESTING)} entries)')
+    print(f'load with an empty nesting table: {cold:.3f}s, with a full one: {warm:.3f}s')
+
+
+def bench_nesting(depths=DEPTHS):
+    """
+    Load documents with deeply nested lists; time and memory should grow linearly with the depth.
+    Any document is checked by a round-trip: its LyX code (by obj2lyx()) is loaded again to the same body.
+    """
+    copy = join(gettempdir(), 'pylyx_benchmark_nested_copy.lyx')
+    for depth in depths:
+        path = generate_nested(depth)
+        root, seconds = timed(load, path, repeat=1)
+        start()
+        load(path)
+        peak = get_traced_memory()[1]
+        stop()
+        levels = nested_levels(root)
+        assert levels == depth + 1, f'nesting depth {depth}: {levels} levels were loaded'
+        code = root.obj2lyx()
+        with open(copy, 'w', encoding='utf8') as file:
+            file.write(PREFIX + code)
+        again = load(copy)
+        assert nested_levels(again) == levels and again[1].obj2lyx() == root[1].obj2lyx(), \
+            f'nesting depth {depth}: the round-trip failed'
+        print(f'nesting depth {depth}: {levels} levels loaded in {seconds:.3f}s, peak memory {peak / 2**20:.1f} MB')
+    remove(copy)
+
+
+def bench_formulas(sizes=FORMULA_LINES):
+    """
+    Load documents with display formulas of many lines, and a preamble of the same length.
+    """
+    for lines in sizes:
+        path = generate(join(gettempdir(), f'pylyx_benchmark_formulas_{lines}.lyx'), sections=2, subsections=2,
+                        paragraphs=8, formula_lines=lines, preamble_lines=lines)
+        _, seconds = timed(load, path)
+        start()
+        load(path)
+        peak = get_traced_memory()[1]
+        stop()
+        print(f'formulas of {lines} lines: loaded in {seconds:.3f}s, peak memory {peak / 2**20:.1f} MB')
+
+
+def main(path=''):
+    path = path if path else generate()
+    with open(path, 'r', encoding='utf8') as file:
+        lines = file.readlines()
+
+    _, seconds = timed(bench_tokenize, lines)
+    print(f'tokenize: {len(lines)} lines in {seconds:.3f}s ({len(lines) / seconds:,.0f} lines per second)')
+    _, seconds = timed(load, path)
+    print(f'load:     {len(lines)} lines in {seconds:.3f}s ({len(lines) / seconds:,.0f} lines per second)')
+    bench_rules(path)
+    bench_nesting()
+    bench_formulas()
+
+
+if __name__ == '__main__':
+    main(argv[1] if len(argv) > 1 else '')
@@ -0,0 +1,56 @@
+"""
+Benchmark of the LyX serializer.
+
+Usage: python bench_writer.py [lyx_file]
+If no file is given, a large synthetic document is generated.
+The serializer is also timed on lists nested in growing depths, where its time should grow linearly;
+the written files are loaded again and checked.
+"""
+
+from sys import argv
+from os import remove
+from os.path import join
+from tempfile import gettempdir
+from PyLyX.objects.loader import load
+from PyLyX.objects.writer import write_lyx
+from PyLyX.init_helper import PREFIX
+from PyLyX.benchmarks.helper import generate, generate_nested, nested_levels, timed
+
+DEPTHS = (250, 500, 1000, 2000)
+
+
+def save(root, path: str):
+    with open(path, 'w', encoding='utf8') as file:
+        file.write(PREFIX)
+        write_lyx(root, file)
+
+
+def bench_nesting(depths=DEPTHS):
+    """
+    Serialize documents with deeply nested lists, and check that the written documents are loaded the same.
+    """
+    path = join(gettempdir(), 'pylyx_benchmark_output.lyx')
+    for depth in depths:
+        root = load(generate_nested(depth))
+        _, seconds = timed(save, root, path)
+        again = load(path)
+        assert nested_levels(again) == depth + 1, f'nesting depth {depth}: {nested_levels(again)} levels were written'
+        assert again[1].obj2lyx() == root[1].obj2lyx(), f'nesting depth {depth}: the written body is different'
+        print(f'nesting depth {depth}: written in {seconds:.3f}s')
+    remove(path)
+
+
+def main(path=''):
+    path = path if path else generate()
+    root = load(path)
+    output = join(gettempdir(), 'pylyx_benchmark_output.lyx')
+    code, seconds = timed(root.obj2lyx)
+    print(f'obj2lyx:   {len(code):,} characters in {seconds:.3f}s')
+    _, seconds = timed(save, root, output)
+    print(f'write_lyx: {len(code):,} characters in {seconds:.3f}s')
+    remove(output)
+    bench_nesting()
+
+
+if __name__ == '__main__':
+    main(argv[1] if len(argv) > 1 else '')
@@ -0,0 +1,203 @@
+"""
+Benchmark of the XHTML pipeline.
+
+Usage: python bench_xhtml.py
+After the conversion of the body, the title, the numbering and the table of contents, the footnotes and the captions,
+any module and the whitespaces were separate passes over the converted body. They are timed as separate passes
+(by the helpers which run one stage each) and as stages of one traversal (as convert() runs them),
+on documents of growing sizes; the outputs of both are checked to be the same.
+The export of the whole converted document (written at once by XHTMLWriter) is compared with the streaming export
+(convert_stream()) by time and peak memory (of the export only, the loaded document is not counted);
+the files of both are checked to be the same.
+The conversion of single objects (one_obj()) is timed with the compiling of the conversion plans, and by the plans.
+The conversion of the sections in worker processes (workers=N, see xhtml/parallel.py) is compared with the conversion
+in one process, in memory and streaming; the files are checked to be the same.
+The export is also timed on lists nested in growing depths (the writer indents and serializes them without recursion);
+the files of both exports are checked to be the same, with all the levels of the lists.
+"""
+
+from os import cpu_count
+from re import finditer
+from os.path import join
+from tempfile import gettempdir
+from xml.etree.ElementTree import tostring
+from time import perf_counter
+from tracemalloc import start, stop, get_traced_memory
+from PyLyX.objects.loader import load
+from PyLyX.objects.LyXobj import LyXobj
+from PyLyX.xhtml.converter import one_obj, recursive_convert, convert, convert_stream, PLANS
+from PyLyX.xhtml.helper import scan_head, create_title, numbering_and_toc, number_foots_and_captions, TitleStage, \
+    NumberingStage, CaptionStage
+from PyLyX.xhtml.modules import perform_module, module_stages
+from PyLyX.xhtml.pipeline import run_stages, WhitespaceStage
+from PyLyX.xhtml.writer import XHTMLWriter
+from PyLyX.benchmarks.helper import generate, generate_nested, timed
+
+SIZES = (2, 5, 10, 20)  # numbers of sections, of 10 subsections of 20 paragraphs.
+STREAM_SIZES = (5, 20, 50)
+PARALLEL_SIZES = (10, 50)
+DEPTHS = (250, 1000, 3000)
+MODULES = ('theorems-ams', 'theorems-sec', 'customHeadersFooters')
+
+
+def prepare(doc):
+    info = scan_head(doc[0])
+    toc = LyXobj('ul')
+    body = recursive_convert(doc[1], info['language'], (LyXobj('h2'), toc))
+    return one_obj(doc[0]), body, info, toc
+
+
+def by_passes(doc):
+    head, body, info, toc = prepare(doc)
+    lang, secnumdepth, tocdepth = info['language'], info.get('secnumdepth', -1), info.get('tocdepth', -1)
+    passes = [lambda: create_title(head, body),
+              lambda: numbering_and_toc(toc, body, secnumdepth, tocdepth, '', lang),
+              lambda: number_foots_and_captions(body, lang)]
+    passes.extend(lambda module=module: perform_module(module, head, body, info) for module in info.get('modules', ()))
+    passes.append(lambda: run_stages(body, [WhitespaceStage()]))
+    start = perf_counter()
+    for run in passes:
+        run()
+    return body, len(passes), perf_counter() - start
+
+
+def by_stages(doc):
+    head, body, info, toc = prepare(doc)
+    lang = info['language']
+    stages = [TitleStage(head), NumberingStage(toc, info.get('secnumdepth', -1), info.get('tocdepth', -1), lang),
+              CaptionStage(lang)]
+    for module in info.get('modules', ()):
+        stages.extend(module_stages(module, head, body, info))
+    stages.append(WhitespaceStage())
+    start = perf_counter()
+    run_stages(body, stages)
+    return body, 1, perf_counter() - start
+
+
+def in_memory(doc, path: str):
+    root, info = convert(doc, stages=[WhitespaceStage()])
+    with open(path, 'wb') as f:
+        XHTMLWriter(f).element(root)
+
+
+def streaming(doc, path: str):
+    with open(path, 'wb') as f:
+        convert_stream(doc, f, stages=[WhitespaceStage()])
+
+
+def measure(export, doc, path: str):
+    """
+    :return: Tuple of (seconds, peak memory in bytes) of the export.
+    """
+    seconds = perf_counter()
+    export(doc, path)
+    seconds = perf_counter() - seconds
+    start()
+    export(doc, path)
+    peak = get_traced_memory()[1]
+    stop()
+    return seconds, peak
+
+
+def bench_stream(sizes=STREAM_SIZES):
+    for size in sizes:
+        doc = load(generate(sections=size, modules=MODULES))
+        paths = [join(gettempdir(), f'pylyx_benchmark_{name}.xhtml') for name in ('memory', 'stream')]
+        slow, big = measure(in_memory, doc, paths[0])
+        fast, small = measure(streaming, doc, paths[1])
+        with open(paths[0], 'rb') as f, open(paths[1], 'rb') as g:
+            if f.read() != g.read():
+                print(f'{size} sections: the files are different!')
+        print(f'{size} sections: in memory {slow:.3f}s, peak {big / 2**20:.1f} MB; '
+              f'streaming {fast:.3f}s, peak {small / 2**20:.1f} MB')
+
+
+def convert_objects(objects: list):
+    for obj in objects:
+        one_obj(obj)
+
+
+def bench_plans(size=20):
+    objects = list(load(generate(sections=size, modules=MODULES)).iter())
+    PLANS.clear()
+    _, cold = timed(convert_objects, objects, repeat=1)
+    _, warm = timed(convert_objects, objects)
+    print(f'one_obj: {len(objects)} objects, {len(PLANS)} plans; '
+          f'{cold:.3f}s with compiling the plans, {warm:.3f}s by the plans')
+
+
+def in_workers(doc, path: str, workers: int, stream: bool):
+    if stream:
+        with open(path, 'wb') as f:
+            convert_stream(doc, f, stages=[WhitespaceStage()], workers=workers)
+    else:
+        root, info = convert(doc, stages=[WhitespaceStage()], workers=workers)
+        with open(path, 'wb') as f:
+            XHTMLWriter(f).element(root)
+
+
+def bench_parallel(sizes=PARALLEL_SIZES, workers=None):
+    workers = workers if workers else max(2, min(cpu_count() or 1, 8))
+    for size in sizes:
+        doc = load(generate(sections=size, modules=MODULES))
+        for stream in (False, True):
+            paths = [join(gettempdir(), f'pylyx_benchmark_{name}.xhtml') for name in ('serial', 'parallel')]
+            _, serial = timed(in_workers, doc, paths[0], 1, stream, repeat=1)
+            _, parallel = timed(in_workers, doc, paths[1], workers, stream, repeat=1)
+            with open(paths[0], 'rb') as f, open(paths[1], 'rb') as g:
+                if f.read() != g.read():
+                    print(f'{size} sections: the files are different!')
+            print(f'{size} sections ({"streaming" if stream else "in memory"}): 1 process {serial:.3f}s, '
+                  f'{workers} processes {parallel:.3f}s')
+
+
+def list_levels(path: str) -> int:
+    """
+    :return: The number of levels of the deepest list (<ul> element) in an XHTML file.
+    """
+    levels = level = 0
+    with open(path, 'r', encoding='utf8') as f:
+        for tag in finditer(r'<(/?)ul[\s>]', f.read()):
+            level += -1 if tag.group(1) else 1
+            levels = max(levels, level)
+    return levels
+
+
+def bench_nesting(depths=DEPTHS):
+    """
+    Export documents with deeply nested lists, in memory and streaming,
+    and check that both files are the same and have all the levels of the list.
+    """
+    paths = [join(gettempdir(), f'pylyx_benchmark_nested_{name}.xhtml') for name in ('memory', 'stream')]
+    for depth in depths:
+        doc = load(generate_nested(depth))
+        _, slow = timed(in_memory, doc, paths[0], repeat=1)
+        _, fast = timed(streaming, doc, paths[1], repeat=1)
+        with open(paths[0], 'rb') as f, open(paths[1], 'rb') as g:
+            assert f.read() == g.read(), f'nesting depth {depth}: the files are different'
+        levels = list_levels(paths[1])
+        assert levels == depth + 1, f'nesting depth {depth}: {levels} levels were exported'
+        print(f'nesting depth {depth}: in memory {slow:.3f}s, streaming {fast:.3f}s')
+
+
+def main(sizes=SIZES, repeat=3):
+    for size in sizes:
+        doc = load(generate(sections=size, modules=MODULES))
+        n = sum(1 for _ in doc[1].iter())
+        slow = fast = float('inf')
+        for _ in range(repeat):
+            old, passes, seconds = by_passes(doc)
+            slow = min(slow, seconds)
+            new, traversals, seconds = by_stages(doc)
+            fast = min(fast, seconds)
+        if tostring(old) != tostring(new):
+            print(f'{size} sections: the outputs are different!')
+        print(f'{size} sections ({n} objects): {passes} passes in {slow:.3f}s, {traversals} traversal in {fast:.3f}s')
+    bench_stream()
+    bench_plans()
+    bench_parallel()
+    bench_nesting()
+
+
+if __name__ == '__main__':
+    main()
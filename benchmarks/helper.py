@@ -0,0 +1,181 @@
+"""
+Helper utilities for the PyLyX benchmarks.
+
+This module provides functions for:
+- Generating large synthetic LyX documents (sections, formulas, lists, tables and footnotes)
+- Timing functions
+"""
+
+from os.path import join
+from time import perf_counter
+from tempfile import gettempdir
+from PyLyX.data.data import PACKAGE_PATH
+
+TEMPLATE = join(PACKAGE_PATH, 'data', 'templates', 'en.lyx')
+
+
+def paragraph(i: int):
+    return f'''\\begin_layout Standard
+Paragraph {i} with a formula
+\\begin_inset Formula $x_{{{i}}}^{{2}}+y=\\alpha$
+\\end_inset
+
+ and a
+\\series bold
+bold text
+\\series default
+ in
+\\lang hebrew
+עברית
+\\lang english
+.
+\\begin_inset Foot
+status open
+
+\\begin_layout Plain Layout
+Footnote {i}.
+\\end_layout
+
+\\end_inset
+
+
+\\end_layout
+
+'''
+
+
+def formula(i: int, lines: int):
+    rows = '\n'.join(f'a_{{{i}}}^{{{j}}} & =b_{{{j}}}+c\\\\' for j in range(lines))
+    return f'''\\begin_layout Standard
+\\begin_inset Formula
+\\begin{{align*}}
+{rows}
+\\end{{align*}}
+
+\\end_inset
+
+
+\\end_layout
+
+'''
+
+
+def items(i: int, depth: int):
+    level = ''.join(f'\\begin_layout Itemize\nItem {i}.{j}\n\\end_layout\n\n' for j in range(2))
+    return (level + '\\begin_deeper\n') * depth + level + '\\end_deeper\n' * depth
+
+
+def table(i: int):
+    cells = ''
+    for j in range(2):
+        cells += f'''<cell alignment="center" valignment="top" topline="true" leftline="true" usebox="none">
+\\begin_inset Text
+
+\\begin_layout Plain Layout
+Cell {i}.{j}
+\\end_layout
+
+\\end_inset
+</cell>
+'''
+    return f'''\\begin_layout Standard
+\\begin_inset Tabular
+<lyxtabular version="3" rows="1" columns="2">
+<features tabularvalignment="middle">
+<column alignment="center" valignment="top">
+<column alignment="center" valignment="top">
+<row>
+{cells}</row>
+</lyxtabular>
+
+\\end_inset
+
+
+\\end_layout
+
+'''
+
+
+def generate(path='', sections=10, subsections=10, paragraphs=20, depth=2, formula_lines=12, top='Section',
+             preamble_lines=0, modules=()):
+    """
+    Generate a synthetic LyX document.
+    :param path: where to save the document (default: in the temp directory).
+    :param sections: number of top level sections.
+    :param subsections: number of sub-sections in any section.
+    :param paragraphs: number of paragraphs in any sub-section.
+    :param depth: nesting depth of the lists.
+    :param formula_lines: number of lines in any display formula.
+    :param top: layout of the top level sections ("Part", "Chapter", "Section", etc.)
+    :param preamble_lines: number of macro definitions added to the preamble.
+    :param modules: names of LyX modules of the document.
+    :return: the document's path.
+    """
+    path = path if path else join(gettempdir(), f'pylyx_benchmark_{sections}_{subsections}_{paragraphs}.lyx')
+    with open(TEMPLATE, 'r', encoding='utf8') as file:
+        header = file.read().split('\\begin_body')[0]
+    if preamble_lines:
+        macros = ''.join(f'\\newcommand{{\\macro{i}}}{{x_{{{i}}}}}\n' for i in range(preamble_lines))
+        header = header.replace('\\use_default_options', f'\\begin_preamble\n{macros}\\end_preamble\n\\use_default_options', 1)
+    if modules:
+        header = header.replace('\\use_default_options true\n', '\\use_default_options true\n\\begin_modules\n' + '\n'.join(modules) + '\n\\end_modules\n', 1)
+    sub = {'Part': 'Chapter', 'Chapter': 'Section', 'Section': 'Subsection'}.get(top, 'Subsubsection')
+
+    with open(path, 'w', encoding='utf8') as file:
+        file.write(header)
+        file.write('\\begin_body\n\n\\begin_layout Title\nBenchmark\n\\end_layout\n\n')
+        n = 0
+        for i in range(sections):
+            file.write(f'\\begin_layout {top}\n{top} {i}\n\\end_layout\n\n')
+            for j in range(subsections):
+                file.write(f'\\begin_layout {sub}\n{sub} {i}.{j}\n\\end_layout\n\n')
+                for k in range(paragraphs):
+                    n += 1
+                    file.write(paragraph(n))
+                    if k % 4 == 0 and formula_lines:
+                        file.write(formula(n, formula_lines))
+                    if k % 5 == 0:
+                        file.write(items(n, depth))
+                    if k % 7 == 0:
+                        file.write(table(n))
+        file.write('\\end_body\n\\end_document\n')
+    return path
+
+
+def generate_nested(depth: int, path='') -> str:
+    """
+    Generate a LyX document with one list, nested in the given depth (by \\begin_deeper blocks).
+    :return: the document's path.
+    """
+    path = path if path else join(gettempdir(), f'pylyx_benchmark_nested_{depth}.lyx')
+    with open(TEMPLATE, 'r', encoding='utf8') as file:
+        header = file.read().split('\\begin_body')[0]
+    with open(path, 'w', encoding='utf8') as file:
+        file.write(header + '\\begin_body\n\n' + items(0, depth) + '\\end_body\n\\end_document\n')
+    return path
+
+
+def nested_levels(root) -> int:
+    """
+    :return: The number of levels of the deepest list in root (a document of generate_nested(depth) has depth + 1).
+    """
+    levels, stack = 0, [(root, 0)]
+    while stack:
+        e, level = stack.pop()
+        level += e.is_category('Itemize')
+        levels = max(levels, level)
+        stack.extend((sub, level) for sub in e)
+    return levels
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    """
+    Run a function several times.
+    :return: the result of the last run, and the best time (in seconds).
+    """
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, perf_counter() - start)
+    return result, best
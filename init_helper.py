@@ -14,9 +14,11 @@ from os.path import exists, join, split
 from xml.etree.ElementTree import Element
 from shutil import copy
 from PyLyX.data.data import VERSION, CUR_FORMAT, USER_DIR, RTL_LANGS
-from PyLyX.objects.LyXobj import LyXobj
+from PyLyX.objects.LyXobj import LyXobj, walk, STOP
 from PyLyX.objects.Environment import Environment, Container
 from PyLyX.package_helper import detect_lang
+from PyLyX.objects.index import matches, contains
+from PyLyX.xhtml.pipeline import run_stages, WhitespaceStage
 
 # the first and the second lines in any LyX document.
 PREFIX = f'#LyX {VERSION} created this file. For more info see https://www.lyx.org/\n\\lyxformat {CUR_FORMAT}\n'
@@ -28,25 +30,22 @@ def rec_append(obj1: LyXobj | Environment | Container | Element, obj2: LyXobj |
     
     Finds the appropriate location in the document tree to append obj2,
     respecting nesting rules and object ranks. Tries to append to the
-    deepest valid location first.
+    deepest valid location first (the objects are tried from the last one,
+    any object after its sub-elements, without recursion).
     
     :param obj1: The parent object to append to
     :param obj2: The object to append
     :return: True if appending was successful, False otherwise
     """
-    obj1.open()
-    if len(obj1) == 0:
-        if obj2.can_be_nested_in(obj1)[0]:
-            obj1.append(obj2)
-            return True
-    else:
-        for i in range(len(obj1)-1, -1, -1):
-            if rec_append(obj1[i], obj2):
-                return True
-        if obj2.can_be_nested_in(obj1)[0]:
-            obj1.append(obj2)
-            return True
-    return False
+    def pre(obj, ancestors):
+        obj.open()
+
+    def post(obj, ancestors):
+        if obj2.is_nestable_in(obj):
+            obj.append(obj2)
+            return STOP
+
+    return walk(obj1, pre, post, reverse=True)
 
 
 def line_functions(lyx_file, func, args=()) -> bool:
@@ -123,7 +122,8 @@ def old_file_remove(output_path: str, remove_old: bool | None = None):
             remove(output_path)
 
 
-def xhtml_style(root: Environment | Element, output_path: str, css_copy: bool | None = None, info: dict | None = None):
+def xhtml_style(root: Environment | Element, output_path: str, css_copy: bool | None = None, info: dict | None = None,
+                whitespaces=True):
     """
     Apply styling and finalize XHTML output.
     
@@ -134,6 +134,7 @@ def xhtml_style(root: Environment | Element, output_path: str, css_copy: bool |
     :param output_path: Path where the XHTML file will be saved
     :param css_copy: Whether to copy CSS files (True), embed them (False), or use document setting (None)
     :param info: Document information dictionary containing styling preferences
+    :param whitespaces: Whether to fix the whitespaces (False if a WhitespaceStage already ran in convert())
     """
     if (css_copy is None and info.get('html_css_as_file') == 1) or css_copy is True:
         for e in root[0].iterfind("link[@type='text/css']"):
@@ -167,15 +168,8 @@ def xhtml_style(root: Environment | Element, output_path: str, css_copy: bool |
         else:
             print(f'image path is not found: {img_path}')
 
-    last = root
-    whitespaces = {' ', '\t', '\n'}
-    for cur in root.iter():
-        if cur.tag in {'span', 'b', 'u', 'i'}:
-            if len(cur.tail) > 1 and cur.tail[0] in whitespaces and cur.tail[1] in whitespaces:
-                cur.text = cur.text.lstrip()
-            if len(last.tail) > 1 and last.tail[-1] in whitespaces and last.tail[-2] in whitespaces:
-                last.text = last.text.rstrip()
-        last = cur
+    if whitespaces:
+        run_stages(root, [WhitespaceStage()])
 
 
 def rec_find(obj: LyXobj | Environment | Container | Element, query: str | None, command='', category='', details='')\
@@ -183,36 +177,34 @@ def rec_find(obj: LyXobj | Environment | Container | Element, query: str | None,
     """
     Recursively find an element in the document tree.
     
-    Searches for an element that either:
+    Searches for the first element (in the document order) that either:
     - Contains the query string in its text or tail
-    - Matches the specified command/category/details properties
+    - Matches the specified command/category/details properties,
+      and contains the query string in its text or tail, or in any of its sub-elements
     
     :param obj: Root object to search from
     :param query: Text to search for (or None to search by properties only)
     :param command: Filter by command attribute
-    :param category: Filter by category attribute
-    :param details: Filter by details attribute
+    :param category: Filter by category attribute (any category if empty)
+    :param details: Filter by details attribute (any details if empty)
     :return: First matching element, or None if not found
     :raises TypeError: If neither query nor object properties are specified
     """
-    if command:
-        if obj.obj_props() == (command, category, details):
-            if query is None or query in obj.text or query in obj.tail:
-                return obj
-            else:
-                for e in obj:
-                    result = rec_find(e, query, command, category, details)
-                    if result is not None:
-                        return obj
-    elif query is None:
+    if not command and query is None:
         raise TypeError('please give query or object properties.')
-    else:
-        if query in obj.text or query in obj.tail:
-            return obj
-        for e in obj:
-            result = rec_find(e, query, command, category, details)
-            if result is not None:
-                return result
+    found = []
+
+    def pre(e, ancestors):
+        if command:
+            if type(e) is not Container and matches(e.kind(), command, category, details) and (query is None or contains(e, query)):
+                found.append(e)
+                return STOP
+        elif query in e.text or query in e.tail:
+            found.append(e)
+            return STOP
+
+    walk(obj, pre)
+    return found[0] if found else None
 
 
 def rec_find_and_replace(obj, old_str, new_str, command='', category='', details=''):
@@ -230,16 +222,17 @@ def rec_find_and_replace(obj, old_str, new_str, command='', category='', details
     :param old_str: String to find
     :param new_str: String to replace with
     :param command: Only replace in elements with this command (empty string = all)
-    :param category: Only replace in elements with this category (empty string = all)
-    :param details: Only replace in elements with this details (empty string = all)
+    :param category: Only replace in elements with this category (empty string = any category)
+    :param details: Only replace in elements with this details (empty string = any details)
     """
-    if command and obj.obj_props() != (command, category, details):
-        obj.text = obj.text.replace(old_str, new_str)
-        obj.tail = obj.tail.replace(old_str, new_str)
-        for key in obj.attrib:
-            obj.attrib[key] = obj.attrib[key].replace(old_str, new_str)
-    for e in obj:
-        rec_find_and_replace(e, old_str, new_str, command, category, details)
+    def pre(e, ancestors):
+        if not command or matches(e.kind(), command, category, details):
+            e.text = e.text.replace(old_str, new_str)
+            e.tail = e.tail.replace(old_str, new_str)
+            for key in e.attrib:
+                e.set(key, e.attrib[key].replace(old_str, new_str))
+
+    walk(obj, pre)
 
 
 def export_bug_fix(before: bool):
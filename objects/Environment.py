@@ -13,8 +13,8 @@ that objects can only be placed in valid parent contexts.
 
 from copy import deepcopy
 from xml.etree.ElementTree import Element, tostring
-from PyLyX.data.data import OBJECTS, DESIGNS, PAR_SET, ENDS, DOC_SET, XML_OBJ
-from PyLyX.objects.LyXobj import LyXobj, DEFAULT_RANK, xml2txt
+from PyLyX.data.data import OBJECTS, DESIGNS, PAR_SET, XML_OBJ
+from PyLyX.objects.LyXobj import LyXobj, DEFAULT_RANK, xml2txt, mark_changed
 
 
 class Environment(LyXobj):
@@ -37,7 +37,7 @@ class Environment(LyXobj):
         if self.is_command({'backslash', 'labelwidthstring', 'column', 'features'}) or self.is_category('space'):
             self.close()
 
-    def can_be_nested_in(self, father, message=False) -> (bool, str):
+    def nesting_rule(self, father) -> (bool, str):
         msg = ''
         if type(father) not in {LyXobj, Environment, Container}:
             msg = f'invalid type: {type(father)}'
@@ -114,39 +114,8 @@ class Environment(LyXobj):
             return code + '\n'
 
         else:
-            text = ''
-            if self.is_command(DESIGNS) or self.is_command(PAR_SET) or self.is_command(DOC_SET):
-                text += f'\\{self.obj_props_str()}\n'
-            else:
-                text += f'\\begin_{self.obj_props_str()}\n'
-
-            if 'options' in self.get_dict():
-                text += perform_options(self)
-
-            if self.text:
-                text += self.text + '\n'
-
-            deeper = ''
-            for i in range(len(self)):
-                if self.is_command('layout') and self[i].is_command('layout') and not deeper:
-                    text += '\\end_layout\n\n\\begin_deeper\n'
-                    deeper = '\\end_deeper\n'
-                text += self[i].obj2lyx()
-            text += deeper
-
-            if self.command() in DESIGNS:
-                magic_word = ENDS.get(self.command(), 'default')
-                if magic_word:
-                    text += f'\\{self.command()} {magic_word}\n'
-            elif not (self.command() in PAR_SET or self.command() in DOC_SET or deeper) or self.is_command('index'):
-                text += f'\\end_{self.command()}\n'
-
-            if self.tail:
-                text += self.tail
-
-            text = xml2txt(text)
-            text = text if text.endswith('\n\n') else text + '\n'
-            return text
+            from PyLyX.objects.writer import lyx_code
+            return lyx_code(self)
 
     def is_section_title(self):
         return 0 <= self.rank() <= 6
@@ -166,7 +135,7 @@ class Container(LyXobj):
         if not is_open:
             self.close()
 
-    def can_be_nested_in(self, father, message=False) -> (bool, str):
+    def nesting_rule(self, father) -> (bool, str):
         if type(father) not in {LyXobj, Environment, Container}:
             msg = f'invalid type: {type(father)}'
             result = False
@@ -186,11 +155,8 @@ class Container(LyXobj):
         return result, msg
 
     def obj2lyx(self, is_not_last=True):
-        text = ''
-        for e in self:
-            text += e.obj2lyx()
-        text = xml2txt(text)
-        return text
+        from PyLyX.objects.writer import lyx_code
+        return lyx_code(self)
 
     def clear(self, save_attrib=False, save_text=False, save_tail=False):
         title = self[0]
@@ -199,7 +165,8 @@ class Container(LyXobj):
         tail = self.tail if save_tail else ''
         Element.clear(self)
         self.text, self.tail, self.attrib = text, tail, attrib
-        self.append(title)
+        Element.append(self, title)  # the title is kept even if the Container is closed.
+        mark_changed(self, True)
 
 
 QUOTED = {'name', 'reference', 'position', 'hor_pos', 'has_inner_box', 'inner_pos', 'use_parbox', 'use_makebox', 'width', 'special', 'height',
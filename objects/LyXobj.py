@@ -12,11 +12,18 @@ All LyX document elements are instances of LyXobj or its subclasses
 (Environment, Container).
 """
 
+from array import array
 from copy import deepcopy
+from weakref import ref
 from xml.etree.ElementTree import Element
-from PyLyX.data.data import OBJECTS
+from PyLyX.objects.registry import intern_kind, NESTING
 
 DEFAULT_RANK = 100
+TRACKED = {'text', 'tail', 'attrib'}  # attributes whose changes are tracked.
+CHANGES = 0  # a global clock of changes: it is increased by any change of any LyX object.
+STRUCTURES = 0  # a global clock of structure changes: it is increased by any change of any sub-elements list.
+WATCHERS = []  # weak references to objects with an "ids" set and invalidate(), which are told about structure changes.
+SKIP, STOP = 'skip', 'stop'  # return values of walk() callbacks: skip the sub-elements of an object, or stop walking.
 
 
 class LyXobj(Element):
@@ -38,6 +45,7 @@ class LyXobj(Element):
         :param rank: Rank of the element, element with low rank can not be sub-element of higher one.
         """
         super().__init__(tag)
+        self.__changed = 0
         self.text = str(text)
         self.tail = str(tail)
         if type(attrib) is dict:
@@ -45,14 +53,11 @@ class LyXobj(Element):
         elif attrib is not None:
             print('attrib must be a dictionary.')
 
-        self.__command = str(command)
-        self.__category = str(category)
-        self.__details = str(details)
-        self.__rank = int(rank)
+        self.__kind = intern_kind(str(command), str(category), str(details), int(rank))
         self.__is_open = bool(is_open)
 
-        if command + category + details:
-            self.set('class', self.obj_props_str())
+        if self.__kind.string:
+            self.set('class', self.__kind.string)
 
     def can_be_nested_in(self, father) -> (bool, str):
         """
@@ -60,33 +65,61 @@ class LyXobj(Element):
         :param father: An element for be nested in.
         :return: Boolean value and message for explaining.
         """
+        if self.is_nestable_in(father):
+            return True, 'ok'
+        return self.nesting_rule(father)
+
+    def is_nestable_in(self, father) -> bool:
+        """
+        Check if self can be sub-element of father, by the NESTING table (see registry.py):
+        the rule is computed by nesting_rule() once for any combination of classes, kinds and father's emptiness.
+        :param father: An element for be nested in.
+        """
+        if not isinstance(father, LyXobj) or not father.__is_open:
+            return False
+        key = (type(self), self.__kind.id, type(father), father.__kind.id, not len(father))
+        result = NESTING.get(key)
+        if result is None:
+            result = NESTING[key] = self.nesting_rule(father)[0]
+        return result
+
+    def nesting_rule(self, father) -> (bool, str):
+        """
+        The nesting rule of LyX objects: can self be sub-element of father?
+        :param father: An element for be nested in.
+        :return: Boolean value and message for explaining.
+        """
         from PyLyX.objects.Environment import Environment, Container
         if type(father) in {LyXobj, Environment, Container}:
             if not father.is_open():
                 msg = f'{father} is closed.'
                 result = False
-            elif self.__rank >= father.__rank or self.__rank == -DEFAULT_RANK:
+            elif self.__kind.rank >= father.__kind.rank or self.__kind.rank == -DEFAULT_RANK:
                 msg = ''
                 result = True
             else:
-                msg = f'rank {self.__rank} vs rank {father.__rank}'
+                msg = f'rank {self.__kind.rank} vs rank {father.__kind.rank}'
                 result = False
         else:
             msg = f'invalid type: {type(father)}'
             result = False
         return result, msg
 
+    def __setattr__(self, name, value):
+        if name in TRACKED:
+            mark_changed(self)
+        super().__setattr__(name, value)
+
     def append(self, obj):
         """
         Append obj as the last sub-element of self.
         """
-        from PyLyX.objects.Environment import Environment, Container
-        if type(obj) in {LyXobj, Environment, Container}:
-            result, msg = obj.can_be_nested_in(self)
-            if result:
+        if isinstance(obj, LyXobj):
+            if obj.is_nestable_in(self):
                 Element.append(self, obj)
+                mark_changed(self, True)
             else:
-                raise Exception(msg)
+                raise Exception(obj.nesting_rule(self)[1])
         else:
             raise TypeError(f'invalid {self.NAME}: {obj}.')
 
@@ -101,19 +134,55 @@ class LyXobj(Element):
         """
         Insert obj as sub-element of self in given index.
         """
-        from PyLyX.objects.Environment import Environment, Container
-        if type(obj) in (LyXobj, Environment, Container):
-            result, msg = obj.can_be_nested_in(self)
-            if result:
+        from PyLyX.objects.Environment import Container
+        if isinstance(obj, LyXobj):
+            if obj.is_nestable_in(self):
                 if index != 0 or not type(self) is Container:
                     Element.insert(self, index, obj)
+                    mark_changed(self, True)
                 else:
                     raise Exception(f'can not change Container title.')
             else:
-                raise Exception(msg)
+                raise Exception(obj.nesting_rule(self)[1])
         else:
             raise TypeError(f'invalid {self.NAME}: {obj}.')
 
+    def remove(self, obj):
+        """
+        Remove the sub-element obj.
+        """
+        Element.remove(self, obj)
+        mark_changed(self, True)
+
+    def __setitem__(self, index, obj):
+        Element.__setitem__(self, index, obj)
+        mark_changed(self, True)
+
+    def __delitem__(self, index):
+        Element.__delitem__(self, index)
+        mark_changed(self, True)
+
+    def set(self, key, value):
+        """
+        Set the element's attribute key to value.
+        """
+        Element.set(self, key, value)
+        mark_changed(self)
+
+    def walk(self, pre=None, post=None, reverse=False) -> bool:
+        """
+        Traverse the element and its sub-elements without recursion (see walk()).
+        :return: True if the traversal was stopped, False else.
+        """
+        return walk(self, pre, post, reverse)
+
+    def changed(self) -> int:
+        """
+        :return: The time of the last change of the element (text, tail, attributes or sub-elements list),
+                 by the global clock of changes_count(). Direct changes of the attrib dictionary are not tracked.
+        """
+        return self.__changed
+
     def __str__(self):
         string = self.obj_props_str('-')
         if not string:
@@ -131,6 +200,7 @@ class LyXobj(Element):
         text = self.text if save_text else ''
         tail = self.tail if save_tail else ''
         Element.clear(self)
+        mark_changed(self, True)
         self.text, self.tail, self.attrib = text, tail, attrib
 
 
@@ -138,15 +208,8 @@ class LyXobj(Element):
         """
         :return: The LyX code of the element (include its sub-elements).
         """
-        code = f'\\{self.obj_props_str()}\n'
-        if self.text:
-            code += self.text + '\n'
-        for e in self:
-            code += e.obj2lyx()
-        if self.tail:
-            code += self.tail + '\n'
-        code = xml2txt(code)
-        return code
+        from PyLyX.objects.writer import lyx_code
+        return lyx_code(self)
 
 
     def open(self):
@@ -165,31 +228,31 @@ class LyXobj(Element):
         """
         :return: The element's command.
         """
-        return self.__command
+        return self.__kind.command
 
     def category(self) -> str:
         """
         :return: The element's category.
         """
-        return self.__category
+        return self.__kind.category
 
     def details(self) -> str:
         """
         :return: The element's details.
         """
-        return self.__details
+        return self.__kind.details
 
     def obj_props(self):
         """
         :return: Tuple of element's command, category and details.
         """
-        return self.__command, self.__category, self.__details
+        return self.__kind.command, self.__kind.category, self.__kind.details
 
     def rank(self) -> int:
         """
         :return: The element's rank.
         """
-        return self.__rank
+        return self.__kind.rank
 
     def is_open(self) -> bool:
         """
@@ -209,7 +272,7 @@ class LyXobj(Element):
         """
         if type(commands) is str:
             commands = commands.split()
-        return self.__command in commands
+        return self.__kind.command in commands
     
     def is_category(self, categories) -> bool:
         """
@@ -217,7 +280,7 @@ class LyXobj(Element):
         """
         if type(categories) is str:
             categories = categories.split()
-        return self.__category in categories
+        return self.__kind.category in categories
 
     def is_details(self, details) -> bool:
         """
@@ -225,34 +288,40 @@ class LyXobj(Element):
         """
         if type(details) is str:
             details = details.split()
-        return self.__details in details
+        return self.__kind.details in details
 
     def obj_props_str(self, sep=' '):
         """
         :return: The element's properties (command, category and details), separated by a given separator.
         """
+        if sep == ' ':
+            return self.__kind.string
         props = list(self.obj_props())
         while props and not props[-1]:  # Ignore the details and the category if they are empty.
             props.pop()
         return sep.join(props)
 
+    def kind(self):
+        """
+        :return: The interned Kind record of the element (see registry.py).
+        """
+        return self.__kind
+
     def get_dict(self):
         """
-        :return: 
+        :return: The element's entry in the OBJECTS dictionary (empty dictionary if there is no such entry).
         """
-        if self.is_in():
-            details = '*****' if self.__details not in OBJECTS[self.__command][self.__category] else self.__details
-            return OBJECTS[self.__command][self.__category][details]
-        else:
-            return {}
+        return self.__kind.entry
 
     def is_in(self, dictionary=None):
-        dictionary = OBJECTS if dictionary is None else dictionary
-        if self.__command in dictionary:
-            if self.__category in dictionary[self.__command]:
-                if self.__details in dictionary[self.__command][self.__category]:
+        if dictionary is None:
+            return self.__kind.known
+        command, category, details = self.obj_props()
+        if command in dictionary:
+            if category in dictionary[command]:
+                if details in dictionary[command][category]:
                     return True
-                elif '*****' in dictionary[self.__command][self.__category]:
+                elif '*****' in dictionary[command][category]:
                     return True
 
         return False
@@ -266,11 +335,214 @@ class LyXobj(Element):
         else:
             return LyXobj(self.tag, self.command(), self.category(), self.details(), self.text, self.tail, self.attrib, self.is_open(), self.rank())
 
+    def __reduce__(self):
+        # the whole subtree is pickled as flat arrays, see pack().
+        return unpack, pack(self)
+
+    def __deepcopy__(self, memo):
+        return unpack(*pack(self))
+
+    def __copy__(self):
+        obj = unpack(*pack(self, False))
+        Element.extend(obj, self)
+        return obj
+
+
+def walk(root: Element, pre=None, post=None, reverse=False, ancestors: list | None = None) -> bool:
+    """
+    Traverse a tree in the document order, by a stack (so deep trees cost no recursion).
+    Any callback gets an object and the list of its ancestors (from root; the list is changed during the traversal).
+    :param root: the tree's root (any Element).
+    :param pre: function which is called before the sub-elements of an object; it may return SKIP or STOP.
+    :param post: function which is called after the sub-elements of an object (also if they were skipped);
+                 it may return STOP.
+    :param reverse: traverse the sub-elements of any object from the last one.
+    :param ancestors: the ancestors of root, when a subtree is traversed as a part of a bigger tree
+                      (the list is restored at the end of the traversal, unless it was stopped).
+    :return: True if the traversal was stopped, False else.
+    """
+    ancestors = [] if ancestors is None else ancestors
+    stack = [(root, False)]  # (object, are its sub-elements done)
+    while stack:
+        obj, done = stack.pop()
+        if done:
+            ancestors.pop()
+        else:
+            action = pre(obj, ancestors) if pre is not None else None
+            if action == STOP:
+                return True
+            elif action != SKIP and len(obj):
+                stack.append((obj, True))
+                stack.extend((e, False) for e in (obj if reverse else reversed(obj)))
+                ancestors.append(obj)
+                continue
+        if post is not None and post(obj, ancestors) == STOP:
+            return True
+    return False
+
+
+def mark_changed(obj: LyXobj, structure=False):
+    """
+    Mark an object as changed now.
+    :param structure: was the list of the object's sub-elements changed?
+    """
+    global CHANGES, STRUCTURES
+    CHANGES += 1
+    if structure:
+        STRUCTURES += 1
+        key = id(obj)
+        for reference in WATCHERS:
+            watcher = reference()
+            if watcher is not None and key in watcher.ids:
+                for watcher in [r() for r in WATCHERS]:  # invalidate() changes WATCHERS.
+                    if watcher is not None and key in watcher.ids:
+                        watcher.invalidate()
+                break
+    obj.__dict__['_LyXobj__changed'] = CHANGES
+
+
+def changes_count() -> int:
+    """
+    :return: The number of changes of LyX objects so far; objects which were changed after it have a greater changed().
+    """
+    return CHANGES
+
+
+def watch(watcher):
+    """
+    Call watcher.invalidate() at the next change of the sub-elements list of any object whose id is in watcher.ids
+    (for example, an index of one tree, which is not invalidated by changes of other trees).
+    The watcher is kept by a weak reference, until it is invalidated or unwatch() is called.
+    """
+    if all(r() is not watcher for r in WATCHERS):
+        WATCHERS.append(ref(watcher, forget))
+
+
+def unwatch(watcher):
+    WATCHERS[:] = [r for r in WATCHERS if r() is not watcher]
+
+
+def forget(reference: ref):
+    """
+    Remove a reference to a watcher which was deleted.
+    """
+    if reference in WATCHERS:
+        WATCHERS.remove(reference)
+
+
+def structure_count() -> int:
+    """
+    :return: The number of changes of sub-elements lists of LyX objects so far
+             (if it was not changed, any LyX tree has the same objects as before).
+    """
+    return STRUCTURES
+
+
+def pack(root: Element, sub_elements=True) -> tuple:
+    """
+    Serialize a tree into flat arrays, for pickling and copying.
+    :param root: The root of the tree.
+    :param sub_elements: Do you want to serialize the sub-elements of the root? (if False, the root only)
+    :return: Tuple of (kinds, kind ids, is_open flags, texts, tails, children numbers, attribs), in document order.
+             kinds is a tuple of the distinct (class, tag, command, category, details, rank),
+             and attribs has the attributes of the elements whose attributes are not the default ones.
+    """
+    kinds, indexes, classes = [], {}, []
+    ids, counts, flags = array('I'), array('I'), bytearray()
+    texts, tails, attribs = [], [], {}
+    for i, e in enumerate(root.iter() if sub_elements else (root,)):
+        if isinstance(e, LyXobj):
+            kind = e.__dict__['_LyXobj__kind']
+            key = (type(e), e.tag, kind.id)
+            flags.append(e.__dict__['_LyXobj__is_open'])
+        else:
+            kind = None
+            key = (type(e), e.tag)
+            flags.append(False)
+        kind_id = indexes.get(key)
+        if kind_id is None:  # the registry's ids are not saved, since they are different in other processes.
+            kind_id = indexes[key] = len(kinds)
+            if kind is None:
+                kinds.append(key)
+                classes.append({})
+            else:
+                kinds.append((type(e), e.tag, kind.command, kind.category, kind.details, kind.rank))
+                classes.append({'class': kind.string} if kind.string else {})
+        ids.append(kind_id)
+        texts.append(e.text)
+        tails.append(e.tail)
+        counts.append(len(e) if sub_elements else 0)
+        if e.attrib != classes[kind_id]:
+            attribs[i] = e.attrib
+    return tuple(kinds), ids, bytes(flags), texts, tails, counts, attribs
+
+
+def unpack(kinds: tuple, ids, flags: bytes, texts: list, tails: list, counts, attribs: dict):
+    """
+    Rebuild a tree from the arrays of pack(), without validating it again.
+    :return: The root of the tree.
+    """
+    states, classes = [], []
+    for kind in kinds:
+        if len(kind) > 2:
+            kind = intern_kind(*kind[2:])
+            states.append({'_LyXobj__changed': 0, '_LyXobj__kind': kind})
+            classes.append({'class': kind.string} if kind.string else {})
+        else:
+            states.append(None)
+            classes.append({})
+
+    root = None
+    stack = []  # items of [element, number of missing children]
+    for i, kind_id in enumerate(ids):
+        cls, tag = kinds[kind_id][:2]
+        obj = cls.__new__(cls)
+        Element.__init__(obj, tag, attribs[i] if i in attribs else classes[kind_id])  # the attributes are copied.
+        state = states[kind_id]
+        if state is not None:
+            obj.__dict__.update(state)
+            obj.__dict__['_LyXobj__is_open'] = bool(flags[i])
+        obj.text, obj.tail = texts[i], tails[i]
+        if stack:
+            parent = stack[-1]
+            Element.append(parent[0], obj)
+            parent[1] -= 1
+            if not parent[1]:
+                stack.pop()
+        else:
+            root = obj
+        if counts[i]:
+            stack.append([obj, counts[i]])
+    return root
+
+
+def shallow_copy(obj: LyXobj, tag: str, attrib: dict, text='') -> LyXobj:
+    """
+    Create an open object of the same class and kind as obj, with its tail, without validating it again
+    (as copy() does, but without sub-elements; a Container gets the title of obj, as copy() gives it).
+    :param tag: the tag of the new object.
+    :param attrib: the attributes of the new object (the dictionary is not copied).
+    :param text: the text of the new object.
+    :return: The new object.
+    """
+    from PyLyX.objects.Environment import Container
+    cls = type(obj)
+    new_obj = cls.__new__(cls)
+    Element.__init__(new_obj, tag)
+    new_obj.__dict__.update({'_LyXobj__changed': 0, '_LyXobj__kind': obj.__dict__['_LyXobj__kind'],
+                             '_LyXobj__is_open': True})
+    new_obj.text, new_obj.tail, new_obj.attrib = text, obj.tail, attrib
+    if cls is Container:
+        Element.append(new_obj, obj[0])
+    return new_obj
+
 
 def xml2txt(text: str):
     """
     Convert XML syntax to plain text.
     """
+    if ';' not in text:  # there is nothing to convert.
+        return text
     dictionary = {'quot;': '"', 'amp;': '&', 'apos;': "'", 'lt;': '<', 'gt;': '>'}
     for key in dictionary:
         text = text.replace('&' + key, dictionary[key])
@@ -0,0 +1,294 @@
+"""
+Content-addressed store of LyX files' backups.
+
+This module provides:
+- backup(): Save the current version of a file in the store
+- versions(): The saved versions of a file
+- restore(): Write a saved version of a file
+
+Files are split into chunks of whole units (the header and the top-level layouts, see incremental.scan_units()),
+and any chunk is saved once, compressed, in a file named by its hash. A chunk ends after a unit whose hash
+matches GROUP, so the bounds depend on the content only, and a change of a layout changes only its own chunk.
+A version is the list of its chunks' hashes, saved as the changes from the former version,
+so saving a version costs only the chunks which were changed since any older version.
+The manifest of a file lists its versions until the last keyframe (a version with its full list); any later version
+is appended to the file's journal as its own file, and the manifest is written again only at keyframes.
+Several processes may share the store: files are written to unique temporary files and moved into place,
+and the manifest and the journal of a file are changed under its lock.
+"""
+
+from os import makedirs, replace, remove, scandir, stat, getpid, open as os_open, close as os_close, O_CREAT, O_EXCL, O_WRONLY
+from os.path import join, exists, abspath, split, splitext
+from contextlib import contextmanager
+from uuid import uuid4
+from time import sleep
+from hashlib import sha256
+from json import load as json_load, dumps
+from difflib import SequenceMatcher
+from time import time
+from zlib import compress, decompress
+from PyLyX.data.data import BACKUP_DIR
+from PyLyX.objects.incremental import scan_units
+
+STORE_DIR = join(BACKUP_DIR, 'pylyx_store')
+CHUNKS = 'chunks'
+MANIFESTS = 'manifests'
+GROUP = 16  # the average number of units in a chunk.
+MAX_CHUNK = 2**16  # the maximal size of a chunk (in characters), unless a unit is longer.
+KEYFRAME = 32  # the maximal number of versions which are saved as changes, before a version with its full list.
+LOCK_TIMEOUT = 60  # seconds; an older lock was left by a process which crashed, and it is removed.
+
+
+def split_chunks(data: bytes) -> list:
+    """
+    Split the content of a LyX file into chunks: before the header, the header, groups of top-level layouts,
+    and after the body.
+    :return: List of bytes, whose concatenation is data.
+    """
+    try:
+        code = data.decode('utf8')
+    except UnicodeDecodeError:
+        return [data]
+    units = scan_units(code)
+    if not units or any(end is None for _, end, _ in units):
+        return [data]
+
+    bounds = [0, units[0][0], units[0][1]]
+    for start, end, _ in units[1:]:
+        if end - bounds[-1] > MAX_CHUNK and start > bounds[-1]:
+            bounds.append(start)
+        if sha256(code[start:end].encode('utf8')).digest()[0] % GROUP == 0:
+            bounds.append(end)
+    bounds.append(units[-1][1])
+    bounds.append(len(code))
+    bounds = sorted(set(bounds))
+    return [code[bounds[i]:bounds[i + 1]].encode('utf8') for i in range(len(bounds) - 1)]
+
+
+def chunk_path(digest: str, store=STORE_DIR) -> str:
+    return join(store, CHUNKS, digest[:2], digest)
+
+
+def manifest_path(full_path: str, store=STORE_DIR) -> str:
+    """
+    :return: The path of the manifest of a LyX file, which lists its versions.
+    """
+    full_path = abspath(full_path)
+    name = splitext(split(full_path)[1])[0]
+    return join(store, MANIFESTS, f'{name}-{sha256(full_path.encode()).hexdigest()[:12]}.json')
+
+
+def journal_path(full_path: str, store=STORE_DIR) -> str:
+    """
+    :return: The folder of the versions of a LyX file which were saved after its manifest.
+    """
+    return splitext(manifest_path(full_path, store))[0]
+
+
+def discard(path: str):
+    try:
+        remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def write_atomic(path: str, data: bytes):
+    """
+    Write a file by a unique temporary file, which is moved into place.
+    """
+    makedirs(split(path)[0], exist_ok=True)
+    temp = f'{path}.{getpid()}-{uuid4().hex}_'
+    try:
+        with open(temp, 'xb') as file:
+            file.write(data)
+        replace(temp, path)
+    except OSError:
+        discard(temp)
+        raise
+
+
+def write_chunk(path: str, chunk: bytes):
+    """
+    Write a chunk, unless it exists (chunks are named by their content, so a chunk which another process wrote is done).
+    """
+    if exists(path):
+        return
+    try:
+        write_atomic(path, compress(chunk))
+    except OSError:  # e.g. on Windows, while another process moves the same chunk into place.
+        if not exists(path):
+            raise
+
+
+@contextmanager
+def locked(full_path: str, store=STORE_DIR):
+    """
+    Hold the lock of the manifest of a LyX file (a lock file, which is created exclusively).
+    """
+    path = manifest_path(full_path, store) + '.lock'
+    makedirs(split(path)[0], exist_ok=True)
+    while True:
+        try:
+            os_close(os_open(path, O_CREAT | O_EXCL | O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time() - stat(path).st_mtime > LOCK_TIMEOUT:
+                    discard(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            sleep(0.01)
+    try:
+        yield
+    finally:
+        discard(path)
+
+
+def read_manifest(full_path: str, store=STORE_DIR) -> list:
+    history = []
+    path = manifest_path(full_path, store)
+    if exists(path):
+        with open(path, 'r', encoding='utf8') as file:
+            history = json_load(file)['versions']
+    folder = journal_path(full_path, store)
+    if exists(folder):
+        paths = {}
+        for entry in scandir(folder):
+            name = entry.name
+            if name.endswith('.json') and name[:-5].isdigit():
+                paths[int(name[:-5])] = entry.path
+        while len(history) in paths:  # older files of the journal may be left, if a process crashed.
+            with open(paths[len(history)], 'r', encoding='utf8') as file:
+                history.append(json_load(file))
+    return history
+
+
+def load_manifest(full_path: str, store=STORE_DIR) -> list:
+    """
+    :return: The versions of a LyX file (in its manifest and its journal), as they are saved.
+    """
+    for _ in range(9):
+        try:
+            return read_manifest(full_path, store)
+        except FileNotFoundError:  # the journal was merged into the manifest by another process meanwhile.
+            continue
+    return read_manifest(full_path, store)
+
+
+def version_chunks(history: list, index: int) -> list:
+    """
+    :param history: the versions in a manifest.
+    :param index: a version's index.
+    :return: The hashes of the version's chunks.
+    """
+    chain = []
+    while 'chunks' not in history[index]:
+        chain.append(history[index])
+        index = history[index]['base']
+    digests = list(history[index]['chunks'])
+    for entry in reversed(chain):
+        for i1, i2, new in reversed(entry['edits']):
+            digests[i1:i2] = new
+    return digests
+
+
+def chain_length(history: list, index: int) -> int:
+    length = 0
+    while 'chunks' not in history[index]:
+        index = history[index]['base']
+        length += 1
+    return length
+
+
+def versions(full_path: str, store=STORE_DIR) -> list:
+    """
+    :param full_path: path of a LyX file.
+    :param store: the store's directory.
+    :return: List of the saved versions of the file, from the oldest;
+             any version is a dictionary with its time and size.
+    """
+    return [{'time': entry['time'], 'size': entry['size']} for entry in load_manifest(full_path, store)]
+
+
+def backup(full_path: str, store=STORE_DIR) -> int:
+    """
+    Save the current version of a LyX file in the store.
+    If the file was not changed since its last version, no version is added.
+    :param full_path: path of a LyX file.
+    :param store: the store's directory.
+    :return: The number of the file's last version (its index in versions()).
+    """
+    with open(full_path, 'rb') as file:
+        data = file.read()
+    digests = []
+    for chunk in split_chunks(data):
+        digest = sha256(chunk).hexdigest()
+        write_chunk(chunk_path(digest, store), chunk)
+        digests.append(digest)
+
+    with locked(full_path, store):
+        return add_version(full_path, digests, len(data), store)
+
+
+def add_version(full_path: str, digests: list, size: int, store=STORE_DIR) -> int:
+    """
+    Add a version to the manifest of a LyX file (under its lock), unless it is the same as the last version.
+    A keyframe is written with the whole history to the manifest, and then the journal is removed;
+    any other version is written to the journal only.
+    :return: The number of the file's last version.
+    """
+    history = read_manifest(full_path, store)
+    entry = {'time': time(), 'size': size}
+    if history:
+        last = len(history) - 1
+        old = version_chunks(history, last)
+        if old == digests:
+            return last
+        if chain_length(history, last) < KEYFRAME:
+            matcher = SequenceMatcher(None, old, digests, autojunk=False)
+            entry['base'] = last
+            entry['edits'] = [[i1, i2, digests[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+    index = len(history)
+    folder = journal_path(full_path, store)
+    if 'base' in entry:
+        write_atomic(join(folder, f'{index}.json'), dumps(entry, ensure_ascii=False).encode('utf8'))
+        return index
+    entry['chunks'] = digests
+    history.append(entry)
+    manifest = {'path': abspath(full_path), 'versions': history}
+    write_atomic(manifest_path(full_path, store), dumps(manifest, ensure_ascii=False).encode('utf8'))
+    if exists(folder):
+        for e in scandir(folder):
+            discard(e.path)
+    return index
+
+
+def restore(full_path: str, version=-1, output_path='', store=STORE_DIR) -> str:
+    """
+    Write a saved version of a LyX file.
+    If the version is written over the file itself, the file's current version is saved first (after the version's
+    number was found), so the restore may be undone.
+    :param full_path: path of the LyX file, as it was saved.
+    :param version: the version's number (negative numbers are from the end, -1 is the last version).
+    :param output_path: where to write the version (default: over the file itself).
+    :param store: the store's directory.
+    :return: The path of the written file.
+    """
+    history = load_manifest(full_path, store)
+    if not history:
+        raise FileNotFoundError(f'there are no backups of {full_path}.')
+    parts = []
+    for digest in version_chunks(history, range(len(history))[version]):
+        with open(chunk_path(digest, store), 'rb') as file:
+            chunk = decompress(file.read())
+        if sha256(chunk).hexdigest() != digest:
+            raise Exception(f'chunk {digest} of {full_path} is broken.')
+        parts.append(chunk)
+    data = b''.join(parts)
+
+    output_path = output_path if output_path else full_path
+    if abspath(output_path) == abspath(full_path) and exists(full_path):
+        backup(full_path, store)
+    write_atomic(output_path, data)
+    return output_path
@@ -0,0 +1,139 @@
+"""
+Bulk building of LyX documents.
+
+This module provides:
+- DocumentBuilder: Append objects at a cursor, without checking the nesting rules in any append
+- validate(): Check the nesting rules of a whole tree in one pass, with the paths of the invalid objects
+- node_path(): The path of an object in a tree, for error messages
+
+LyXobj.append() checks any object it appends, and LyX.append() searches the whole document for the place of
+any object (so n appends cost O(n²)). A DocumentBuilder appends in O(1), and checks the finished tree once.
+"""
+
+from xml.etree.ElementTree import Element
+from PyLyX.objects.LyXobj import LyXobj, mark_changed
+from PyLyX.objects.Environment import Environment, Container
+
+MAX_ERRORS = 20  # the maximal number of errors in the message of build().
+
+
+def node_path(entry: tuple) -> str:
+    """
+    :param entry: (object, index, father's entry) of an object in a tree (the root's entry is (root, None, None)).
+    :return: The path of the object, like "document/body[1]/layout Section[3]/layout Standard[2]".
+    """
+    parts = []
+    while entry is not None:
+        obj, index, entry = entry
+        name = obj.obj_props_str() if isinstance(obj, LyXobj) and obj.obj_props_str() else obj.tag
+        parts.append(name if index is None else f'{name}[{index}]')
+    return '/'.join(reversed(parts))
+
+
+def validate(root: LyXobj) -> list:
+    """
+    Check that any object in a tree can be nested in its father, in one pass over the tree.
+    Closed objects are checked as open ones, and the titles of Containers are not checked,
+    since they are checked when the Containers are created.
+    :param root: the tree's root.
+    :return: List of (path, message) of the invalid objects (empty list if the tree is valid).
+    """
+    errors = []
+    stack = [(root, None, None)]
+    while stack:
+        entry = stack.pop()
+        father = entry[0]
+        is_open = father.is_open()
+        father.open()
+        valid = []
+        for i, e in enumerate(father):
+            if not isinstance(e, LyXobj):
+                errors.append(((e, i, entry), f'invalid {LyXobj.NAME}: {e}.'))
+            elif (i or type(father) is not Container) and not e.is_nestable_in(father):
+                errors.append(((e, i, entry), e.nesting_rule(father)[1]))
+            else:
+                valid.append((e, i, entry))
+        stack.extend(reversed(valid))
+        if not is_open:
+            father.close()
+    return [(node_path(entry), msg) for entry, msg in errors]
+
+
+class DocumentBuilder:
+    """
+    A cursor for appending objects to a tree, in the document order.
+    """
+    def __init__(self, root: LyXobj):
+        """
+        :param root: the tree's root, where the cursor starts (for example, the body of a document).
+        """
+        if not isinstance(root, LyXobj):
+            raise TypeError(f'invalid {LyXobj.NAME}: {root}.')
+        self.__root = root
+        self.__cursor = [root]
+
+    def cursor(self) -> LyXobj:
+        """
+        :return: The object where the objects are appended.
+        """
+        return self.__cursor[-1]
+
+    def append(self, obj: LyXobj | Environment | Container):
+        """
+        Append obj as the last sub-element of the cursor, without checking the nesting rules.
+        :return: obj.
+        """
+        if not isinstance(obj, LyXobj):
+            raise TypeError(f'invalid {LyXobj.NAME}: {obj}.')
+        Element.append(self.__cursor[-1], obj)
+        mark_changed(self.__cursor[-1], True)
+        return obj
+
+    def extend(self, objs):
+        """
+        Append each of elements in objs as the last sub-elements of the cursor.
+        """
+        for obj in objs:
+            self.append(obj)
+
+    def begin(self, obj: LyXobj | Environment | Container):
+        """
+        Append obj, and move the cursor into it.
+        :return: obj.
+        """
+        self.append(obj)
+        self.__cursor.append(obj)
+        return obj
+
+    def end(self):
+        """
+        Move the cursor to the father of its object.
+        """
+        if len(self.__cursor) == 1:
+            raise Exception(f'the cursor is in the root {self.__root}.')
+        self.__cursor.pop()
+
+    def section(self, title: Environment) -> Container:
+        """
+        Begin a section: the cursor is moved out of the sections of the same or a lower level,
+        and into a new Container of the title.
+        :param title: a layout of a section title (Part, Chapter, Section, etc.).
+        :return: The new Container.
+        """
+        container = Container(title)
+        while len(self.__cursor) > 1 and type(self.__cursor[-1]) is Container and self.__cursor[-1].rank() >= container.rank():
+            self.__cursor.pop()
+        return self.begin(container)
+
+    def build(self) -> LyXobj:
+        """
+        Check the whole tree once.
+        :return: The tree's root.
+        """
+        errors = validate(self.__root)
+        if errors:
+            lines = [f'{path}: {msg}' for path, msg in errors[:MAX_ERRORS]]
+            if len(errors) > MAX_ERRORS:
+                lines.append(f'and {len(errors) - MAX_ERRORS} more errors.')
+            raise Exception(f'{len(errors)} invalid objects in {self.__root}:\n' + '\n'.join(lines))
+        return self.__root
@@ -0,0 +1,172 @@
+"""
+Persistent cache of parsed LyX documents.
+
+This module provides an opt-in on-disk cache for the loader:
+- enable_cache() / disable_cache(): turn the cache on and off
+- cached_load(): load a LyX file through the cache
+
+Trees are pickled by the compact protocol of LyXobj (flat arrays, see LyXobj.pack()).
+
+Entries are keyed by the file's path, modification time and content hash,
+and by the version of the data/objects/*.json schema, so any change of
+these invalidates them. The cache folder is bounded by size, and the
+least recently used entries are evicted first.
+Several processes may share the cache folder: entries are written to unique temporary files and moved into place,
+and an entry which another process removed (or replaced) meanwhile is a cache miss.
+"""
+
+from os import scandir, remove, replace, utime, stat, makedirs, fdopen
+from os.path import join, abspath
+from hashlib import sha256
+from pickle import dump, load as pickle_load, HIGHEST_PROTOCOL, UnpicklingError
+from tempfile import gettempdir, mkstemp
+from PyLyX.data.data import PACKAGE_PATH
+from PyLyX.objects.loader import load
+
+CACHE_VERSION = 2  # increase when the format of the entries is changed.
+EXTENSION = '.pickle'
+DEFAULT_FOLDER = join(gettempdir(), 'pylyx_cache')
+DEFAULT_SIZE = 256 * 2**20
+
+CACHE_DIR = None  # None means the cache is disabled.
+MAX_SIZE = DEFAULT_SIZE
+SCHEMA = ''
+
+
+def enable_cache(folder=DEFAULT_FOLDER, max_size=DEFAULT_SIZE):
+    """
+    Turn on the cache; LyX objects load their documents through it.
+    Entries of older schema versions are removed.
+    :param folder: the cache directory.
+    :param max_size: maximal total size of the entries, in bytes.
+    """
+    global CACHE_DIR, MAX_SIZE, SCHEMA
+    makedirs(folder, exist_ok=True)
+    CACHE_DIR, MAX_SIZE, SCHEMA = folder, int(max_size), schema_version()
+    for entry in scandir(CACHE_DIR):
+        if entry.name.endswith(EXTENSION) and not entry.name.startswith(SCHEMA):
+            discard(entry.path)
+    evict()
+
+
+def disable_cache():
+    """
+    Turn off the cache (its entries are kept).
+    """
+    global CACHE_DIR
+    CACHE_DIR = None
+
+
+def schema_version() -> str:
+    """
+    :return: A short hash of the cache format and the data/objects/*.json files.
+    """
+    digest = sha256(str(CACHE_VERSION).encode())
+    folder = join(PACKAGE_PATH, 'data', 'objects')
+    for entry in sorted(scandir(folder), key=lambda e: e.name):
+        if entry.name.endswith('.json'):
+            digest.update(entry.name.encode())
+            with open(entry.path, 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+
+def entry_path(full_path: str) -> str:
+    """
+    :return: The path of the cache entry of a LyX file, in its current version.
+    """
+    full_path = abspath(full_path)
+    with open(full_path, 'rb') as file:
+        content = sha256(file.read()).hexdigest()
+    key = sha256(f'{full_path}\n{stat(full_path).st_mtime_ns}\n{content}'.encode()).hexdigest()
+    return join(CACHE_DIR, f'{SCHEMA}-{key}{EXTENSION}')
+
+
+def cached_load(full_path: str):
+    """
+    Load a LyX file, from the cache if possible.
+    If the cache is disabled, it is the same as loader.load().
+    :param full_path: Path to the .lyx file to load
+    :return: Root Environment object containing the complete document structure
+    """
+    if CACHE_DIR is None:
+        return load(full_path)
+
+    path = entry_path(full_path)
+    root = read_entry(path)
+    if root is not None:
+        return root
+
+    root = load(full_path)
+    if store(path, root):
+        evict()
+    return root
+
+
+def read_entry(path: str):
+    """
+    :return: The object of a cache entry, or None if there is no such entry (a cache miss).
+             An invalid entry is removed.
+    """
+    try:
+        with open(path, 'rb') as file:
+            obj = pickle_load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, UnpicklingError, ValueError, TypeError, IndexError) as e:
+        print(f'invalid cache entry {path}, error message is: "{e}"')
+        discard(path)
+        return None
+    try:
+        utime(path)  # the entry becomes the most recently used.
+    except OSError:
+        pass  # another process removed or replaced the entry.
+    return obj
+
+
+def store(path: str, obj) -> bool:
+    """
+    Write a cache entry by a unique temporary file, which is moved into place,
+    so processes which write the same entry do not collide.
+    :return: True if the entry was written, False else (the entry is a cache miss).
+    """
+    descriptor, temp = mkstemp(dir=CACHE_DIR)
+    try:
+        with fdopen(descriptor, 'wb') as file:
+            dump(obj, file, HIGHEST_PROTOCOL)
+        replace(temp, path)
+    except OSError:  # e.g. on Windows, while another process reads the entry.
+        discard(temp)
+        return False
+    return True
+
+
+def discard(path: str):
+    """
+    Remove a file, if another process did not remove it.
+    """
+    try:
+        remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict():
+    """
+    Remove the least recently used entries, until the cache is not larger than its maximal size.
+    """
+    entries = []
+    for entry in scandir(CACHE_DIR):
+        if entry.name.endswith(EXTENSION):
+            try:
+                info = entry.stat()
+            except FileNotFoundError:  # evicted by another process.
+                continue
+            entries.append((info.st_mtime, info.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= MAX_SIZE:
+            break
+        discard(path)
+        total -= size
+
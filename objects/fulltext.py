@@ -0,0 +1,155 @@
+"""
+Full-text index of LyX documents.
+
+This module provides:
+- TextIndex: An inverted index from the trigrams (3 characters substrings) of objects' texts and tails to the objects
+- trigrams(): The trigrams of a string
+
+Trigrams need no tokenization, so they are the same for any language (Hebrew words with prefixes included),
+and any substring of 3 characters or more is found by intersecting the sets of its trigrams;
+the candidates are then checked, so the results are the same as the results of a substring search.
+The index is updated incrementally: only the objects which were changed (by LyXobj.changed()) are indexed again,
+and the tree is walked again only after a change of its structure (by LyXobj.structure_count()).
+"""
+
+from PyLyX.objects.LyXobj import LyXobj, changes_count, structure_count
+from PyLyX.objects.builder import node_path
+
+GRAM = 3
+
+
+def trigrams(text: str) -> set:
+    """
+    :return: Set of the substrings of text in length GRAM.
+    """
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class TextIndex:
+    """
+    An inverted index of the texts and the tails of the objects in a LyX tree.
+    """
+    def __init__(self, root: LyXobj):
+        """
+        :param root: the tree's root (for example, the body of a document).
+        """
+        self.__root = root
+        self.__grams = {}  # trigram -> set of ids of objects
+        self.__nodes = {}  # id -> object
+        self.__texts = {}  # id -> (text, tail), as they were indexed.
+        self.__positions = {}  # id -> the object's order in root.iter()
+        self.__order = []  # the ids in the document order.
+        self.__parents = {}  # id -> (father, index)
+        self.__time = self.__structure = None
+        self.update()
+
+    def root(self) -> LyXobj:
+        return self.__root
+
+    def __add(self, key: int, obj: LyXobj):
+        text, tail = obj.text or '', obj.tail or ''
+        self.__texts[key] = text, tail
+        grams = self.__grams
+        for gram in trigrams(text) | trigrams(tail):
+            if gram in grams:
+                grams[gram].add(key)
+            else:
+                grams[gram] = {key}
+
+    def __remove(self, key: int):
+        text, tail = self.__texts.pop(key)
+        grams = self.__grams
+        for gram in trigrams(text) | trigrams(tail):
+            keys = grams[gram]
+            keys.discard(key)
+            if not keys:
+                del grams[gram]
+
+    def __walk(self):
+        """
+        Walk the tree again after a change of its structure: index the new objects and the changed ones,
+        and remove the removed ones.
+        """
+        nodes, positions, parents, order = {}, {}, {}, []
+        stack = [self.__root]
+        while stack:
+            father = stack.pop()
+            key = id(father)
+            nodes[key] = father
+            positions[key] = len(order)
+            order.append(key)
+            if key not in self.__nodes:
+                self.__add(key, father)
+            elif self.__time is not None and father.changed() > self.__time:
+                self.__remove(key)
+                self.__add(key, father)
+            for i, e in enumerate(father):
+                parents[id(e)] = father, i
+            stack.extend(reversed(father))
+        for key in self.__nodes.keys() - nodes.keys():
+            self.__remove(key)
+        self.__nodes, self.__positions, self.__parents, self.__order = nodes, positions, parents, order
+
+    def update(self, *objs: LyXobj):
+        """
+        Index the changes of the tree since the last update.
+        :param objs: the changed objects, if they are known (and the structure of the tree was not changed),
+                     else the tree is checked for changed objects.
+        """
+        if self.__structure != structure_count():
+            self.__walk()
+        elif objs:
+            for obj in objs:
+                if id(obj) in self.__nodes:
+                    self.__remove(id(obj))
+                    self.__add(id(obj), obj)
+        elif self.__time != changes_count():
+            for key, obj in self.__nodes.items():
+                if obj.changed() > self.__time:
+                    self.__remove(key)
+                    self.__add(key, obj)
+        self.__time, self.__structure = changes_count(), structure_count()
+
+    def search(self, query: str) -> list:
+        """
+        :param query: query for search.
+        :return: List of the objects which have query in their text or tail, in the document order.
+        """
+        if not query:
+            return []
+        self.update()
+        texts = self.__texts
+        if len(query) < GRAM:  # a short query has no trigrams, so all the objects are checked.
+            keys = [key for key in self.__order if query in texts[key][0] or query in texts[key][1]]
+        else:
+            sets = sorted((self.__grams.get(gram, set()) for gram in trigrams(query)), key=len)
+            keys = [key for key in sets[0].intersection(*sets[1:]) if query in texts[key][0] or query in texts[key][1]]
+            keys.sort(key=self.__positions.__getitem__)
+        return [self.__nodes[key] for key in keys]
+
+    def find(self, query: str):
+        """
+        :return: The first object which has query in its text or tail (None if there is no such object).
+        """
+        results = self.search(query)
+        return results[0] if results else None
+
+    def path(self, obj: LyXobj) -> str:
+        """
+        :return: The path of an indexed object, like "body/layout Section[3]/layout Standard[2]" (see builder.node_path()).
+        """
+        chain = []
+        while id(obj) in self.__parents:
+            father, index = self.__parents[id(obj)]
+            chain.append((obj, index))
+            obj = father
+        entry = (obj, None, None)
+        for obj, index in reversed(chain):
+            entry = (obj, index, entry)
+        return node_path(entry)
+
+    def search_paths(self, query: str) -> list:
+        """
+        :return: List of (path, object) of the objects which have query in their text or tail, in the document order.
+        """
+        return [(self.path(obj), obj) for obj in self.search(query)]
@@ -0,0 +1,148 @@
+"""
+Incremental saving of LyX documents.
+
+This module provides:
+- document_units(): The units of a document: its header, and the top-level layouts of its body
+- changed_units(): Which units were changed after a given time (by the clock of LyXobj.changes_count())
+- attributes(): A snapshot of the attributes of a unit, for finding attributes which were changed directly
+- scan_units(): The character ranges of the units in a LyX file
+- splice(): The code of a document, made by replacing the changed units in the code of its file
+
+Containers (sections) have no code of their own, so the top-level layouts are the layouts
+which are sub-elements of the body or of a Container (section titles included).
+Changes of the attrib dictionaries (like obj.attrib[key] = value) are not counted by the clock,
+so they are found by comparing the units' attributes with their snapshots.
+"""
+
+from re import compile, MULTILINE
+from PyLyX.objects.LyXobj import LyXobj
+from PyLyX.objects.Environment import Container
+from PyLyX.objects.writer import lyx_code
+
+# the lines which scan_units() needs: beginnings and ends of the header, the body, insets, \begin_deeper blocks,
+# and beginnings of layouts (with their names).
+LINES = compile(r'^\\(begin_header|begin_body|end_body|begin_inset|end_inset|begin_deeper|end_deeper|begin_layout) ?(.*)$', MULTILINE)
+
+
+def document_units(root: LyXobj) -> list:
+    """
+    :param root: a LyX document.
+    :return: List of the header and the top-level layouts of the body, in the document order.
+    """
+    units = [root[0]]
+    stack = list(reversed(root[1]))
+    while stack:
+        e = stack.pop()
+        if type(e) is Container:
+            stack.extend(reversed(e))
+        else:
+            units.append(e)
+    return units
+
+
+def is_changed(obj: LyXobj, time: int) -> bool:
+    """
+    :return: Was obj or any of its sub-elements changed after the given time?
+    """
+    for e in obj.iter():
+        if not isinstance(e, LyXobj) or e.changed() > time:
+            return True
+    return False
+
+
+def attributes(obj: LyXobj) -> tuple:
+    """
+    :return: The attributes of obj and its sub-elements, in the document order.
+    """
+    return tuple(e.items() for e in obj.iter())
+
+
+def changed_units(root: LyXobj, units: list, time: int, snapshots: list | None = None) -> list | None:
+    """
+    :param root: a LyX document.
+    :param units: the document's units at the given time.
+    :param time: a time by the clock of changes_count().
+    :param snapshots: the attributes of the units at the given time (see attributes()).
+    :return: Indexes of the units which were changed after the given time,
+             or None if the structure of the document was changed (so the units are not the same).
+    """
+    for e in (root, root[1]):
+        if e.changed() > time:
+            return None
+    stack = list(root[1])
+    while stack:
+        e = stack.pop()
+        if type(e) is Container:
+            if e.changed() > time:
+                return None
+            stack.extend(e)
+
+    current = document_units(root)
+    if len(current) != len(units) or any(a is not b for a, b in zip(current, units)):
+        return None
+    return [i for i, unit in enumerate(units)
+            if is_changed(unit, time) or (snapshots is not None and attributes(unit) != snapshots[i])]
+
+
+def scan_units(code: str) -> list:
+    """
+    Scan the code of a LyX file for its units.
+    :param code: The content of a LyX file.
+    :return: List of (start, end, props) of the units (props is None for the header, else like "layout Standard"),
+             in the document order.
+    """
+    units = []
+    insets = deeper = 0
+    in_body = False
+    for match in LINES.finditer(code):
+        line, offset = match.group(1), match.start()
+        if line == 'begin_header':
+            units.append([offset, None, None])
+        elif line == 'begin_body' and units:
+            units[-1][1] = offset
+            in_body = True
+        elif not in_body:
+            pass
+        elif line == 'begin_inset':
+            insets += 1
+        elif line == 'end_inset':
+            insets -= 1
+        elif line == 'begin_deeper':
+            deeper += 1
+        elif line == 'end_deeper':
+            deeper -= 1
+        elif line == 'end_body':
+            if len(units) > 1:
+                units[-1][1] = offset
+            in_body = False
+        elif not insets and not deeper:  # \begin_layout
+            if len(units) > 1:  # the header is ended by \begin_body.
+                units[-1][1] = offset
+            units.append([offset, None, 'layout ' + match.group(2)])
+    return [tuple(unit) for unit in units]
+
+
+def splice(code: str, units: list, indexes: list) -> str | None:
+    """
+    Replace the changed units in the code of a LyX file.
+    :param code: The content of the LyX file, as it was when the units were loaded.
+    :param units: the units of the document, as document_units() returns.
+    :param indexes: indexes of the changed units.
+    :return: The new content, or None if the units of the file do not match the units of the document.
+    """
+    ranges = scan_units(code)
+    if len(ranges) != len(units) or any(end is None for _, end, _ in ranges):
+        return None
+    for unit, (_, _, props) in zip(units[1:], ranges[1:]):
+        if not isinstance(unit, LyXobj) or unit.obj_props_str() != props:
+            return None
+
+    parts = []
+    position = 0
+    for i in indexes:
+        start, end, _ = ranges[i]
+        parts.append(code[position:start])
+        parts.append(lyx_code(units[i]))
+        position = end
+    parts.append(code[position:])
+    return ''.join(parts)
@@ -0,0 +1,126 @@
+"""
+Index of LyX documents by the kinds of their objects.
+
+This module provides:
+- KindIndex: The objects of a document by their interned kinds (see registry.py), and its sections
+- matches(): The filter of LyX.find() by command, category and details
+
+The index is built in the first query, and it is valid while the structure of its own tree is not changed
+(it is told about changes of the sub-elements lists of its objects, see LyXobj.watch()); after such a change
+it is built again in the next query, so invalidating it costs nothing.
+Changes of texts and attributes, and changes of other trees, do not invalidate it.
+"""
+
+from heapq import merge
+from PyLyX.objects.LyXobj import LyXobj, watch, unwatch
+from PyLyX.objects.Environment import Container
+from PyLyX.objects.registry import KINDS, Kind
+
+
+def matches(kind: Kind, command: str, category='', details='') -> bool:
+    """
+    :return: Does a kind match the given command, category (if given) and details (if given)?
+    """
+    return kind.command == command and (not category or kind.category == category) and (not details or kind.details == details)
+
+
+def contains(obj: LyXobj, query: str) -> bool:
+    """
+    :return: Is query in the text or the tail of obj, or in any of its sub-elements?
+    """
+    if query in obj.tail:
+        return True
+    for e in obj.iter():
+        if query in e.text or (e is not obj and query in e.tail):
+            return True
+    return False
+
+
+class KindIndex:
+    """
+    The objects of a LyX tree by their kinds, in the document order.
+    """
+    def __init__(self, root: LyXobj):
+        """
+        :param root: the tree's root (for example, a whole document).
+        """
+        self.__root = root
+        self.__nodes = {}  # kind id -> list of (position, object), where position is the object's order in root.iter().
+        self.__sections = []
+        self.ids = set()  # the ids of the objects of the tree, while the index is valid.
+        self.__valid = False
+
+    def root(self) -> LyXobj:
+        return self.__root
+
+    def is_valid(self) -> bool:
+        """
+        :return: Is the index up to date (no sub-elements list of the tree was changed since it was built)?
+        """
+        return self.__valid
+
+    def invalidate(self):
+        """
+        Build the index again in the next query.
+        """
+        self.__valid = False
+        self.ids = set()
+        unwatch(self)
+
+    def __update(self):
+        if self.__valid:
+            return
+        nodes, sections, ids = {}, [], set()
+        for position, e in enumerate(self.__root.iter()):
+            ids.add(id(e))
+            if isinstance(e, LyXobj):
+                key = e.kind().id
+                if key in nodes:
+                    nodes[key].append((position, e))
+                else:
+                    nodes[key] = [(position, e)]
+                if type(e) is Container:
+                    sections.append(e)
+        self.__nodes, self.__sections, self.ids = nodes, sections, ids
+        self.__valid = True
+        watch(self)
+
+    def __entries(self, command: str, category='', details=''):
+        self.__update()
+        lists = [self.__nodes[key] for key in self.__nodes if matches(KINDS[key], command, category, details)]
+        return lists[0] if len(lists) == 1 else merge(*lists, key=lambda entry: entry[0])
+
+    def find_all(self, command: str, category='', details='') -> list:
+        """
+        :param command: the objects' command.
+        :param category: the objects' category (any category if it is empty).
+        :param details: the objects' details (any details if it is empty).
+        :return: List of the objects of the given kind, in the document order (include Containers of sections).
+        """
+        return [e for _, e in self.__entries(command, category, details)]
+
+    def count(self, command: str, category='', details='') -> int:
+        """
+        :return: The number of the objects of the given kind.
+        """
+        self.__update()
+        return sum(len(self.__nodes[key]) for key in self.__nodes if matches(KINDS[key], command, category, details))
+
+    def find(self, query: str | None, command: str, category='', details=''):
+        """
+        :param query: query for search in the objects' texts (None for any object).
+        :return: The first object of the given kind (except Containers) which has query in its text or tail,
+                 or in any of its sub-elements (None if there is no such object).
+        """
+        for _, e in self.__entries(command, category, details):
+            if type(e) is not Container and (query is None or contains(e, query)):
+                return e
+        return None
+
+    def sections(self, category='') -> list:
+        """
+        :param category: the sections' category, like "Section" (all the sections if it is empty).
+        :return: List of the Containers of sections, in the document order.
+        """
+        self.__update()
+        return [e for e in self.__sections if not category or e.category() == category]
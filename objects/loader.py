@@ -7,6 +7,7 @@ tree of Environment, Container, and LyXobj instances that represent the document
 
 Main functions:
 - load(): Parse a complete LyX file into a document tree
+- iterload(): Parse a LyX file incrementally, yielding start/end events
 - one_line(): Process a single line during parsing
 - extract_cmd(): Extract command, category, and details from a line
 - order_object(): Add objects to the document tree respecting hierarchy rules
@@ -18,28 +19,60 @@ from PyLyX.data.data import ENDS, OBJECTS, DESIGNS, XML_OBJ
 from PyLyX.objects.LyXobj import LyXobj
 from PyLyX.objects.Environment import Environment, Container
 
+# kinds of lines, see tokenize().
+TEXT, OPTION, BEGIN, END, DESIGN_END, XML, XML_END = 'text', 'option', 'begin', 'end', 'design_end', 'xml', 'xml_end'
+COMMANDS = {BEGIN, END, DESIGN_END, XML, XML_END}
+BODY_ENDS = {END, DESIGN_END, XML_END}  # in the header, only END lines end objects.
+END_LINES = {f'\\{design} {ENDS[design]}\n' for design in ENDS}
+OPTIONS = {option for command in OBJECTS.values() for category in command.values() for details in category.values()
+           for option in details.get('options', ())}
+RAW_CATEGORIES = {'Formula', 'FormulaMacro'}  # their lines are kept as is, until their end.
+TOKENS = {}
+MAX_TOKENS = 4096
+
 
 ############################################### MAIN ###############################################
-def one_line(file, line: str, branch: list, unknowns=None, path=None):
+def one_line(file, line: str, branch: list, unknowns=None, path=None, deepers=None, buffer=None):
+    """
+    Process a single line of a LyX file.
+    :param file: The open LyX file.
+    :param line: The current line.
+    :param branch: The open objects, from the root (or from the layout of the current \\begin_deeper block) to the last one.
+    :param unknowns: Dictionary for collecting the unknown objects.
+    :param path: The path of the LyX file, for completing relative paths.
+    :param deepers: Stack of the outer branches of the open \\begin_deeper blocks.
+    :param buffer: Text buffer for collecting the lines of the last object's text (or tail), see add_text().
+                   If it is None, any line is added to the text immediately.
+    """
     unknowns = {} if type(unknowns) is not dict else unknowns
+    deepers = [] if deepers is None else deepers
+    if deepers and line == '\\end_deeper\n':
+        perform_end_deeper(branch, deepers)
+        return
+
+    kind, command, category, details, text = tokenize(line)
+    if len(branch) > 1 and branch[1].command() == 'header':
+        end = kind == END
+    else:
+        end = kind in BODY_ENDS
+
     last = branch[-1]
-    if (last.is_category('Formula') or last.is_category('FormulaMacro') or last.is_command('preamble')) \
-            and last.is_open() and not is_end(line, branch):
-        last.text += line
+    if (last.category() in RAW_CATEGORIES or last.command() == 'preamble') and last.is_open() and not end:
+        add_text(buffer, last, line)
 
-    elif line.startswith('\\') or xml_command(line):
-        command, category, details, text = extract_cmd(line)
-        if is_end(line, branch):
+    elif kind in COMMANDS:
+        if end:
+            flush_text(buffer)
             perform_end(branch, command)
         elif command == 'deeper':
-            perform_deeper(file, last, unknowns, path)
+            perform_deeper(branch, deepers)
         else:
             perform_new_obj(branch, unknowns, command, category, details, text, line)
 
     elif last.is_open():
-       perform_text(last, line, path)
+       perform_text(last, line, path, kind, buffer)
     else:
-        last.tail += line[:-1]
+        add_text(buffer, last, line[:-1], True)
 
 
 
@@ -54,31 +87,148 @@ def load(full_path: str):
     :return: Root Environment object containing the complete document structure
     """
     with open(full_path, 'r', encoding='utf8') as file:
-        line = file.readline()
+        root = start_load(file)
+        branch = [root]
+        unknowns = {}
+        deepers = []
+        buffer = []
+        for line in file:
+            one_line(file, line, branch, unknowns, full_path, deepers, buffer)
+        flush_text(buffer)
 
-        while not line.startswith('\\lyxformat'):
-            line = file.readline()
-        fmt = line.split()[1]
+        if unknowns:
+            print('unknown objects:', unknowns)
+
+    return root
 
-        while line != f'\\begin_document\n':
-            line = file.readline()
-        cmd = extract_cmd(line)
-        root = Environment(*cmd)
-        root.set('lyxformat', fmt)
 
+def iterload(full_path: str, events=('end',)):
+    """
+    Parse a LyX document file incrementally, like xml.etree.ElementTree.iterparse.
+
+    Yields ("start", obj) when obj is added to the document tree, and ("end", obj) when obj is complete,
+    i.e. no more sub-elements, text or tail will be added to it. The caller may clear() a completed object
+    for keeping the memory bounded, since the loader does not touch it again.
+
+    :param full_path: Path to the .lyx file to load
+    :param events: The events to report, "start" and/or "end"
+    :return: Generator of (event, obj) tuples; the last one is ("end", root)
+    """
+    report_start, report_end = 'start' in events, 'end' in events
+    with open(full_path, 'r', encoding='utf8') as file:
+        root = start_load(file)
         branch = [root]
+        if report_start:
+            yield 'start', root
+
         unknowns = {}
+        deepers = []
+        buffer = []
+        old = branch.copy()
         for line in file:
-            one_line(file, line, branch, unknowns, full_path)
+            depth = len(deepers)
+            one_line(file, line, branch, unknowns, full_path, deepers, buffer)
+            if len(deepers) > depth:  # a \\begin_deeper block was begun, its first object is the last one.
+                old = branch.copy()
+                continue
+            elif len(deepers) < depth:  # the objects of the ended block are complete.
+                if report_end:
+                    flush_text(buffer)
+                    for obj in reversed(old[1:]):
+                        yield 'end', obj
+                old = branch.copy()
+                continue
+            elif branch[-1] is old[-1] and len(branch) == len(old):
+                continue  # any pushed object is a new one, so the branch was not changed.
+
+            flush_text(buffer)
+            i = 0
+            while i < len(old) and i < len(branch) and old[i] is branch[i]:
+                i += 1
+            if report_end:
+                for obj in reversed(old[i:]):
+                    yield 'end', obj
+            if report_start:
+                for obj in branch[i:]:
+                    yield 'start', obj
+            old = branch.copy()
+
+        flush_text(buffer)
+        if report_end:
+            for obj in reversed(branch):
+                yield 'end', obj
+            for outer in reversed(deepers):  # only in a broken file, which ends inside a \\begin_deeper block.
+                for obj in reversed(outer[:-1]):
+                    yield 'end', obj
 
         if unknowns:
             print('unknown objects:', unknowns)
 
+
+############################################### HELPERS ###############################################
+def start_load(file):
+    """
+    Read the beginning of a LyX file, until the "\\begin_document" line.
+    :param file: An open LyX file.
+    :return: The root Environment of the document, with its format version.
+    """
+    line = file.readline()
+
+    while not line.startswith('\\lyxformat'):
+        line = file.readline()
+    fmt = line.split()[1]
+
+    while line != f'\\begin_document\n':
+        line = file.readline()
+    cmd = extract_cmd(line)
+    root = Environment(*cmd)
+    root.set('lyxformat', fmt)
     return root
 
 
-############################################### HELPERS ###############################################
+def tokenize(line: str):
+    """
+    Classify a line of a LyX file, and extract its fields.
+    The tokens of command lines are cached, since most of them (like "\\end_layout") repeat many times.
+    :param line: A line of a LyX file.
+    :return: Tuple of the line's kind (TEXT, OPTION, BEGIN, END, DESIGN_END, XML or XML_END),
+             and its command, category, details and text (empty strings if the line is not a command).
+    """
+    token = TOKENS.get(line)
+    if token is not None:
+        return token
+
+    if line.startswith('\\'):
+        if line.startswith('\\end_'):
+            kind = END
+        elif line.endswith('default\n') or line in END_LINES:
+            kind = DESIGN_END
+        else:
+            kind = BEGIN
+    elif line.startswith('<') and xml_command(line):
+        if line.startswith('</') and line.split('>')[0][2:] in XML_OBJ:
+            kind = XML_END
+        else:
+            kind = XML
+    else:
+        words = line.split(None, 1)
+        return (OPTION if words and words[0] in OPTIONS else TEXT), '', '', '', ''
+
+    token = kind, *extract_cmd(line)
+    if len(TOKENS) >= MAX_TOKENS:
+        TOKENS.clear()
+    TOKENS[line] = token
+    return token
+
+
 def start_extract_cmd(line: str):
+    words = line.split(None, 3)[:3]
+    for word in words[1:]:
+        if word[0] in '"1234567890-':  # quoted and numeric words may contain spaces.
+            break
+    else:
+        return words + [''] * (3 - len(words))
+
     cmd = line.split()
     new_cmd = []
     i = 0
@@ -132,16 +282,16 @@ def extract_cmd(line: str):
 
 
 def order_object(branch: list, obj):
-    copy_branch = branch.copy()
-    copy_branch = [str(_) + f' is open: {_.is_open()}' for _ in copy_branch]
+    closed = []
     while branch:
-        if obj.can_be_nested_in(branch[-1])[0]:
+        if obj.is_nestable_in(branch[-1]):
             break
         else:
+            closed.append(f'{branch[-1]} is open: {branch[-1].is_open()}')
             branch[-1].close()
             branch.pop()
     if not branch:
-        raise Exception(f'an error occurred when ordering object {obj} in branch: {copy_branch}.')
+        raise Exception(f'an error occurred when ordering object {obj} in branch: {closed[::-1]}.')
 
     if len(branch) > 2 and branch[2].is_command('index'):
         branch[2].append(obj)
@@ -203,22 +353,6 @@ def perform_new_obj(branch: list, unknowns: dict, command: str, category: str, d
         order_object(branch, obj)
 
 
-def is_end(line: str, branch: list) -> bool:
-    if len(branch) > 1 and branch[1].is_command('header'):
-        return line.startswith('\\end_')
-    elif line.startswith('\\'):
-        if line.endswith('default\n'):
-            return True
-        for design in ENDS:
-            if line == f'\\{design} {ENDS[design]}\n':
-                return True
-        return line.startswith('\\end_')
-    elif line.startswith('</'):
-        return line.split('>')[0][2:] in XML_OBJ
-
-    return False
-
-
 def perform_end(branch: list, command: str):
     for i in range(-1, -len(branch)-1, -1):
         if branch[i].is_command(command):
@@ -241,15 +375,23 @@ def perform_end(branch: list, command: str):
             break
 
 
-def perform_deeper(file, last, unknowns: dict, path: str):
+def perform_deeper(branch: list, deepers: list):
+    """
+    Begin a \\begin_deeper block: its objects are nested in the last object, which becomes the only one in the branch.
+    The outer branch is saved in the deepers stack, so nesting costs no recursion.
+    """
+    last = branch[-1]
     last.open()
-    branch = [last]
-    for line in file:
-        if line == '\\end_deeper\n':
-            break
-        else:
-            one_line(file, line, branch, unknowns, path)
-    last.close()
+    deepers.append(branch.copy())
+    branch[:] = [last]
+
+
+def perform_end_deeper(branch: list, deepers: list):
+    """
+    End the current \\begin_deeper block, and restore the outer branch.
+    """
+    branch[0].close()
+    branch[:] = deepers.pop()
 
 
 def perform_options(obj: Environment, first: str, second: str, path=None):
@@ -268,12 +410,12 @@ def perform_options(obj: Environment, first: str, second: str, path=None):
         return False
 
 
-def perform_text(last, line: str, path: str):
-    dictionary = last.get_dict()
+def perform_text(last, line: str, path: str, kind=OPTION, buffer=None):
     result = False
-    if 'options' in dictionary:
-        options = dictionary['options']
-        if line.split() and line.split()[0] in options:
+    if kind == OPTION:
+        options = last.get_dict().get('options', ())
+        words = line.split()
+        if words and words[0] in options:
             lst = line.split('"')
             if len(lst) > 1:
                 for i in range(0, len(lst)//2):
@@ -283,12 +425,45 @@ def perform_text(last, line: str, path: str):
                     lst = lst[-1].split()
                     if len(lst) == 2:
                         result = perform_options(last, *lst, path) or result
-            else:
-                lst = line.split()
-                if len(lst) == 2:
-                    result = perform_options(last, *lst, path)
+            elif len(words) == 2:
+                result = perform_options(last, *words, path)
     if not result:
-        if last.is_command('modules') or last.is_command('local_layout'):
-            last.text += line
+        if last.command() in {'modules', 'local_layout'}:
+            add_text(buffer, last, line)
+        else:
+            add_text(buffer, last, line[:-1])
+
+
+def add_text(buffer, obj, text: str, tail=False):
+    """
+    Add text to the text (or the tail) of an object.
+    The fragments are collected in the buffer, and they are joined only once, when another object
+    (or the object's tail) gets text, or by flush_text(), instead of copying the whole string for any line.
+    :param buffer: [obj, tail, fragments] of the object which gets text now, or an empty list; None for no buffering.
+    :param obj: the object.
+    :param text: the new fragment.
+    :param tail: do you want to add it to the tail?
+    """
+    if buffer is None:
+        if tail:
+            obj.tail += text
+        else:
+            obj.text += text
+    elif buffer and buffer[0] is obj and buffer[1] == tail:
+        buffer[2].append(text)
+    else:
+        flush_text(buffer)
+        buffer[:] = [obj, tail, [obj.tail if tail else obj.text, text]]
+
+
+def flush_text(buffer):
+    """
+    Join the buffered fragments into the text (or the tail) of their object, and empty the buffer.
+    """
+    if buffer:
+        obj, tail, fragments = buffer
+        if tail:
+            obj.tail = ''.join(fragments)
         else:
-            last.text += line[:-1]
+            obj.text = ''.join(fragments)
+        buffer.clear()
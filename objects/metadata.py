@@ -0,0 +1,104 @@
+"""
+Fast reading of LyX documents' metadata.
+
+This module provides:
+- read_metadata(): Read the header of a LyX file (and its title), without parsing its body
+- read_metadata_many(): Read the metadata of many files, in parallel processes
+
+The metadata dictionary is the one of xhtml.helper.scan_head() (language, textclass, modules,
+secnumdepth, tocdepth, etc.), with the document's title if it has one.
+"""
+
+from os import cpu_count
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from PyLyX.objects.loader import start_load, one_line, flush_text
+from PyLyX.objects.sections import SECTION_RANKS
+from PyLyX.xhtml.helper import scan_head
+
+
+def read_metadata(full_path: str) -> dict:
+    """
+    Read the metadata of a LyX file.
+    Reading stops at the end of the header, or at the end of the first Title layout if it is before
+    any section of the body.
+    :param full_path: Path to the .lyx file
+    :return: Dictionary of document metadata, as scan_head() returns, and the 'title' key if there is a title.
+    """
+    with open(full_path, 'r', encoding='utf8') as file:
+        root = start_load(file)
+        branch = [root]
+        unknowns = {}
+        buffer = []
+        for line in file:
+            one_line(file, line, branch, unknowns, full_path, None, buffer)
+            if line == '\\end_header\n':
+                break
+        flush_text(buffer)
+        info = scan_head(root[0])
+
+        title = read_title(file)
+        if title is not None:
+            info['title'] = title
+    return info
+
+
+def read_title(file):
+    """
+    Read the title of a LyX document, from the beginning of its body.
+    :param file: An open LyX file, after the end of its header.
+    :return: The text of the first Title layout, or None if there is no title before the first section.
+    """
+    title = None
+    insets = 0
+    for line in file:
+        if line.startswith('\\begin_inset'):
+            insets += 1
+        elif line.startswith('\\end_inset'):
+            insets -= 1
+        elif insets:
+            continue
+        elif line == '\\begin_layout Title\n':
+            title = ''
+        elif title is not None:
+            if line.startswith('\\end_layout'):
+                return title.strip()
+            elif not line.startswith('\\'):
+                title += line[:-1]
+        elif line.startswith('\\begin_layout ') and line.split()[1] in SECTION_RANKS:
+            return None
+        elif line.startswith('\\end_body'):
+            return None
+    return title
+
+
+def safe_read_metadata(full_path: str):
+    """
+    :return: The metadata of a LyX file, or the exception which was raised while reading it.
+    """
+    try:
+        return read_metadata(full_path)
+    except Exception as e:
+        return e
+
+
+def read_metadata_many(paths, workers: int | None = None, report=True) -> list:
+    """
+    Read the metadata of many LyX files, in parallel processes.
+    On Windows, call it under an "if __name__ == '__main__':" guard.
+    :param paths: paths of .lyx files.
+    :param workers: number of processes (default: the number of processors).
+    :param report: do you want to print the number of files per second?
+    :return: List of metadata dictionaries in the order of paths; a file which could not be read
+             has the raised exception instead.
+    """
+    paths = list(paths)
+    workers = workers if workers else cpu_count()
+    chunk = max(1, len(paths) // (4 * workers))
+    start = perf_counter()
+    with ProcessPoolExecutor(workers) as executor:
+        results = list(executor.map(safe_read_metadata, paths, chunksize=chunk))
+    seconds = perf_counter() - start
+    if report:
+        print(f'{len(paths)} files in {seconds:.2f}s ({len(paths) / seconds:.1f} files per second)')
+    return results
@@ -0,0 +1,47 @@
+"""
+Registry of the kinds of LyX objects.
+
+Any (command, category, details, rank) combination is interned once, as a Kind record with:
+- an integer id
+- the properties string (as in the "class" attribute and the LyX syntax)
+- the entry of the kind in the OBJECTS dictionary, and its options
+
+LyX objects hold their Kind record only, so the lookups of their properties are O(1),
+and the strings are shared by all the objects of the same kind.
+
+The nesting rules (LyXobj.nesting_rule() and its overrides) depend only on the classes and the kinds of
+the objects, and on the emptiness of the father (for Containers), so their results are kept in the NESTING table,
+and checking an open father is a single lookup.
+"""
+
+from collections import namedtuple
+from PyLyX.data.data import OBJECTS
+
+Kind = namedtuple('Kind', 'id command category details rank string entry options known')
+
+KINDS = []  # the Kind records, by their ids.
+INTERNED = {}  # (command, category, details, rank) -> Kind
+NESTING = {}  # (class, kind id, father's class, father's kind id, is father empty) -> can be nested in father
+
+
+def intern_kind(command: str, category: str, details: str, rank: int) -> Kind:
+    """
+    :return: The Kind record of given properties; it is created in the first time only.
+    """
+    key = (command, category, details, rank)
+    kind = INTERNED.get(key)
+    if kind is None:
+        props = [command, category, details]
+        while props and not props[-1]:  # Ignore the details and the category if they are empty.
+            props.pop()
+        entry, known = {}, False
+        if category in OBJECTS.get(command, {}):
+            dictionary = OBJECTS[command][category]
+            if details in dictionary:
+                entry, known = dictionary[details], True
+            elif '*****' in dictionary:
+                entry, known = dictionary['*****'], True
+        kind = Kind(len(KINDS), command, category, details, rank, ' '.join(props), entry, entry.get('options', ()), known)
+        KINDS.append(kind)
+        INTERNED[key] = kind
+    return kind
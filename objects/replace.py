@@ -0,0 +1,115 @@
+"""
+Batch find and replace in LyX trees.
+
+This module provides:
+- Replacements: Many replacement patterns, compiled once
+- trie_regex(): A regular expression which matches any of given strings, built as a trie
+- replace_many(): Apply replacements to the texts, tails and attributes of a tree, in one traversal
+
+Literal patterns are compiled into one trie-shaped regular expression (an automaton in the manner of Aho-Corasick),
+so they are replaced at once: at any position the longest matching literal is replaced, and the replacements
+are not searched again. Regular expressions (re.Pattern objects) are applied after the literals, in their order.
+"""
+
+from re import compile, escape, Pattern
+from PyLyX.objects.LyXobj import LyXobj
+from PyLyX.objects.index import matches
+
+END = ''  # the key of the end of a string in a trie.
+SKIPPED = {'class'}  # attributes which are kept (the "class" attribute is the kind of the object).
+
+
+def trie_regex(strings) -> str:
+    """
+    :param strings: non-empty strings.
+    :return: Regular expression (as a string) which matches the longest of the strings, in any position.
+    """
+    trie = {}
+    for string in strings:
+        node = trie
+        for char in string:
+            node = node.setdefault(char, {})
+        node[END] = True
+
+    def node_regex(node: dict) -> str:
+        alternatives = [escape(char) + node_regex(sub) for char, sub in sorted(node.items()) if char != END]
+        if not alternatives:
+            return ''
+        elif len(alternatives) == 1 and END not in node:
+            return alternatives[0]
+        regex = '(?:' + '|'.join(alternatives) + ')'
+        return regex + '?' if END in node else regex
+
+    return node_regex(trie)
+
+
+class Replacements:
+    """
+    Replacement patterns: pairs of (old, new), where old is a string (literal) or an re.Pattern (regular expression),
+    and new is a string (a template, for a regular expression) or a function of a match object.
+    """
+    def __init__(self, patterns):
+        """
+        :param patterns: iterable of (old, new) pairs.
+        """
+        self.patterns = list(patterns)
+        self.literals = {}  # literal -> its pattern's index (the first one, if a literal is given twice).
+        self.regexes = []  # (index, pattern, new)
+        for i, (old, new) in enumerate(self.patterns):
+            if isinstance(old, Pattern):
+                self.regexes.append((i, old, new))
+            elif type(old) is str and old:
+                self.literals.setdefault(old, i)
+            else:
+                raise TypeError(f'invalid pattern: {old}.')
+        self.automaton = compile(trie_regex(self.literals)) if self.literals else None
+
+    def apply(self, text: str, counts: list) -> str:
+        """
+        :param text: text for replacing.
+        :param counts: counts of replacements by the patterns' indexes, which are increased.
+        :return: The text after the replacements.
+        """
+        if not text:
+            return text
+        if self.automaton is not None:
+            def replace(match):
+                i = self.literals[match.group()]
+                counts[i] += 1
+                return self.patterns[i][1]
+            text = self.automaton.sub(replace, text)
+        for i, pattern, new in self.regexes:
+            text, n = pattern.subn(new, text)
+            counts[i] += n
+        return text
+
+
+def replace_many(root: LyXobj, patterns, command='', category='', details='', dry_run=False) -> list:
+    """
+    Find and replace many patterns in the texts, the tails and the attributes of the objects of a tree, in one traversal.
+    Objects whose texts were not changed are not marked as changed (so an incremental save writes only the others).
+    :param root: the tree's root.
+    :param patterns: iterable of (old, new) pairs, or Replacements.
+    :param command: replace in objects of this command only (all the objects if it is empty).
+    :param category: replace in objects of this category only (any category if it is empty).
+    :param details: replace in objects of these details only (any details if they are empty).
+    :param dry_run: count the replacements without changing the tree.
+    :return: List of the numbers of replacements, by the patterns' order.
+    """
+    replacements = patterns if type(patterns) is Replacements else Replacements(patterns)
+    counts = [0] * len(replacements.patterns)
+    for e in root.iter():
+        if command and not matches(e.kind(), command, category, details):
+            continue
+        text, tail = replacements.apply(e.text, counts), replacements.apply(e.tail, counts)
+        attrib = {key: replacements.apply(value, counts) for key, value in e.attrib.items() if key not in SKIPPED}
+        if dry_run:
+            continue
+        if text != e.text:
+            e.text = text
+        if tail != e.tail:
+            e.tail = tail
+        for key, value in attrib.items():
+            if value != e.get(key):
+                e.set(key, value)
+    return counts
@@ -0,0 +1,157 @@
+"""
+Random access to the sections of large LyX documents.
+
+This module provides:
+- build_index(): Scan a LyX file for its sections (Part, Chapter, Section, etc.) and their byte offsets
+- section_index(): Get the index of a LyX file, from the index file next to it if it is up to date
+- load_section(): Parse only the header and one section of a LyX file
+
+The index is saved next to the LyX file (document.lyx -> document.sections.json),
+and it is built again whenever the size or the modification time of the file changes.
+"""
+
+from io import BytesIO, TextIOWrapper
+from json import load as json_load, dump
+from os import stat
+from os.path import splitext, exists
+from PyLyX.data.data import LAYOUTS
+from PyLyX.objects.LyXobj import DEFAULT_RANK
+from PyLyX.objects.loader import start_load, one_line, flush_text
+
+INDEX_EXTENSION = '.sections.json'
+RANKS = {category: LAYOUTS['layout'][category].get('', {}).get('rank', DEFAULT_RANK) for category in LAYOUTS['layout']}
+SECTION_RANKS = {category: rank for category, rank in RANKS.items() if 0 <= rank <= 6}
+
+
+def index_path(full_path: str) -> str:
+    """
+    :return: The path of the index file of a LyX file.
+    """
+    return splitext(full_path)[0] + INDEX_EXTENSION
+
+
+def build_index(full_path: str, save=True) -> dict:
+    """
+    Scan a LyX file for its sections.
+    Any section of the body's top level is indexed with its layout, rank, title, labels,
+    and the byte offsets of its region: from its "\\begin_layout" line, until the next section
+    with the same or lower rank (or until the body's end).
+    :param full_path: Path to the .lyx file
+    :param save: do you want to save the index next to the file?
+    :return: Dictionary with the file's size and modification time, the byte offset of the header's end,
+             and the list of the sections.
+    """
+    info = stat(full_path)
+    index = {'size': info.st_size, 'mtime': info.st_mtime_ns, 'header_end': 0, 'sections': []}
+    sections = index['sections']
+    opened = []  # sections whose regions are not ended yet.
+    heading = None  # the section whose title layout is being read.
+    insets = deeper = 0
+    in_label = False
+    offset = 0
+    with open(full_path, 'rb') as file:
+        for raw in file:
+            line = raw.decode('utf8').rstrip('\r\n')
+            if line.startswith('\\begin_inset'):
+                insets += 1
+                in_label = heading is not None and insets == 1 and line == '\\begin_inset CommandInset label'
+            elif line == '\\end_inset':
+                insets -= 1
+                in_label = False
+            elif line == '\\begin_deeper':
+                deeper += 1
+            elif line == '\\end_deeper':
+                deeper -= 1
+            elif line == '\\end_header':
+                index['header_end'] = offset + len(raw)
+            elif line == '\\end_body':
+                for section in opened:
+                    section['end'] = offset
+                opened = []
+            elif line.startswith('\\begin_layout ') and not insets and not deeper:
+                category = line.split(maxsplit=1)[1]
+                heading = None
+                if category in SECTION_RANKS:
+                    rank = SECTION_RANKS[category]
+                    while opened and opened[-1]['rank'] >= rank:
+                        opened.pop()['end'] = offset
+                    heading = {'layout': category, 'rank': rank, 'title': '', 'labels': [], 'start': offset, 'end': None}
+                    sections.append(heading)
+                    opened.append(heading)
+            elif heading is not None:
+                if line == '\\end_layout' and not insets:
+                    heading['title'] = heading['title'].strip()
+                    heading = None
+                elif in_label and line.startswith('name "'):
+                    heading['labels'].append(line[len('name "'):-1])
+                elif not insets and not line.startswith('\\'):
+                    heading['title'] += line
+            offset += len(raw)
+
+    for section in opened:
+        section['end'] = offset
+    if save:
+        with open(index_path(full_path), 'w', encoding='utf8') as file:
+            dump(index, file, ensure_ascii=False)
+    return index
+
+
+def section_index(full_path: str) -> dict:
+    """
+    Get the sections index of a LyX file. The saved index is used if it is up to date, else it is built again.
+    :param full_path: Path to the .lyx file
+    :return: The index, as returned by build_index().
+    """
+    path = index_path(full_path)
+    if exists(path):
+        with open(path, 'r', encoding='utf8') as file:
+            index = json_load(file)
+        info = stat(full_path)
+        if index.get('size') == info.st_size and index.get('mtime') == info.st_mtime_ns:
+            return index
+    return build_index(full_path)
+
+
+def find_section(index: dict, label_or_title: str) -> dict:
+    """
+    :return: The first section in the index with the given label or title.
+    """
+    for section in index['sections']:
+        if label_or_title in section['labels'] or label_or_title == section['title']:
+            return section
+    raise KeyError(f'there is no section with label or title "{label_or_title}".')
+
+
+def load_section(full_path: str, label_or_title: str):
+    """
+    Load the header and one section of a LyX file, without parsing the rest of the file.
+    :param full_path: Path to the .lyx file
+    :param label_or_title: a label in the section's title, or the section's title.
+    :return: Root Environment of a document, whose body contains the section only.
+    """
+    index = section_index(full_path)
+    section = find_section(index, label_or_title)
+    with open(full_path, 'rb') as file:
+        header = TextIOWrapper(BytesIO(file.read(index['header_end'])), encoding='utf8')
+        file.seek(section['start'])
+        region = TextIOWrapper(BytesIO(file.read(section['end'] - section['start'])), encoding='utf8')
+
+    with header:
+        root = start_load(header)
+        branch = [root]
+        unknowns = {}
+        deepers = []
+        buffer = []
+        for line in header:
+            one_line(header, line, branch, unknowns, full_path, deepers, buffer)
+    one_line(None, '\\begin_body\n', branch, unknowns, full_path, deepers, buffer)
+    with region:
+        for line in region:
+            one_line(region, line, branch, unknowns, full_path, deepers, buffer)
+    for line in ('\\end_body\n', '\\end_document\n'):
+        one_line(None, line, branch, unknowns, full_path, deepers, buffer)
+    flush_text(buffer)
+
+    if unknowns:
+        print('unknown objects:', unknowns)
+    return root
@@ -0,0 +1,172 @@
+"""
+Selectors of LyX objects.
+
+This module provides:
+- compile_selector(): Compile a selector string into a Selector (compiled selectors are cached)
+- select(): Generate the objects of a tree which match a selector, in the document order
+- select_first(): The first object which matches a selector
+
+The language of selectors:
+- command:category:details matches objects by their kind (category and details are optional), * matches any object,
+  e.g. "layout:Section", "inset:Formula", "layout:Plain:Layout"
+- [key], [key=value], [key!=value], [key*=value], [key^=value], [key$=value] match attributes
+  (values may be quoted)
+- :contains(text) matches objects with text in their text or tail, or in any of their sub-elements
+- A space between selectors matches descendants, ">" matches direct sub-elements, and "," separates alternatives,
+  e.g. "layout:Section > inset:Formula", "layout:Enumerate inset:Formula:contains(x), inset:Foot"
+
+Sections are Containers of the same kind as their titles, so "layout:Section" matches a whole section
+as well as its title. The tree is traversed once, from the root, and the objects are generated as they are found,
+so a search can be stopped after the first results.
+"""
+
+from re import compile
+from PyLyX.objects.LyXobj import LyXobj
+from PyLyX.objects.index import matches, contains
+
+TOKEN = compile(r'''\s*(?P<combinator>[>,])\s*|(?P<space>\s+)'''
+                r'''|(?P<kind>\*|[\w-]+(?::[\w-]+(?![\w(-]))*)'''
+                r'''|\[\s*(?P<key>[\w-]+)\s*(?:(?P<op>[!*^$]?=)\s*(?P<value>"[^"]*"|'[^']*'|[^\]\s]*)\s*)?\]'''
+                r'''|:contains\((?P<text>"[^"]*"|'[^']*'|[^)]*)\)''')
+OPERATORS = {'=': lambda a, b: a == b, '!=': lambda a, b: a != b, '*=': lambda a, b: b in a,
+             '^=': lambda a, b: a.startswith(b), '$=': lambda a, b: a.endswith(b)}
+SELECTORS = {}  # selector string -> Selector
+
+
+def unquote(value: str) -> str:
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+        return value[1:-1]
+    return value
+
+
+class Step:
+    """
+    One compound selector: a kind, and predicates of attributes and texts.
+    """
+    def __init__(self):
+        self.kind = None  # (command, category, details), or None for any kind.
+        self.attributes = []  # (key, operator, value), the operator is None for the existence of the key.
+        self.texts = []
+        self.child = False  # is it a direct sub-element of the previous step's object?
+        self.kinds = {}  # kind id -> does the kind match (computed once for any kind).
+
+    def match(self, obj: LyXobj) -> bool:
+        if self.kind is not None:
+            if not isinstance(obj, LyXobj):
+                return False
+            kind = obj.kind()
+            result = self.kinds.get(kind.id)
+            if result is None:
+                result = self.kinds[kind.id] = matches(kind, *self.kind)
+            if not result:
+                return False
+        for key, op, value in self.attributes:
+            attribute = obj.get(key)
+            if attribute is None or (op is not None and not OPERATORS[op](attribute, value)):
+                return False
+        for text in self.texts:
+            if not contains(obj, text):
+                return False
+        return True
+
+
+class Selector:
+    """
+    A compiled selector: alternatives, any of them is a list of steps.
+    """
+    def __init__(self, string: str):
+        self.string = string
+        string = string.strip()
+        self.alternatives = [[]]
+        step, position, child = None, 0, False
+        while position < len(string):
+            match = TOKEN.match(string, position)
+            if match is None or match.end() == position:
+                raise ValueError(f'invalid selector: {string} (at {position}).')
+            position = match.end()
+            group = next(name for name in ('combinator', 'space', 'kind', 'key', 'text') if match.group(name) is not None)
+            if group in ('combinator', 'space'):
+                if step is None:
+                    if match.group('combinator') or self.alternatives[-1]:
+                        raise ValueError(f'invalid selector: {string} (at {match.start()}).')
+                    continue
+                if match.group('combinator') == ',':
+                    self.alternatives.append([])
+                child = match.group('combinator') == '>'
+                step = None
+                continue
+            if step is None:
+                step = Step()
+                step.child = child
+                self.alternatives[-1].append(step)
+            if group == 'kind':
+                if step.kind is not None or step.attributes or step.texts:
+                    raise ValueError(f'invalid selector: {string} (at {match.start()}).')
+                if match.group('kind') != '*':
+                    props = match.group('kind').split(':')
+                    step.kind = tuple(props + [''] * (3 - len(props)))
+            elif group == 'key':
+                op = match.group('op')
+                step.attributes.append((match.group('key'), op, unquote(match.group('value')) if op else None))
+            else:
+                step.texts.append(unquote(match.group('text')))
+        if not all(self.alternatives) or step is None:
+            raise ValueError(f'invalid selector: {string}.')
+
+    def iter(self, root: LyXobj):
+        """
+        Generate the objects of a tree (root included) which match the selector, in the document order.
+        Any object carries the states of the steps which may match it: (alternative, step) pairs.
+        """
+        start = frozenset((i, 0) for i in range(len(self.alternatives)))
+        stack = [(root, start)]
+        while stack:
+            obj, states = stack.pop()
+            found = False
+            inherited = set()
+            for i, j in states:
+                steps = self.alternatives[i]
+                if not steps[j].child:
+                    inherited.add((i, j))  # the step may match deeper objects too.
+                if steps[j].match(obj):
+                    if j + 1 == len(steps):
+                        found = True
+                    else:
+                        inherited.add((i, j + 1))
+            if found:
+                yield obj
+            if len(obj):
+                inherited = frozenset(inherited)
+                stack.extend((e, inherited) for e in reversed(obj))
+
+    def first(self, root: LyXobj):
+        """
+        :return: The first object which matches the selector (None if there is no such object).
+        """
+        return next(self.iter(root), None)
+
+
+def compile_selector(selector: str) -> Selector:
+    """
+    :return: The compiled selector (it is compiled in the first time only).
+    """
+    compiled = SELECTORS.get(selector)
+    if compiled is None:
+        compiled = SELECTORS[selector] = Selector(selector)
+    return compiled
+
+
+def select(root: LyXobj, selector: str):
+    """
+    :param root: the tree's root.
+    :param selector: a selector string (see the language above).
+    :return: Generator of the objects which match the selector, in the document order.
+    """
+    return compile_selector(selector).iter(root)
+
+
+def select_first(root: LyXobj, selector: str):
+    """
+    :return: The first object which matches the selector (None if there is no such object).
+    """
+    return compile_selector(selector).first(root)
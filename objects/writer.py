@@ -0,0 +1,121 @@
+"""
+Streaming serializer of LyX objects.
+
+This module provides:
+- write_lyx(): Write the LyX code of an object (and its sub-elements) into an open text file
+- lyx_code(): The LyX code of an object, as a string (LyXobj.obj2lyx() uses it)
+
+The tree is traversed once, without recursion, and xml2txt() is applied once per text fragment,
+instead of building a string for any element and converting it again in any nesting level.
+Tabular (XML) objects are still written by Environment.obj2lyx(), since their tags are fixed over their whole code.
+"""
+
+from io import StringIO
+from PyLyX.data.data import DESIGNS, PAR_SET, ENDS, DOC_SET, XML_OBJ
+from PyLyX.objects.LyXobj import LyXobj, xml2txt
+from PyLyX.objects.Environment import Environment, Container, perform_options
+
+
+class LyXWriter:
+    """
+    A text file for writing LyX code, which remembers the last two characters written to it.
+    """
+    def __init__(self, file):
+        """
+        :param file: an open text file (or any io.TextIOBase).
+        """
+        self.file = file
+        self.end = ''
+
+    def write(self, text: str):
+        if text:
+            self.file.write(text)
+            self.end = text[-2:] if len(text) > 1 else self.end[-1:] + text
+
+    def ends_with_empty_line(self) -> bool:
+        return self.end == '\n\n'
+
+
+def write_lyx(obj: LyXobj | Environment | Container, file):
+    """
+    Write the LyX code of an object, as obj.obj2lyx() returns it, into a file.
+    :param obj: the object.
+    :param file: an open text file (or any io.TextIOBase).
+    """
+    writer = LyXWriter(file)
+    stack = [obj]  # objects for writing, strings for writing as is, and tuples of (object, deeper) for ending.
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            writer.write(item)
+        elif type(item) is tuple:
+            end_environment(writer, *item)
+        else:
+            method = type(item).obj2lyx
+            if method is Environment.obj2lyx and not item.is_command(XML_OBJ):
+                stack.extend(begin_environment(writer, item))
+            elif method is Container.obj2lyx:
+                stack.extend(reversed(item))
+            elif method is LyXobj.obj2lyx:
+                writer.write(xml2txt(f'\\{item.obj_props_str()}\n'))
+                if item.text:
+                    writer.write(xml2txt(item.text) + '\n')
+                stack.append(xml2txt(item.tail) + '\n' if item.tail else '')
+                stack.extend(reversed(item))
+            else:  # tabular objects, and subclasses with their own obj2lyx().
+                writer.write(item.obj2lyx())
+
+
+def begin_environment(writer: LyXWriter, obj: Environment) -> list:
+    """
+    Write the beginning of an Environment.
+    :return: The stack items for the rest of it, in reversed order.
+    """
+    command = obj.command()
+    if command in DESIGNS or command in PAR_SET or command in DOC_SET:
+        writer.write(xml2txt(f'\\{obj.obj_props_str()}\n'))
+    else:
+        writer.write(xml2txt(f'\\begin_{obj.obj_props_str()}\n'))
+    if 'options' in obj.get_dict():
+        writer.write(xml2txt(perform_options(obj)))
+    if obj.text:
+        writer.write(xml2txt(obj.text) + '\n')
+
+    items = []
+    deeper = False
+    for e in obj:
+        if command == 'layout' and not deeper and e.is_command('layout'):
+            items.append('\\end_layout\n\n\\begin_deeper\n')
+            deeper = True
+        items.append(e)
+    items.append((obj, deeper))
+    items.reverse()
+    return items
+
+
+def end_environment(writer: LyXWriter, obj: Environment, deeper: bool):
+    """
+    Write the end of an Environment: the end of its \\begin_deeper block, its end line and its tail.
+    """
+    command = obj.command()
+    if deeper:
+        writer.write('\\end_deeper\n')
+    if command in DESIGNS:
+        magic_word = ENDS.get(command, 'default')
+        if magic_word:
+            writer.write(xml2txt(f'\\{command} {magic_word}\n'))
+    elif not (command in PAR_SET or command in DOC_SET or deeper) or command == 'index':
+        writer.write(xml2txt(f'\\end_{command}\n'))
+    if obj.tail:
+        writer.write(xml2txt(obj.tail))
+    if not writer.ends_with_empty_line():
+        writer.write('\n')
+
+
+def lyx_code(obj: LyXobj | Environment | Container) -> str:
+    """
+    :return: The LyX code of an object (include its sub-elements).
+    """
+    file = StringIO()
+    write_lyx(obj, file)
+    return file.getvalue()
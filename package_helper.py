@@ -9,7 +9,7 @@ This module provides utility functions for:
 
 from os.path import split, splitext, join
 from string import ascii_letters
-from PyLyX.objects.LyXobj import LyXobj
+from PyLyX.objects.LyXobj import LyXobj, SKIP
 
 
 def correct_name(full_path: str, extension: str) -> str:
@@ -96,8 +96,14 @@ def run_correct_brackets(obj: LyXobj):
     
     :param obj: Root LyX object to process
     """
-    is_open = False
-    for e in obj.iter():
-        if not e.is_category({'Formula', 'FormulaMacro'}):
-            e.text , is_open = correct_brackets(e.text, is_open)
-        e.tail, is_open = correct_brackets(e.tail, is_open)
+    state = [False]  # is a bracket open?
+
+    def pre(e, ancestors):
+        is_formula = e.is_category({'Formula', 'FormulaMacro'})
+        if not is_formula:
+            e.text, state[0] = correct_brackets(e.text, state[0])
+        e.tail, state[0] = correct_brackets(e.tail, state[0])
+        if is_formula:
+            return SKIP  # formulas are kept as they are.
+
+    obj.walk(pre)
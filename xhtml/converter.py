@@ -11,15 +11,19 @@ This module converts LyX document objects to XHTML format by:
 
 from os.path import join
 from json import load
+from re import compile, escape
 from xml.etree.ElementTree import Element
 from PyLyX.data.data import PAR_SET, PACKAGE_PATH, TRANSLATE
-from PyLyX.objects.LyXobj import LyXobj, DEFAULT_RANK
+from PyLyX.objects.LyXobj import LyXobj, walk, SKIP, STOP, shallow_copy
 from PyLyX.objects.Environment import Environment, Container
 from PyLyX.xhtml.special_objects import perform_table, perform_cell, perform_lists, perform_box, perform_text, \
     perform_image, correct_formula, TEXTS
-from PyLyX.xhtml.helper import scan_head, perform_lang, create_title, css_and_js, numbering_and_toc, \
-    number_foots_and_captions, mathjax, viewport, CSS_FOLDER
-from PyLyX.xhtml.modules import perform_module
+from PyLyX.xhtml.helper import scan_head, perform_lang, css_and_js, mathjax, viewport, TitleStage, NumberingStage, \
+    CaptionStage, CSS_FOLDER
+from PyLyX.xhtml.pipeline import run_stages, Pipeline
+from PyLyX.xhtml.modules import module_stages, MainStage
+from PyLyX.xhtml.writer import XHTMLWriter
+from PyLyX.xhtml.parallel import section_conversions, SectionConversions
 
 with open(join(PACKAGE_PATH, 'xhtml\\data\\tags.json'), 'r', encoding='utf8') as f:
     TAGS = load(f)
@@ -29,6 +33,26 @@ with open(join(PACKAGE_PATH, 'xhtml\\data\\light_dark.json'), 'r', encoding='utf
     LIGHT_DARK = load(f)
 
 
+def light_dark_replaces() -> dict:
+    """
+    :return: Dictionary of the replace of any color by LIGHT_DARK, after the replaces of the colors which follow it
+             (as the colors were replaced one after another in a style).
+    """
+    colors = list(LIGHT_DARK)
+    replaces = {}
+    for i, color in enumerate(colors):
+        replace = color
+        for other in colors[i:]:
+            replace = replace.replace(other, f'light-dark({LIGHT_DARK[other][0]}, {LIGHT_DARK[other][1]})')
+        replaces[color] = replace
+    return replaces
+
+
+LIGHT_DARK_REPLACES = light_dark_replaces()
+LIGHT_DARK_REGEX = compile('|'.join(escape(color) for color in sorted(LIGHT_DARK, key=len, reverse=True)))
+PLANS = {}  # (class, tag, kind id) -> Plan, shared by all the documents.
+
+
 def create_info(obj: LyXobj):
     """
     Determine HTML tag and conversion information for a LyX object.
@@ -66,36 +90,33 @@ def create_attributes(obj: LyXobj, info: dict, keep_data=False):
     :param keep_data: Whether to preserve all LyX attributes as data- attributes
     :return: Dictionary of HTML attributes
     """
+    return convert_attributes(obj, tuple(info.get('options', {}).items()), attributes_step(obj), keep_data)
+
+
+def convert_attributes(obj: LyXobj, options: tuple, step=None, keep_data=False):
+    """
+    Convert LyX object attributes to HTML attributes, by given steps (see Plan).
+    
+    :param obj: LyX object to convert attributes from
+    :param options: Pairs of (LyX attribute, HTML attribute) which are renamed
+    :param step: Function of (obj, old_attrib, new_attrib) for the special attributes of obj's kind (see attributes_step())
+    :param keep_data: Whether to preserve all LyX attributes as data- attributes
+    :return: Dictionary of HTML attributes
+    """
     old_attrib = obj.attrib.copy()
     new_attrib = {}
 
-    if 'options' in info:
-        for key in info['options']:
-            if key in old_attrib:
-                new_key, value = info['options'][key], old_attrib.pop(key)
-                new_attrib[new_key] = value
+    for key, new_key in options:
+        if key in old_attrib:
+            new_attrib[new_key] = old_attrib.pop(key)
     if 'class' in old_attrib:
         new_attrib['class'] = old_attrib.pop('class')
 
-    if obj.is_category('Box'):
-        perform_box(obj, old_attrib, new_attrib)
-    elif obj.is_category('Graphics'):
-        perform_image(old_attrib, new_attrib)
-    elif obj.tag == 'cell':
-        perform_cell(old_attrib, new_attrib)
-    elif obj.is_details('ref'):
-        new_attrib['href'] = '#' + new_attrib['href']
-    elif obj.is_category('other'):
-        old_attrib['details'] = obj.details()
-    elif obj.is_category('FormulaMacro'):
-        lines = obj.text.splitlines()[1:]
-        lines = '\n'.join(lines)
-        old_attrib['lines'] = lines
+    if step is not None:
+        step(obj, old_attrib, new_attrib)
 
     if 'style' in new_attrib:
-        for color in LIGHT_DARK:
-            light_dark_color = f'light-dark({LIGHT_DARK[color][0]}, {LIGHT_DARK[color][1]})'
-            new_attrib['style'] = new_attrib['style'].replace(color, light_dark_color)
+        new_attrib['style'] = LIGHT_DARK_REGEX.sub(lambda match: LIGHT_DARK_REPLACES[match.group()], new_attrib['style'])
 
     if keep_data:
         for key in old_attrib:
@@ -105,6 +126,48 @@ def create_attributes(obj: LyXobj, info: dict, keep_data=False):
     return new_attrib
 
 
+def image_attributes(obj: LyXobj, old_attrib: dict, new_attrib: dict):
+    perform_image(old_attrib, new_attrib)
+
+
+def cell_attributes(obj: LyXobj, old_attrib: dict, new_attrib: dict):
+    perform_cell(old_attrib, new_attrib)
+
+
+def ref_attributes(obj: LyXobj, old_attrib: dict, new_attrib: dict):
+    new_attrib['href'] = '#' + new_attrib['href']
+
+
+def other_attributes(obj: LyXobj, old_attrib: dict, new_attrib: dict):
+    old_attrib['details'] = obj.details()
+
+
+def macro_attributes(obj: LyXobj, old_attrib: dict, new_attrib: dict):
+    lines = obj.text.splitlines()[1:]
+    lines = '\n'.join(lines)
+    old_attrib['lines'] = lines
+
+
+def attributes_step(obj: LyXobj):
+    """
+    :return: Function of (obj, old_attrib, new_attrib) which converts the special attributes of obj's kind
+             (boxes, images, table cells, references, etc.), or None if there are no such attributes.
+    """
+    if obj.is_category('Box'):
+        return perform_box
+    elif obj.is_category('Graphics'):
+        return image_attributes
+    elif obj.tag == 'cell':
+        return cell_attributes
+    elif obj.is_details('ref'):
+        return ref_attributes
+    elif obj.is_category('other'):
+        return other_attributes
+    elif obj.is_category('FormulaMacro'):
+        return macro_attributes
+    return None
+
+
 def create_text(obj, new_attrib: dict):
     """
     Extract and format text content from a LyX object.
@@ -119,38 +182,95 @@ def create_text(obj, new_attrib: dict):
     :param new_attrib: HTML attributes dictionary (may be modified)
     :return: Formatted text string for HTML output
     """
+    return text_step(obj)(obj, new_attrib)
+
+
+def formula_text(obj: LyXobj, new_attrib: dict):
+    return correct_formula(obj.text)
+
+
+def macro_text(obj: LyXobj, new_attrib: dict):
+    macro = obj.text.splitlines()[0]
+    return correct_formula(macro)
+
+
+def special_text(obj: LyXobj, new_attrib: dict):
+    return perform_text(obj)
+
+
+def ref_text(obj: LyXobj, new_attrib: dict):
+    text = new_attrib.get('href', '#')[1:]
+    new_txt = ''
+    if new_attrib.get('data-LatexCommand') == 'ref':
+        for c in text:
+            if c in '1234567890.':
+                new_txt += c
+    elif new_attrib.get('data-LatexCommand') == 'nameref':
+        pass
+    if new_txt:
+        return new_txt
+    else:
+        return text
+
+
+def plain_text(obj: LyXobj, new_attrib: dict):
+    if 'text' in new_attrib:
+        return new_attrib.pop('text')
+    else:
+        return obj.text
+
+
+def text_step(obj: LyXobj):
+    """
+    :return: Function of (obj, new_attrib) which creates the text of obj's kind (see create_text()).
+    """
     if obj.is_category('Formula'):
-        return correct_formula(obj.text)
+        return formula_text
     elif obj.is_category('FormulaMacro'):
-        macro = obj.text.splitlines()[0]
-        return correct_formula(macro)
+        return macro_text
     elif obj.is_in(TEXTS):
-        return perform_text(obj)
+        return special_text
     elif obj.is_details('ref'):
-        text = new_attrib.get('href', '#')[1:]
-        new_txt = ''
-        if new_attrib.get('data-LatexCommand') == 'ref':
-            for c in text:
-                if c in '1234567890.':
-                    new_txt += c
-        elif new_attrib.get('data-LatexCommand') == 'nameref':
-            pass
-        if new_txt:
-            return new_txt
-        else:
-            return text
-    elif 'text' in new_attrib:
-        return new_attrib.pop('text')
+        return ref_text
     else:
-        return obj.text
+        return plain_text
+
+
+class Plan:
+    """
+    The conversion of the objects of one kind, class and tag: the HTML tag, and the steps of the attributes
+    and the text which apply to them. A plan is compiled once (see conversion_plan()), so the conversion of an object
+    is a table lookup and the needed steps only.
+    """
+    def __init__(self, obj: LyXobj):
+        """
+        :param obj: an object of the plan's kind, class and tag.
+        """
+        info = create_info(obj)
+        self.tag = info['tag']
+        self.options = tuple(info.get('options', {}).items())  # (LyX attribute, HTML attribute)
+        self.attributes = attributes_step(obj)
+        self.text = text_step(obj)
+        self.include = obj.is_details('include')
+
+
+def conversion_plan(obj: LyXobj) -> Plan:
+    """
+    :return: The conversion plan of obj's kind, class and tag (it is compiled in the first time only).
+    """
+    key = type(obj), obj.tag, obj.kind().id
+    plan = PLANS.get(key)
+    if plan is None:
+        plan = PLANS[key] = Plan(obj)
+    return plan
 
 
 def one_obj(obj, keep_data=False, replaces: dict | None = None):
     """
     Convert a single LyX object to HTML (non-recursive).
     
-    Creates a copy of the object with HTML tag, attributes, and text.
-    Does not convert child elements. Handles string replacements in attributes
+    Creates a copy of the object with HTML tag, attributes, and text, by the conversion plan
+    of the object's kind (see Plan). Does not convert child elements. Handles string replacements in attributes
     and special processing for include insets.
     
     :param obj: LyX object to convert
@@ -158,30 +278,29 @@ def one_obj(obj, keep_data=False, replaces: dict | None = None):
     :param replaces: Dictionary of string replacements to apply to attributes
     :return: Converted object with HTML properties
     """
-    info = create_info(obj)
-    attrib = create_attributes(obj, info, keep_data)
-    text = create_text(obj, attrib)
-    new_obj = obj.copy()
-    new_obj.open()
-    for e in new_obj:
-        e.open()
+    plan = conversion_plan(obj)
+    attrib = convert_attributes(obj, plan.options, plan.attributes, keep_data)
+    text = plan.text(obj, attrib)
     if replaces is not None:
         for old in replaces:
             for key in attrib:
                 attrib[key] = attrib[key].replace(old, replaces[old])
-    new_obj.tag, new_obj.text, new_obj.attrib = info['tag'], text, attrib
-    if 'class' in new_obj.attrib and new_obj.attrib['class'].endswith('*'):
-        new_obj.set('class', new_obj.get('class')[:-1] + '_')
-    if new_obj.is_details('include'):
-        perform_include(new_obj)
+    new_obj = shallow_copy(obj, plan.tag, attrib, text)
+    for e in new_obj:
+        e.open()
+    if 'class' in attrib and attrib['class'].endswith('*'):
+        new_obj.set('class', attrib['class'][:-1] + '_')
+    if plan.include:
+        perform_include(new_obj, keep_data, replaces)
     return new_obj
 
 
-def recursive_convert(obj: LyXobj | Element, lang='english', toc: tuple[LyXobj, LyXobj] | None = None, keep_data=False, replaces: dict | None = None):
+def recursive_convert(obj: LyXobj | Element, lang='english', toc: tuple[LyXobj, LyXobj] | None = None, keep_data=False, replaces: dict | None = None,
+                      sections: SectionConversions | None = None):
     """
     Recursively convert a LyX object and all its children to HTML.
     
-    Main conversion function that processes the entire document tree:
+    Main conversion function that processes the entire document tree (by walk(), without recursion):
     - Tracks document language for RTL/LTR handling
     - Converts each object and its descendants
     - Handles special cases (section titles, lists, tables)
@@ -192,30 +311,43 @@ def recursive_convert(obj: LyXobj | Element, lang='english', toc: tuple[LyXobj,
     :param toc: Tuple of (toc_title, toc_list) for building table of contents
     :param keep_data: Whether to preserve LyX metadata
     :param replaces: Dictionary of string replacements for attributes
+    :param sections: Sections which are converted in worker processes (see xhtml/parallel.py)
     :return: Converted HTML object with all children converted
     """
-    if obj.is_command('lang'):
-        lang = obj.category()
-    new_obj = one_obj(obj, keep_data, replaces)
-    is_first = True
-    last = None
-    for child in obj:
-        child = recursive_convert(child, lang, toc, keep_data, replaces)
-        if child.is_section_title() and is_first:
-            new_obj[0] = child
-            last = None
-        elif child.is_category({'Labeling', 'Itemize', 'Enumerate', 'Description'}):
-            last = perform_lists(new_obj, child, last)
+    langs = [lang]  # the languages of the objects in the traversal path.
+    states = []  # [new object, is the next sub-element the first one, the last list] of the objects in the path.
+    result = []
+
+    def pre(e, ancestors):
+        langs.append(e.category() if e.is_command('lang') else langs[-1])
+        if sections is not None and e in sections:
+            states.append([sections.get(), True, None])
+            return SKIP
+        states.append([one_obj(e, keep_data, replaces), True, None])
+
+    def post(e, ancestors):
+        new_obj = states.pop()[0]
+        lang = langs.pop()
+        if new_obj.is_command('lyxtabular'):
+            perform_table(new_obj, lang)
+        if new_obj.is_details('toc') and toc is not None:
+            add_toc(new_obj, toc[0], toc[1])
+        if not states:
+            result.append(new_obj)
+            return
+        state = states[-1]
+        if new_obj.is_section_title() and state[1]:
+            state[0][0] = new_obj
+            state[2] = None
+        elif new_obj.is_category({'Labeling', 'Itemize', 'Enumerate', 'Description'}):
+            state[2] = perform_lists(state[0], new_obj, state[2])
         else:
-            new_obj.append(child)
-            last = None
-        is_first = False
-
-    if new_obj.is_command('lyxtabular'):
-        perform_table(new_obj, lang)
-    if new_obj.is_details('toc') and toc is not None:
-        add_toc(new_obj, toc[0], toc[1])
-    return new_obj
+            state[0].append(new_obj)
+            state[2] = None
+        state[1] = False
+
+    walk(obj, pre, post)
+    return result[0]
 
 
 def add_toc(toc_obj: LyXobj, toc_title: LyXobj, toc: LyXobj):
@@ -230,7 +362,41 @@ def add_toc(toc_obj: LyXobj, toc_title: LyXobj, toc: LyXobj):
     toc_obj.append(toc)
 
 
-def convert(root, css_files=(), css_folder=CSS_FOLDER, js_files=(), js_in_head=False, keep_data=False, replaces: dict | None = None):
+def convert_head(root, keep_data=False, css_folder=CSS_FOLDER):
+    """
+    Convert the header of a LyX document to an HTML head, with its metadata, MathJax, viewport and language style.
+    
+    :param root: Root document Environment containing [header, body]
+    :param keep_data: Whether to preserve LyX metadata in output
+    :param css_folder: Path to default CSS folder
+    :return: Tuple of (head_element, info_dict)
+    :raises Exception: If root doesn't have exactly 2 elements (header and body)
+    """
+    if len(root) != 2:
+        raise Exception(f'root must contain 2 subelements exactly, not {len(root)}.')
+    info = scan_head(root[0])
+    lang = info.get('language', 'english')
+    if keep_data:
+        head = recursive_convert(root[0])
+        for e in head.iter():
+            e.tag = 'meta'
+    else:
+        head = one_obj(root[0])
+    head.extend((mathjax(), viewport()))
+    perform_lang(root, head, lang, css_folder)
+    return head, info
+
+
+def create_toc(lang='english'):
+    """
+    :return: Tuple of (toc_title, toc_list) for building table of contents, in the document's language
+    """
+    toc_title = TRANSLATE['inset']['CommandInset']['toc'].get(lang, 'Table of Contents')
+    return LyXobj('h2', text=toc_title), LyXobj('ul')
+
+
+def convert(root, css_files=(), css_folder=CSS_FOLDER, js_files=(), js_in_head=False, keep_data=False, replaces: dict | None = None,
+            stages=(), workers=1):
     """
     Convert a complete LyX document to XHTML.
     
@@ -238,10 +404,9 @@ def convert(root, css_files=(), css_folder=CSS_FOLDER, js_files=(), js_in_head=F
     1. Extracts document metadata from header
     2. Converts header to HTML head with metadata, CSS, and scripts
     3. Converts body to HTML with proper structure
-    4. Generates table of contents
-    5. Numbers sections, figures, and footnotes
-    6. Applies language-specific styling (RTL/LTR)
-    7. Processes LyX modules
+    4. Applies language-specific styling (RTL/LTR)
+    5. Runs the stages of the pipeline in one traversal of the body (see xhtml/pipeline.py):
+       the title, section numbering and table of contents, footnotes and captions, and LyX modules
     
     :param root: Root document Environment containing [header, body]
     :param css_files: Additional CSS files to include
@@ -250,52 +415,286 @@ def convert(root, css_files=(), css_folder=CSS_FOLDER, js_files=(), js_in_head=F
     :param js_in_head: Whether to place JS in <head> (True) or end of body (False)
     :param keep_data: Whether to preserve LyX metadata in output
     :param replaces: Dictionary for string replacements in paths/attributes
+    :param stages: Additional stages, which run after the others in the same traversal (e.g. WhitespaceStage)
+    :param workers: Number of processes for converting the sections (see xhtml/parallel.py)
     :return: Tuple of (root_element, info_dict)
     :raises Exception: If root doesn't have exactly 2 elements (header and body)
     """
-    if len(root) == 2:
-        info = scan_head(root[0])
-        lang = info.get('language', 'english')
-        if keep_data:
-            head = recursive_convert(root[0])
-            for e in head.iter():
-                e.tag = 'meta'
+    head, info = convert_head(root, keep_data, css_folder)
+    lang = info.get('language', 'english')
+    toc_title, toc = create_toc(lang)
+    sections = section_conversions(root[1], workers, lang, (toc_title, toc), keep_data, replaces)
+    try:
+        body = recursive_convert(root[1], lang, (toc_title, toc), keep_data, replaces, sections)
+    finally:
+        if sections is not None:
+            sections.close()
+    title = TitleStage(head)
+    css_and_js(head, body, css_files, js_files, js_in_head)
+    pipeline = [title, NumberingStage(toc, info.get('secnumdepth', -1), info.get('tocdepth', -1), lang), CaptionStage(lang)]
+    for module in info.get('modules', ()):
+        pipeline.extend(module_stages(module, head, body, info, css_folder))
+    run_stages(body, pipeline + list(stages))
+    info['toc'] = LyXobj('inset', 'CommandInset', 'toc')
+    add_toc(info['toc'], toc_title, toc)
+
+    root = one_obj(root, keep_data, replaces)
+    root.set('xmlns', 'http://www.w3.org/1999/xhtml')
+    root.extend((head, body))
+    return root, info
+
+
+def scan_title(body: LyXobj, lang='english', toc: tuple[LyXobj, LyXobj] | None = None, keep_data=False,
+               replaces: dict | None = None) -> str | None:
+    """
+    Find the document's title before the body is converted (as TitleStage finds it in the converted body).
+    
+    :param body: LyX body object
+    :param lang: Document language code
+    :param toc: Tuple of (toc_title, toc_list), as given to recursive_convert()
+    :param keep_data: Whether to preserve LyX metadata
+    :param replaces: Dictionary of string replacements for attributes
+    :return: The text of the title, or None if the document has no title
+    """
+    found = []
+
+    def pre(e, ancestors):
+        if ancestors and e.kind().string == 'layout Title':
+            langs = [a.category() for a in ancestors + [e] if a.is_command('lang')]
+            title = recursive_convert(e, langs[-1] if langs else lang, toc, keep_data, replaces)
+            if title.get('class') == 'layout Title':
+                while not title.text and len(title):
+                    title = title[0]
+                found.append(title.text)
+                return STOP
+
+    walk(body, pre)
+    return found[0] if found else None
+
+
+def scan_toc(body: LyXobj, toc: LyXobj, secnumdepth=-1, tocdepth=-1, lang='english', keep_data=False,
+             replaces: dict | None = None):
+    """
+    Build the table of contents before the body is converted: the sections (with their converted titles only)
+    are converted into a skeleton of the body, which is numbered as the body is numbered (see NumberingStage).
+    
+    :param body: LyX body object
+    :param toc: List element for the TOC entries
+    :param secnumdepth: Depth of numbered sections
+    :param tocdepth: Depth of sections in the table of contents
+    :param lang: Document language code
+    :param keep_data: Whether to preserve LyX metadata
+    :param replaces: Dictionary of string replacements for attributes
+    """
+    news = []  # [LyX object, converted object] of the sections in the traversal path (and the body).
+
+    def pre(e, ancestors):
+        if ancestors and type(e) is not Container:
+            return SKIP
+        new_obj = one_obj(e, keep_data, replaces)
+        if ancestors:
+            title = recursive_convert(e[0], lang, None, keep_data, replaces)
+            if title.is_section_title():
+                new_obj[0] = title
+            news[-1][1].append(new_obj)
+        news.append((e, new_obj))
+
+    def post(e, ancestors):
+        if news[-1][0] is e and len(news) > 1:
+            news.pop()
+
+    walk(body, pre, post)
+    run_stages(news[0][1], [NumberingStage(toc, secnumdepth, tocdepth, lang)])
+
+
+def stream_body(body: LyXobj, writer: XHTMLWriter, pipeline: Pipeline, lang='english',
+                toc: tuple[LyXobj, LyXobj] | None = None, keep_data=False, replaces: dict | None = None, scripts=(),
+                sections: SectionConversions | None = None):
+    """
+    Convert the body of a LyX document and write it, by parts: the body and its sections are written as open elements
+    (their sub-elements are written one by one), and any other object is converted with its sub-elements
+    (by recursive_convert()) and written as a whole, so only the path of open sections and one part are kept.
+    The parts are grouped as recursive_convert() groups them (section titles and lists), and the stages of the pipeline
+    get them as they would get the converted body; a part is written after the next part was entered,
+    since a stage may change the part before it.
+    
+    :param body: LyX body object
+    :param writer: XHTMLWriter, whose current element is the HTML root
+    :param pipeline: Pipeline of stages, which get the converted body in parts
+    :param lang: Document language code
+    :param toc: Tuple of (toc_title, toc_list) for the table of contents insets
+    :param keep_data: Whether to preserve LyX metadata
+    :param replaces: Dictionary of string replacements for attributes
+    :param scripts: Elements which are appended to the body (e.g. scripts, see css_and_js())
+    :param sections: Sections which are converted in worker processes (see xhtml/parallel.py), written as whole parts
+    """
+    ancestors = []  # the converted ancestors of the next part.
+    frames = []  # [LyX object, converted object, is the next sub-element the first one, the last list] of the open elements.
+    pending = []  # the writer's calls for the last part.
+
+    def flush():
+        for call, *args in pending:
+            call(*args)
+        pending.clear()
+
+    def open_obj(new_obj):
+        pipeline.enter(new_obj, ancestors)
+        flush()
+        pending.append((writer.start, new_obj))
+        ancestors.append(new_obj)
+
+    def close_obj(new_obj):
+        ancestors.pop()
+        pipeline.exit(new_obj, ancestors)
+        pending.append((writer.end,))
+
+    def close_list(frame):
+        if frame[3] is not None:
+            close_obj(frame[3])
+            frame[3] = None
+
+    def child(new_obj, is_open=False):
+        frame = frames[-1]
+        if new_obj.is_section_title() and frame[2]:
+            frame[1][0] = new_obj
+            close_list(frame)
+        elif new_obj.is_category({'Labeling', 'Itemize', 'Enumerate', 'Description'}):
+            last = perform_lists(frame[1], new_obj, frame[3])
+            if last is not frame[3]:
+                Element.remove(frame[1], last)
+                close_list(frame)
+                open_obj(last)
+                frame[3] = last
+            new_obj = last[-1]
+            Element.remove(last, new_obj)
         else:
-            head = one_obj(root[0])
-        head.extend((mathjax(), viewport()))
-        perform_lang(root, head, lang, css_folder)
-
-        toc = LyXobj('ul')
-        toc_title = TRANSLATE['inset']['CommandInset']['toc'].get(lang, 'Table of Contents')
-        toc_title = LyXobj('h2', text=toc_title)
-        body = recursive_convert(root[1], lang, (toc_title, toc), keep_data, replaces)
-        create_title(head, body)
-        css_and_js(head, body, css_files, js_files, js_in_head)
-        numbering_and_toc(toc, body, info.get('secnumdepth', -1), info.get('tocdepth', -1), '', lang)
-        info['toc'] = LyXobj('inset', 'CommandInset', 'toc')
-        add_toc(info['toc'], toc_title, toc)
-        number_foots_and_captions(body, lang)
-        if 'modules' in info:
-            for module in info['modules']:
-                perform_module(module, head, body, info, css_folder)
-
-        root = one_obj(root, keep_data, replaces)
-        root.set('xmlns', 'http://www.w3.org/1999/xhtml')
-        root.extend((head, body))
-        return root, info
-    else:
-        raise Exception(f'root must contain 2 subelements exactly, not {len(root)}.')
+            frame[1].append(new_obj)
+            Element.remove(frame[1], new_obj)
+            close_list(frame)
+        frame[2] = False
+        if is_open:
+            open_obj(new_obj)
+        else:
+            pipeline.run(new_obj, ancestors)
+            flush()
+            pending.append((writer.element, new_obj))
+
+    def pre(e, lyx_ancestors):
+        if sections is not None and e in sections:
+            child(sections.get())
+            return SKIP
+        if lyx_ancestors and type(e) is not Container:
+            if not (type(lyx_ancestors[-1]) is Container and e is lyx_ancestors[-1][0]):
+                child(recursive_convert(e, lang, toc, keep_data, replaces))
+            return SKIP
+        new_obj = one_obj(e, keep_data, replaces)
+        title = None
+        if lyx_ancestors:
+            title = recursive_convert(e[0], lang, toc, keep_data, replaces)
+            if title.is_section_title():
+                new_obj[0] = title
+            child(new_obj, is_open=True)
+        else:
+            open_obj(new_obj)
+        frames.append([e, new_obj, True, None])
+        if title is not None:
+            child(title)
+
+    def post(e, lyx_ancestors):
+        if frames and frames[-1][0] is e:
+            if not lyx_ancestors:
+                for script in scripts:
+                    child(script)
+            frame = frames.pop()
+            close_list(frame)
+            close_obj(frame[1])
+
+    walk(body, pre, post)
+    flush()
+
 
+def convert_stream(root, file, css_files=(), css_folder=CSS_FOLDER, js_files=(), js_in_head=False, keep_data=False,
+                   replaces: dict | None = None, stages=(), style=None, pretty=True, workers=1) -> dict:
+    """
+    Convert a complete LyX document to XHTML and write it to a file incrementally (see stream_body()),
+    so only a part of the converted document is kept in memory.
+    
+    The output is the same as the output of convert() (indented by ElementTree.indent(), if pretty is True).
+    The title and the table of contents, which are needed before the parts of the body which they refer to
+    are converted, are found by a pre-scan of the LyX body (see scan_title() and scan_toc()).
+    A module which has no stages needs the whole converted body, so the document is converted by convert().
+    
+    :param root: Root document Environment containing [header, body]
+    :param file: Binary file object for writing
+    :param css_files: Additional CSS files to include
+    :param css_folder: Path to default CSS folder
+    :param js_files: JavaScript files to include
+    :param js_in_head: Whether to place JS in <head> (True) or end of body (False)
+    :param keep_data: Whether to preserve LyX metadata in output
+    :param replaces: Dictionary for string replacements in paths/attributes
+    :param stages: Additional stages, which run after the others (e.g. WhitespaceStage)
+    :param style: Function of (root_element, info_dict), which is called before the head is written
+                  (the root contains the head only), e.g. for xhtml_style()
+    :param pretty: Whether to indent the output
+    :param workers: Number of processes for converting the sections (see xhtml/parallel.py)
+    :return: Document metadata dictionary (with the table of contents in 'toc')
+    :raises Exception: If root doesn't have exactly 2 elements (header and body)
+    """
+    head, info = convert_head(root, keep_data, css_folder)
+    lang = info.get('language', 'english')
+    toc_title, toc = create_toc(lang)
+    secnumdepth, tocdepth = info.get('secnumdepth', -1), info.get('tocdepth', -1)
+    title = scan_title(root[1], lang, (toc_title, toc), keep_data, replaces)
+    if title is not None:
+        head.append(LyXobj('title', text=title))
+    scripts = LyXobj('body')
+    css_and_js(head, scripts, css_files, js_files, js_in_head)
+    pipeline = [NumberingStage(LyXobj('ul'), secnumdepth, tocdepth, lang), CaptionStage(lang)]
+    for module in info.get('modules', ()):
+        pipeline.extend(module_stages(module, head, None, info, css_folder))
+    if any(type(stage) is MainStage for stage in pipeline):
+        html, info = convert(root, css_files, css_folder, js_files, js_in_head, keep_data, replaces, stages, workers)
+        if style is not None:
+            style(html, info)
+        XHTMLWriter(file, pretty).element(html)
+        return info
+
+    scan_toc(root[1], toc, secnumdepth, tocdepth, lang, keep_data, replaces)
+    info['toc'] = LyXobj('inset', 'CommandInset', 'toc')
+    add_toc(info['toc'], toc_title, toc)
+
+    html = one_obj(root, keep_data, replaces)
+    html.set('xmlns', 'http://www.w3.org/1999/xhtml')
+    html.append(head)
+    if style is not None:
+        style(html, info)
+    writer = XHTMLWriter(file, pretty)
+    writer.start(html)
+    writer.element(head)
+    pipeline = Pipeline(pipeline + list(stages))
+    sections = section_conversions(root[1], workers, lang, (toc_title, toc), keep_data, replaces)
+    try:
+        stream_body(root[1], writer, pipeline, lang, (toc_title, toc), keep_data, replaces, list(scripts), sections)
+    finally:
+        if sections is not None:
+            sections.close()
+    pipeline.finish()
+    writer.close()
+    return info
 
-def perform_include(obj: LyXobj):
+
+def perform_include(obj: LyXobj, keep_data=False, replaces: dict | None = None):
+    """
+    Append the converted body of an included .lyx file to its include inset (see xhtml/includes.py).
+    
+    :param obj: Converted include inset
+    :param keep_data: Whether to preserve LyX metadata in the included body
+    :param replaces: Dictionary of string replacements for the included body's attributes
+    """
     if 'data-filename' in obj.attrib:
         path = obj.get('data-filename')
         if path.endswith('.lyx'):
-            from PyLyX import LyX
-            root = LyX(path).get_doc()
-            root, info = convert(root)
-            body = root[1]
-            include_body = LyXobj('div', attrib={'class': 'include body'}, rank=-DEFAULT_RANK)
-            obj.append(include_body)
-            for element in body:
-                include_body.append(element)
+            from PyLyX.xhtml.includes import include_body
+            body = include_body(path, keep_data, replaces)
+            if body is not None:
+                obj.append(body)
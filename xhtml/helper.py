@@ -7,6 +7,7 @@ This module provides functions for:
 - Creating table of contents and section numbering
 - Handling language-specific styling (RTL/LTR)
 - Numbering figures, footnotes, and captions
+- Stages of the pipeline (see pipeline.py) for the title, the numbering and the table of contents, and the captions
 """
 
 from os.path import join
@@ -14,12 +15,15 @@ from PyLyX.package_helper import correct_name
 from PyLyX.data.data import RTL_LANGS, PACKAGE_PATH, TRANSLATE
 from PyLyX.objects.LyXobj import LyXobj
 from PyLyX.objects.Environment import Environment
+from PyLyX.objects.selector import select_first
 from PyLyX.xhtml.special_objects import prefixing
+from PyLyX.xhtml.pipeline import Stage, run_stages
 
 MATHJAX = 'https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js'
 CSS_FOLDER = join(PACKAGE_PATH, 'xhtml\\css')
 BASIC_CSS, RTL_CSS, LTR_CSS = 'basic.css', 'rtl.css', 'ltr.css'
 SECTIONS = ('Part', 'Chapter', 'Section', 'Subsection', 'Subsubsection', 'Paragraph', 'Subparagraph')
+SECTION_CLASSES = {f'layout {s}' for s in SECTIONS}
 
 
 def scan_head(head: Environment):
@@ -82,9 +86,8 @@ def create_title(head: LyXobj, body: LyXobj):
     :param head: HTML head element
     :param body: HTML body element containing the document
     """
-    titles = body.findall(".//*[@class='layout Title']")
-    if titles:
-        title = titles[0]
+    title = select_first(body, "* > *[class='layout Title']")
+    if title is not None:
         while not title.text and len(title):
             title = title[0]
         head_title = LyXobj('title', text=title.text)
@@ -165,43 +168,93 @@ def tocing(toc: LyXobj, obj: LyXobj, prefix):
     return item
 
 
+class TitleStage(Stage):
+    """
+    Add the document's title to the HTML head (see create_title()), in the place of the head at the stage's creation.
+    """
+    def __init__(self, head: LyXobj):
+        self.head, self.position, self.found = head, len(head), False
+
+    def accepts(self, kind) -> bool:
+        return kind.string == 'layout Title'
+
+    def enter(self, obj: LyXobj, ancestors: list):
+        if not self.found and ancestors and obj.get('class') == 'layout Title':
+            self.found = True
+            while not obj.text and len(obj):
+                obj = obj[0]
+            self.head.insert(self.position, LyXobj('title', text=obj.text))
+
+
+class NumberingStage(Stage):
+    """
+    Number the sections (by the depth of secnumdepth) and build the table of contents (by the depth of tocdepth).
+    Only sections which are direct sub-elements of the root or of numbered sections are numbered.
+    """
+    tags = {'section'}
+
+    def __init__(self, toc: LyXobj, secnumdepth=-1, tocdepth=-1, lang='english', prefix=''):
+        self.toc, self.secnumdepth, self.tocdepth, self.lang, self.prefix = toc, secnumdepth, tocdepth, lang, prefix
+        # id of the root or a numbered section -> [number of its numbered sections, prefix, toc, the section]
+        # (the section is kept, so its id is not reused while it is a key, even if the tree is dropped as it is written).
+        self.levels = {}
+
+    def enter(self, sec: LyXobj, ancestors: list):
+        if not ancestors:
+            return
+        if not self.levels:
+            self.levels[id(ancestors[0])] = [0, self.prefix, self.toc, ancestors[0]]
+        level = self.levels.get(id(ancestors[-1]))
+        if level is None or sec.rank() > max(self.secnumdepth, self.tocdepth):
+            return
+        if len(sec) and sec.attrib.get('class') in SECTION_CLASSES:
+            level[0] += 1
+            prefix = f'{level[1]}.{level[0]}' if level[1] else f'{level[0]}'
+            if sec.rank() <= 1 and sec.is_in(TRANSLATE):
+                prefix = TRANSLATE[sec.command()][sec.category()][sec.details()][self.lang] + ' ' + prefix
+            if sec.rank() <= self.tocdepth:
+                item = tocing(level[2], sec[0], prefix)
+                toc = LyXobj('ul')
+                item.append(toc)
+            else:
+                toc = level[2]
+            if sec.rank() <= self.secnumdepth:
+                prefixing(sec[0], prefix)
+            self.levels[id(sec)] = [0, prefix, toc, sec]
+
+
 def numbering_and_toc(toc: LyXobj, element, secnumdepth=-1, tocdepth=-1, prefix='', lang='english'):
-    i = 0
-    for sec in element.findall('section'):
-        if sec.rank() <= max(secnumdepth, tocdepth) and sec is not element:
-            if len(sec) and sec.attrib.get('class') in {f'layout {s}' for s in SECTIONS}:
-                i += 1
-                if sec.rank() <= secnumdepth or sec.rank() <= tocdepth:
-                    new_prefix = f'{prefix}.{i}' if prefix else f'{i}'
-                    if sec.rank() <= 1 and sec.is_in(TRANSLATE):
-                        new_prefix = TRANSLATE[sec.command()][sec.category()][sec.details()][lang] + ' ' + new_prefix
-
-                    if sec.rank() <= tocdepth:
-                        item = tocing(toc, sec[0], new_prefix)
-                        new_toc = LyXobj('ul')
-                        item.append(new_toc)
-                    else:
-                        new_toc = toc
-                    if sec.rank() <= secnumdepth:
-                        prefixing(sec[0], new_prefix)
-                    numbering_and_toc(new_toc, sec, secnumdepth, tocdepth, new_prefix, lang)
+    run_stages(element, [NumberingStage(toc, secnumdepth, tocdepth, lang, prefix)])
 
 
-def number_foots_and_captions(body: LyXobj, lang: str):
-    i = j = k = 0
-    for e in body.iter():
+class CaptionStage(Stage):
+    """
+    Number the footnotes, and the captions of tables and figures.
+    """
+    def __init__(self, lang: str):
+        self.lang = lang
+        self.foots = self.tables = self.figures = 0
+
+    def accepts(self, kind) -> bool:
+        return kind.category == 'Foot' or kind.details in ('table', 'figure')
+
+    def enter(self, e: LyXobj, ancestors: list):
         if e.is_category('Foot'):
-            i += 1
-            text = str(i)
+            self.foots += 1
+            text = str(self.foots)
         elif e.is_details('table'):
-            j += 1
-            text = f'{TRANSLATE[e.command()][e.category()][e.details()][lang]} {j}: '
+            self.tables += 1
+            text = f'{TRANSLATE[e.command()][e.category()][e.details()][self.lang]} {self.tables}: '
             e = e.find(".//span/div[@class='inset Caption Standard']")
         elif e.is_details('figure'):
-            k += 1
-            text = f'{TRANSLATE[e.command()][e.category()][e.details()][lang]} {k}: '
+            self.figures += 1
+            text = f'{TRANSLATE[e.command()][e.category()][e.details()][self.lang]} {self.figures}: '
             e = e.find(".//span/div[@class='inset Caption Standard']")
         else:
-            continue
+            return
         if e is not None:
             prefixing(e, text, '')
+
+
+def number_foots_and_captions(body: LyXobj, lang: str):
+    run_stages(body, [CaptionStage(lang)])
@@ -0,0 +1,224 @@
+"""
+Conversion of included LyX files.
+
+This module provides:
+- include_body(): The converted body of an included .lyx file (converted once for any version of the file)
+- convert_includes(): Convert the distinct files which a document includes, in parallel processes
+- run_document(): Run a conversion of a document, with the document in the stack of the converted files
+
+The converted bodies are kept by the file's path and the conversion options, with the versions (modification time
+and size) of the file and of the files which it includes, so an entry is used while none of them was changed.
+They are kept in memory and, if the cache of objects/cache.py is enabled, on disk. Any include inset gets a copy
+of the body (see LyXobj.unpack()).
+A file which is included in itself (directly or by other files) is not expanded again, and a warning is printed;
+such a body is used again only with the same stack of converted files.
+"""
+
+from os import stat
+from os.path import join, abspath
+from hashlib import sha256
+from concurrent.futures import ProcessPoolExecutor
+from PyLyX.data.data import PACKAGE_PATH
+from PyLyX.objects import cache
+from PyLyX.objects.LyXobj import LyXobj, DEFAULT_RANK, pack, unpack
+from PyLyX.objects.selector import select
+
+INCLUDES = {}  # (full path, keep_data, replaces) -> entry, see convert_include().
+INCLUDING = []  # [full path, versions of the files it includes, was a recursive include found] of the converted files.
+DATA_VERSION = ''  # a short hash of the xhtml/data/*.json files, for the entries on disk.
+
+
+def file_version(full_path: str):
+    """
+    :return: The modification time and the size of a file (None if it does not exist).
+    """
+    try:
+        info = stat(full_path)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+def include_key(path: str, keep_data=False, replaces: dict | None = None) -> tuple:
+    return abspath(path), bool(keep_data), tuple(replaces.items()) if replaces else ()
+
+
+def stack() -> tuple:
+    """
+    :return: The paths of the files which are converted now.
+    """
+    return tuple(frame[0] for frame in INCLUDING)
+
+
+def is_valid(entry: tuple) -> bool:
+    """
+    :return: Can the entry be used now? Its files were not changed, none of them is converted now,
+             and if a recursive include was found in it, the stack of the converted files is the same.
+    """
+    packed, versions, context = entry
+    paths = stack()
+    if any(path in versions for path in paths):
+        return False
+    if context is not None and context != paths:
+        return False
+    return all(file_version(path) == version for path, version in versions.items())
+
+
+def data_version() -> str:
+    global DATA_VERSION
+    if not DATA_VERSION:
+        digest = sha256()
+        folder = join(PACKAGE_PATH, 'xhtml', 'data')
+        for name in ('tags.json', 'tables.json', 'light_dark.json'):
+            with open(join(folder, name), 'rb') as file:
+                digest.update(file.read())
+        DATA_VERSION = digest.hexdigest()[:16]
+    return DATA_VERSION
+
+
+def entry_path(key: tuple) -> str:
+    """
+    :return: The path of the entry of key on disk.
+    """
+    digest = sha256(f'{key}\n{data_version()}'.encode()).hexdigest()
+    return join(cache.CACHE_DIR, f'{cache.SCHEMA}-include-{digest}{cache.EXTENSION}')
+
+
+def find_entry(key: tuple):
+    """
+    :return: A valid entry of key, from memory or from disk (None if there is no such entry).
+    """
+    entry = INCLUDES.get(key)
+    if entry is not None and is_valid(entry):
+        return entry
+    if cache.CACHE_DIR is not None:
+        entry = cache.read_entry(entry_path(key))
+        if entry is not None and is_valid(entry):
+            INCLUDES[key] = entry
+            return entry
+    return None
+
+
+def store_entry(key: tuple, entry: tuple):
+    INCLUDES[key] = entry
+    if cache.CACHE_DIR is not None and cache.store(entry_path(key), entry):
+        cache.evict()
+
+
+def convert_include(path: str, keep_data=False, replaces: dict | None = None) -> tuple:
+    """
+    Convert an included file.
+    :return: Entry of (the packed body, versions of the file and the files it includes, the stack of the converted
+             files if a recursive include was found, else None).
+    """
+    from PyLyX import LyX
+    from PyLyX.xhtml.converter import convert
+    frame = [abspath(path), {}, False]
+    context = stack()
+    INCLUDING.append(frame)
+    try:
+        root = LyX(path).get_doc()
+        frame[1][frame[0]] = file_version(frame[0])
+        root, info = convert(root, keep_data=keep_data, replaces=replaces)
+    finally:
+        INCLUDING.pop()
+    body = LyXobj('div', attrib={'class': 'include body'}, rank=-DEFAULT_RANK)
+    for element in root[1]:
+        body.append(element)
+    return pack(body), frame[1], context if frame[2] else None
+
+
+def include_body(path: str, keep_data=False, replaces: dict | None = None) -> LyXobj | None:
+    """
+    The converted body of an included file, by the entries of converted files (it is converted if there is no entry).
+    :param path: the path of the included .lyx file.
+    :param keep_data: Whether to preserve LyX metadata in output
+    :param replaces: Dictionary for string replacements in paths/attributes
+    :return: A new div of the converted body, or None if the file is converted now (a recursive include).
+    """
+    key = include_key(path, keep_data, replaces)
+    if key[0] in stack():
+        print(f'recursive include: {path}.')
+        for frame in INCLUDING:
+            frame[2] = True
+        return None
+    entry = find_entry(key)
+    if entry is None:
+        entry = convert_include(path, keep_data, replaces)
+        store_entry(key, entry)
+    for frame in INCLUDING:
+        frame[1].update(entry[1])
+        if entry[2] is not None:
+            frame[2] = True
+    return unpack(*entry[0])
+
+
+def run_document(path: str, function, *args, **kwargs):
+    """
+    Run a function (a conversion of the document of path), with the document in the stack of the converted files,
+    so an include of the document in itself is found (see include_body()).
+    :return: The result of the function.
+    """
+    frame = [abspath(path), {}, False]
+    INCLUDING.append(frame)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        INCLUDING.pop()
+
+
+def included_paths(root: LyXobj, replaces: dict | None = None) -> list:
+    """
+    :return: The distinct paths of the .lyx files which are included in a LyX document, in the document order
+             (after the replaces, as the converter finds them).
+    """
+    paths = []
+    for inset in select(root, 'inset:CommandInset:include'):
+        path = inset.get('filename', '').replace('"', '')
+        if replaces is not None:
+            for old in replaces:
+                path = path.replace(old, replaces[old])
+        if path.endswith('.lyx') and path not in paths:
+            paths.append(path)
+    return paths
+
+
+def convert_in_process(path: str, keep_data: bool, replaces: dict | None, context: tuple):
+    """
+    Convert an included file in a worker process, with the stack of the converted files of the parent process.
+    :return: The entry, or the exception which was raised while converting the file.
+    """
+    INCLUDING[:] = [[full_path, {}, False] for full_path in context]
+    try:
+        return convert_include(path, keep_data, replaces)
+    except Exception as e:
+        return e
+
+
+def convert_includes(root: LyXobj, path='', workers=1, keep_data=False, replaces: dict | None = None):
+    """
+    Convert the distinct files which are included in a LyX document (and have no valid entries), in parallel processes,
+    before the document is converted. Errors are raised later, by the conversion of the document.
+    On Windows, call it under an "if __name__ == '__main__':" guard.
+    :param root: the root of the document.
+    :param path: the path of the document.
+    :param workers: number of processes (if there are fewer files to convert than 2, they are converted in the conversion
+                    of the document).
+    :param keep_data: Whether to preserve LyX metadata in output
+    :param replaces: Dictionary for string replacements in paths/attributes
+    """
+    context = (abspath(path),) if path else ()
+    INCLUDING.extend([full_path, {}, False] for full_path in context)
+    try:
+        todo = [p for p in included_paths(root, replaces)
+                if abspath(p) not in context and find_entry(include_key(p, keep_data, replaces)) is None]
+    finally:
+        del INCLUDING[len(INCLUDING) - len(context):]
+    if workers < 2 or len(todo) < 2:
+        return
+    with ProcessPoolExecutor(min(workers, len(todo))) as executor:
+        futures = [executor.submit(convert_in_process, p, keep_data, replaces, context) for p in todo]
+        for p, future in zip(todo, futures):
+            entry = future.result()
+            if type(entry) is tuple:
+                store_entry(include_key(p, keep_data, replaces), entry)
@@ -11,15 +11,50 @@ from importlib import import_module
 from PyLyX.data.data import PACKAGE_PATH
 from PyLyX.xhtml.helper import CSS_FOLDER
 from PyLyX.objects.Environment import Environment
+from PyLyX.xhtml.pipeline import Stage, run_stages
+
+
+def module_stages(module: str, head: Environment, body: Environment, info: dict, css_folder=CSS_FOLDER) -> list:
+    """
+    Get the stages of a LyX module, for the traversal of the converted body (see xhtml/pipeline.py).
+    
+    A module provides a stages(head, info, css_folder) function, which may change the HTML head
+    and returns a list of Stage objects. A module which provides a main() function only
+    is run after the traversal, as a separate pass.
+    
+    :param module: Name of the LyX module (without .py extension)
+    :param head: HTML head element
+    :param body: HTML body element
+    :param info: Document metadata dictionary
+    :param css_folder: Path to CSS folder for module stylesheets
+    :return: List of the module's stages (empty list for an unknown module)
+    """
+    path = join(PACKAGE_PATH, 'xhtml', 'modules', module) + '.py'
+    if not exists(path):
+        print(f'unknown module: {module}.')
+        return []
+    module = import_module(f'PyLyX.xhtml.modules.{module}')
+    if hasattr(module, 'stages'):
+        return module.stages(head, info, css_folder)
+    return [MainStage(module.main, head, body, info, css_folder)]
+
+
+class MainStage(Stage):
+    """
+    A module without stages, which runs its main() after the traversal.
+    """
+    def __init__(self, main, *args):
+        self.main, self.args = main, args
+
+    def finish(self):
+        self.main(*self.args)
 
 
 def perform_module(module: str, head: Environment, body: Environment, info: dict, css_folder=CSS_FOLDER):
     """
     Process a LyX module during XHTML conversion.
     
-    Dynamically loads and executes the module's conversion handler.
-    Each module should provide a main() function that modifies the
-    HTML head and/or body as needed.
+    Loads the module's stages (see module_stages()) and runs them in a traversal of the body.
     
     Supported modules include:
     - theorems-ams: AMS theorem environments
@@ -34,9 +69,4 @@ def perform_module(module: str, head: Environment, body: Environment, info: dict
     :param info: Document metadata dictionary
     :param css_folder: Path to CSS folder for module stylesheets
     """
-    path = join(PACKAGE_PATH, 'xhtml', 'modules', module) + '.py'
-    if exists(path):
-        module = f'PyLyX.xhtml.modules.{module}'
-        import_module(module).main(head, body, info, css_folder)
-    else:
-        print(f'unknown module: {module}.')
\ No newline at end of file
+    run_stages(body, module_stages(module, head, body, info, css_folder))
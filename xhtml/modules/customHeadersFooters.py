@@ -1,7 +1,19 @@
 from PyLyX.xhtml.helper import CSS_FOLDER
+from PyLyX.xhtml.pipeline import Stage, run_stages
 from PyLyX.objects.Environment import Environment
 
+
+class HeadersFootersStage(Stage):
+    def accepts(self, kind) -> bool:
+        return kind.category in {'Right', 'Center', 'Left'} and kind.details in {'Header', 'Footer'}
+
+    def enter(self, e, ancestors: list):
+        e.set('style', 'display: none')
+
+
+def stages(head: Environment, info: dict, css_folder=CSS_FOLDER):
+    return [HeadersFootersStage()]
+
+
 def main(head: Environment, body: Environment, info: dict, css_folder=CSS_FOLDER):
-    for e in body.iter():
-        if e.is_category({'Right', 'Center', 'Left'}) and e.is_details({'Header', 'Footer'}):
-            e.set('style', 'display: none')
+    run_stages(body, stages(head, info, css_folder))
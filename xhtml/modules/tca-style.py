@@ -1,10 +1,13 @@
 from importlib import import_module
 from PyLyX.xhtml.helper import CSS_FOLDER
+from PyLyX.xhtml.pipeline import run_stages
 from PyLyX.objects.Environment import Environment
 
 
+def stages(head: Environment, info: dict, css_folder=CSS_FOLDER):
+    ams = import_module('PyLyX.xhtml.modules.theorems-ams').stages(head, info, css_folder)
+    return ams + import_module('PyLyX.xhtml.modules.theorems-sec').stages(head, info, css_folder)
+
+
 def main(head: Environment, body: Environment, info: dict, css_folder=CSS_FOLDER):
-    module = f'PyLyX.xhtml.modules.theorems-ams'
-    import_module(module).main(head, body, info, css_folder)
-    module = f'PyLyX.xhtml.modules.theorems-sec'
-    import_module(module).main(head, body, info, css_folder)
+    run_stages(body, stages(head, info, css_folder))
@@ -3,19 +3,34 @@ from PyLyX.data.data import THEOREMS, TRANSLATE
 from PyLyX.objects.Environment import Environment
 from PyLyX.xhtml.special_objects import prefixing
 from PyLyX.xhtml.helper import create_css, CSS_FOLDER
+from PyLyX.xhtml.pipeline import Stage, run_stages
 
 
-def main(head: Environment, body: Environment, info: dict, css_folder=CSS_FOLDER):
-    head.append(create_css(join(css_folder, 'modules', 'theorems-ams.css')))
-    lang = info['language']
-    i = 0
-    for e in body.iter('div'):
+class TheoremsStage(Stage):
+    tags = {'div'}
+
+    def __init__(self, lang: str):
+        self.lang, self.i = lang, 0
+
+    def accepts(self, kind) -> bool:
+        return kind.category in THEOREMS
+
+    def enter(self, e, ancestors: list):
         if e.category() in THEOREMS:
             name = e.category()
-            i += 1
-            prefix = TRANSLATE['layout'][name][''][lang]
+            self.i += 1
+            prefix = TRANSLATE['layout'][name][''][self.lang]
             if not name.endswith('*') and name != 'Proof':
-                prefix += f' {i}.'
+                prefix += f' {self.i}.'
             else:
                 prefix += '.'
-            prefixing(e, prefix)
\ No newline at end of file
+            prefixing(e, prefix)
+
+
+def stages(head: Environment, info: dict, css_folder=CSS_FOLDER):
+    head.append(create_css(join(css_folder, 'modules', 'theorems-ams.css')))
+    return [TheoremsStage(info['language'])]
+
+
+def main(head: Environment, body: Environment, info: dict, css_folder=CSS_FOLDER):
+    run_stages(body, stages(head, info, css_folder))
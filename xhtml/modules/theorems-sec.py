@@ -1,14 +1,32 @@
 from PyLyX.objects.Environment import Environment
 from PyLyX.data.data import THEOREMS
 from PyLyX.xhtml.helper import CSS_FOLDER
+from PyLyX.xhtml.pipeline import Stage, run_stages
+
+
+class SectionTheoremsStage(Stage):
+    tags = {'section', 'div'}
+
+    def __init__(self):
+        self.sec, self.n, self.i = None, '', 0
+
+    def accepts(self, kind) -> bool:
+        return kind.category == 'Section' or kind.category in THEOREMS
+
+    def enter(self, e, ancestors: list):
+        if e.tag == 'section':
+            if len(ancestors) == 1 and e.is_category('Section'):
+                self.sec, self.n, self.i = e, e[0][0].text[:-1], 0
+        elif len(ancestors) > 1 and ancestors[1] is self.sec:
+            name = e.category()
+            if e.category() in THEOREMS and not name.endswith('*') and name != 'Proof':
+                self.i += 1
+                e[0].text = e[0].text.split()[0] + f' {self.n}.{self.i}. '
+
+
+def stages(head: Environment, info: dict, css_folder=CSS_FOLDER):
+    return [SectionTheoremsStage()]
 
 
 def main(head: Environment, body, info: dict, css_folder=CSS_FOLDER):
-    for sec in body.findall('section'):
-        if sec.is_category('Section'):
-            n, i = sec[0][0].text[:-1], 0
-            for e in sec.iter('div'):
-                name = e.category()
-                if e.category() in THEOREMS and not name.endswith('*') and name != 'Proof':
-                    i += 1
-                    e[0].text = e[0].text.split()[0] + f' {n}.{i}. '
+    run_stages(body, stages(head, info, css_folder))
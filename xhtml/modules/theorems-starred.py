@@ -2,5 +2,9 @@ from PyLyX.objects.Environment import Environment
 from PyLyX.xhtml.helper import CSS_FOLDER
 
 
+def stages(head: Environment, info: dict, css_folder=CSS_FOLDER):
+    return []
+
+
 def main(head: Environment, body, info: dict, css_folder=CSS_FOLDER):
-    pass
\ No newline at end of file
+    pass
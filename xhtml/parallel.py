@@ -0,0 +1,116 @@
+"""
+Parallel conversion of sections.
+
+This module provides:
+- split_sections(): The sections of a LyX body which are converted in parallel
+- SectionConversions: Convert sections by recursive_convert() in worker processes, and give them in the document order
+- section_conversions(): The SectionConversions of a LyX body, for convert() and convert_stream() (workers=N)
+
+A converted section does not depend on the rest of the document, but the table of contents insets
+(which get the document's table of contents, see add_toc()); they are completed when the section is given.
+The numbering, the table of contents and the other stages run after the conversion (or while the document is written),
+in the same way as for a document which was converted in one process, so the output is the same.
+On Windows (where the processes are spawned), convert under an "if __name__ == '__main__':" guard.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from PyLyX.objects.LyXobj import LyXobj
+from PyLyX.objects.Environment import Container
+
+
+def split_sections(body: LyXobj, workers: int) -> list:
+    """
+    :return: The top-level sections of body (Part, Chapter, etc.), in the document order.
+             If there are fewer of them than workers, the sections in them are taken instead, while there are more.
+    """
+    sections = [e for e in body if type(e) is Container]
+    while 0 < len(sections) < workers:
+        deeper = []
+        for sec in sections:
+            subsections = [e for e in sec if type(e) is Container]
+            deeper.extend(subsections if subsections else [sec])
+        if len(deeper) == len(sections):
+            break
+        sections = deeper
+    return sections
+
+
+def convert_section(sec: Container, lang: str, keep_data: bool, replaces: dict | None, including: tuple):
+    """
+    Convert a section in a worker process, with the stack of the converted files of the parent process
+    (see xhtml/includes.py).
+    """
+    from PyLyX.xhtml.converter import recursive_convert
+    from PyLyX.xhtml.includes import INCLUDING
+    INCLUDING[:] = [[path, {}, False] for path in including]
+    return recursive_convert(sec, lang, None, keep_data, replaces)
+
+
+class SectionConversions:
+    """
+    Sections which are converted in worker processes. Their conversions are given in the document order
+    (by get()); a few of them are converted ahead, so the converted sections are not kept until the end.
+    """
+    def __init__(self, sections: list, workers: int, lang='english', toc: tuple[LyXobj, LyXobj] | None = None,
+                 keep_data=False, replaces: dict | None = None):
+        """
+        :param sections: LyX sections (see split_sections()).
+        :param workers: number of processes.
+        :param lang: Document language code
+        :param toc: Tuple of (toc_title, toc_list) for the table of contents insets
+        :param keep_data: Whether to preserve LyX metadata
+        :param replaces: Dictionary of string replacements for attributes
+        """
+        from PyLyX.xhtml.includes import stack
+        self.ids = {id(sec) for sec in sections}
+        self.toc = toc
+        self.__sections = deque(sections)
+        self.__args = lang, keep_data, replaces, stack()
+        self.__executor = ProcessPoolExecutor(workers)
+        self.__futures = deque()
+        self.__ahead = 2 * workers
+        self.__submit()
+
+    def __submit(self):
+        while self.__sections and len(self.__futures) < self.__ahead:
+            self.__futures.append(self.__executor.submit(convert_section, self.__sections.popleft(), *self.__args))
+
+    def __contains__(self, sec) -> bool:
+        return id(sec) in self.ids
+
+    def get(self) -> LyXobj:
+        """
+        :return: The next converted section.
+        """
+        from PyLyX.xhtml.converter import add_toc
+        future = self.__futures.popleft()
+        self.__submit()
+        new_sec = future.result()
+        if self.toc is not None:
+            for e in [e for e in new_sec.iter() if e.is_details('toc')]:
+                add_toc(e, self.toc[0], self.toc[1])
+        if not self.__futures:
+            self.close()
+        return new_sec
+
+    def close(self):
+        """
+        Stop the worker processes (the sections which were not given are not converted).
+        """
+        for future in self.__futures:
+            future.cancel()
+        self.__executor.shutdown()
+
+
+def section_conversions(body: LyXobj, workers: int, lang='english', toc: tuple[LyXobj, LyXobj] | None = None,
+                        keep_data=False, replaces: dict | None = None) -> SectionConversions | None:
+    """
+    :return: The SectionConversions of body, or None if workers < 2 or body has fewer sections than 2.
+    """
+    if workers < 2:
+        return None
+    sections = split_sections(body, workers)
+    if len(sections) < 2:
+        return None
+    return SectionConversions(sections, min(workers, len(sections)), lang, toc, keep_data, replaces)
@@ -0,0 +1,148 @@
+"""
+Single traversal pipeline for XHTML conversion.
+
+This module provides:
+- Stage: A visitor of a tree, with hooks which are called when the traversal enters and exits any object
+- run_stages(): Run many stages in one traversal of a tree
+- Pipeline: Stages which are given a tree in parts, as it is converted (for streaming, see converter.convert_stream())
+- WhitespaceStage: Remove doubled whitespaces around inline elements (span, b, u, i)
+
+The steps which follow the conversion (the title, the numbering and the table of contents, the footnotes and
+the captions, the modules and the whitespaces) were separate passes over the converted body;
+as stages they run in one traversal, in their order for any object. A stage may change the object it enters
+and the sub-elements of it (they are visited after the change), but not the objects which were already visited.
+"""
+
+from xml.etree.ElementTree import Element
+from PyLyX.objects.LyXobj import LyXobj, walk
+from PyLyX.objects.registry import Kind
+
+INLINE = {'span', 'b', 'u', 'i'}
+WHITESPACES = {' ', '\t', '\n'}
+
+
+class Stage:
+    """
+    A step of the pipeline. Subclasses override some of the hooks, and may filter the objects which the hooks get,
+    by their tags and by their kinds.
+    """
+    tags = None  # the tags of the objects which the hooks get (None for all the objects).
+
+    def accepts(self, kind: Kind) -> bool:
+        """
+        :return: Do the hooks get objects of this kind? It is called once for any kind in a traversal
+                 (objects which are not LyX objects are given to stages which do not override it only).
+        """
+        return True
+
+    def enter(self, obj: Element, ancestors: list):
+        """
+        Called before the sub-elements of obj are visited.
+        :param ancestors: the ancestors of obj, from the traversal's root (empty for the root).
+        """
+        pass
+
+    def exit(self, obj: Element, ancestors: list):
+        """
+        Called after the sub-elements of obj were visited.
+        """
+        pass
+
+    def finish(self):
+        """
+        Called once, after the traversal.
+        """
+        pass
+
+
+def overrides(stage: Stage, name: str) -> bool:
+    return getattr(type(stage), name) is not getattr(Stage, name)
+
+
+class Pipeline:
+    """
+    Stages, with their hooks by the tags and the kinds of objects, for traversals of a tree in parts
+    (a streaming conversion gives the stages the objects of the body as they are converted).
+    """
+    def __init__(self, stages):
+        """
+        :param stages: iterable of Stage objects.
+        """
+        self.stages = list(stages)
+        self.enters, self.exits = {}, {}  # (tag, kind id) -> the hooks of the objects of this tag and kind.
+        self.has_exits = any(overrides(stage, 'exit') for stage in self.stages)
+        self.has_hooks = self.has_exits or any(overrides(stage, 'enter') for stage in self.stages)
+
+    def __select(self, obj: Element, key: tuple):
+        kind = obj.kind() if key[1] is not None else None
+        selected = [stage for stage in self.stages if (stage.tags is None or obj.tag in stage.tags)
+                    and (stage.accepts(kind) if kind is not None else not overrides(stage, 'accepts'))]
+        self.enters[key] = [stage.enter for stage in selected if overrides(stage, 'enter')]
+        self.exits[key] = [stage.exit for stage in selected if overrides(stage, 'exit')]
+
+    def enter(self, obj: Element, ancestors: list):
+        """
+        Call the enter hooks of obj.
+        """
+        key = obj.tag, obj.kind().id if isinstance(obj, LyXobj) else None
+        hooks = self.enters.get(key)
+        if hooks is None:
+            self.__select(obj, key)
+            hooks = self.enters[key]
+        for enter in hooks:
+            enter(obj, ancestors)
+
+    def exit(self, obj: Element, ancestors: list):
+        """
+        Call the exit hooks of obj (after its enter hooks were called).
+        """
+        for exit_ in self.exits[obj.tag, obj.kind().id if isinstance(obj, LyXobj) else None]:
+            exit_(obj, ancestors)
+
+    def run(self, root: Element, ancestors: list | None = None):
+        """
+        Call the hooks of the objects of a tree, in the document order.
+        :param ancestors: the ancestors of root, if it is a part of a bigger tree.
+        """
+        if self.has_hooks:
+            walk(root, self.enter, self.exit if self.has_exits else None, ancestors=ancestors)
+
+    def finish(self):
+        for stage in self.stages:
+            stage.finish()
+
+
+def run_stages(root: Element, stages) -> Element:
+    """
+    Run stages in one traversal of a tree, in the document order.
+    The hooks of any object are found once for any combination of tag and kind.
+    :param root: the tree's root (for example, the converted body).
+    :param stages: iterable of Stage objects.
+    :return: root.
+    """
+    pipeline = Pipeline(stages)
+    pipeline.run(root)
+    pipeline.finish()
+    return root
+
+
+class WhitespaceStage(Stage):
+    """
+    Remove the whitespaces at the start of an inline element's text when its tail starts with two whitespaces,
+    and at the end of the text of the object before it when the tail of that object ends with two whitespaces.
+    """
+    def __init__(self):
+        self.last = None  # the previous object in the document order.
+
+    def enter(self, obj: Element, ancestors: list):
+        last = self.last if self.last is not None else obj
+        if obj.tag in INLINE:
+            if len(obj.tail) > 1 and obj.tail[0] in WHITESPACES and obj.tail[1] in WHITESPACES:
+                text = obj.text.lstrip()
+                if text != obj.text:
+                    obj.text = text
+            if len(last.tail) > 1 and last.tail[-1] in WHITESPACES and last.tail[-2] in WHITESPACES:
+                text = last.text.rstrip()
+                if text != last.text:
+                    last.text = text
+        self.last = obj
@@ -15,7 +15,7 @@ Each handler transforms LyX-specific formatting into appropriate HTML/CSS.
 from json import load
 from os.path import join
 from PyLyX.data.data import PACKAGE_PATH, RTL_LANGS
-from PyLyX.objects.LyXobj import LyXobj, DEFAULT_RANK
+from PyLyX.objects.LyXobj import LyXobj, DEFAULT_RANK, walk, STOP
 from PyLyX.package_helper import detect_lang
 
 with open(join(PACKAGE_PATH, 'xhtml\\data\\texts.json'), 'r', encoding='utf8') as f:
@@ -54,24 +54,23 @@ def perform_cell(old_attrib: dict, new_attrib: dict):
 
 
 def extract_first_word(obj, edit=False):
-    if obj.text:
-        first = obj.text.split()[0]
-        if edit:
-            obj.text = obj.text[len(first):]
-        return first
-
-    for e in obj:
-        first = extract_first_word(e, edit)
-        if first:
-            return first
-
-    if obj.tail:
-        first = obj.tail.split()[0]
-        if edit:
-            obj.tail = obj.tail[len(first):]
-        return first
-    else:
-        return False
+    """
+    Find the first word of an object, in its text, its sub-elements or its tail (in the document order).
+    :param edit: remove the word from the object?
+    :return: The first word, or False if there is no word.
+    """
+    found = []
+
+    def take(e, attribute: str):
+        words = (getattr(e, attribute) or '').split()
+        if words:
+            found.append(words[0])
+            if edit:
+                setattr(e, attribute, getattr(e, attribute)[len(words[0]):])
+            return STOP
+
+    walk(obj, lambda e, ancestors: take(e, 'text'), lambda e, ancestors: take(e, 'tail'))
+    return found[0] if found else False
 
 
 def perform_lists(father, child, last=None):
@@ -0,0 +1,216 @@
+"""
+Streaming XHTML writer.
+
+This module provides:
+- XHTMLWriter: Write an XML tree to a file incrementally, element by element, with optional pretty-printing
+
+The output is the same as the output of xml.etree.ElementTree.indent() and tostring() of the whole tree,
+but only the open elements (the path from the root) and the last written element are kept,
+so the tree may be built while it is written, and its parts may be dropped after they are written.
+An element's tail depends on whether it is the last sub-element of its father (indent() dedents the last one),
+so any element is written when the next one begins, or when its father ends.
+The written parts are indented and serialized without recursion (by a stack), so any depth which the loader
+supports is written; subtrees which are not deeper than SHALLOW are serialized by ElementTree.tostring().
+"""
+
+from xml.etree.ElementTree import Element, tostring
+from PyLyX.objects.LyXobj import walk, SKIP
+
+SPACE = '  '
+EMPTY = '<a />'  # the serialization of an empty element, for escaping tails.
+SHALLOW = 100  # the maximal depth of subtrees which are serialized by tostring() (it is recursive).
+
+
+def start_tag(elem: Element, text: str) -> str:
+    """
+    :return: The start tag of elem (with its attributes) and text, escaped as ElementTree escapes them.
+    """
+    shallow = Element(elem.tag, elem.attrib)
+    shallow.text = text
+    string = tostring(shallow, encoding='unicode')
+    return string[:-len(f'</{elem.tag}>')] if text else string[:-len(' />')] + '>'
+
+
+def escape_tail(tail: str) -> str:
+    shallow = Element('a')
+    shallow.tail = tail
+    return tostring(shallow, encoding='unicode')[len(EMPTY):]
+
+
+def is_blank(text: str | None) -> bool:
+    return not text or not text.strip()
+
+
+def indent_tree(tree: Element, space=SPACE, level=0) -> int:
+    """
+    Indent a tree as xml.etree.ElementTree.indent() does, without recursion.
+    :param tree: the tree's root.
+    :param space: the indentation of one level.
+    :param level: the initial indentation level of the root.
+    :return: The depth of the tree (0 if the root has no sub-elements).
+    """
+    if not len(tree):
+        return 0
+    indentations = ['\n' + level * space]
+    stack = [(tree, 0)]  # (element with sub-elements, its level)
+    depth = 0
+    while stack:
+        elem, elem_level = stack.pop()
+        child_level = elem_level + 1
+        if child_level == len(indentations):
+            indentations.append(indentations[-1] + space)
+            depth = child_level
+        child_indentation = indentations[child_level]
+        if not elem.text or not elem.text.strip():
+            elem.text = child_indentation
+        for child in elem:
+            if len(child):
+                stack.append((child, child_level))
+            if not child.tail or not child.tail.strip():
+                child.tail = child_indentation
+        if not child.tail.strip():
+            child.tail = indentations[elem_level]
+    return depth
+
+
+def heights(tree: Element) -> dict:
+    """
+    :return: Dictionary of id -> the height of the subtree (1 for an element without sub-elements), of the elements of tree.
+    """
+    result = {}
+
+    def post(e, ancestors):
+        result[id(e)] = 1 + max((result[id(sub)] for sub in e), default=0)
+
+    walk(tree, post=post)
+    return result
+
+
+def serialize(tree: Element, depth: int | None = None) -> str:
+    """
+    :param tree: the tree's root.
+    :param depth: the depth of the tree, if it is known (see indent_tree()).
+    :return: The serialization of tree (with its tail) as ElementTree.tostring() gives it, without deep recursion.
+    """
+    if depth is not None and depth < SHALLOW:
+        return tostring(tree, encoding='unicode')
+    sizes = heights(tree)
+    if sizes[id(tree)] <= SHALLOW:
+        return tostring(tree, encoding='unicode')
+    parts = []
+
+    def pre(e, ancestors):
+        if sizes[id(e)] <= SHALLOW:
+            parts.append(tostring(e, encoding='unicode'))
+            return SKIP
+        parts.append(start_tag(e, e.text))
+
+    def post(e, ancestors):
+        if sizes[id(e)] > SHALLOW:
+            parts.append(f'</{e.tag}>')
+            if e.tail:
+                parts.append(escape_tail(e.tail))
+
+    walk(tree, pre, post)
+    return ''.join(parts)
+
+
+class XHTMLWriter:
+    """
+    A writer of an XML tree: elements are opened by start() and closed by end(), and complete elements
+    (with their sub-elements) are written by element().
+    """
+    def __init__(self, file, pretty=True, space=SPACE, encoding='utf8'):
+        """
+        :param file: binary file object for writing.
+        :param pretty: indent the output as xml.etree.ElementTree.indent() does.
+        :param space: the indentation of one level.
+        :param encoding: the output's encoding (it is declared in the first line).
+        """
+        self.__file, self.__pretty, self.__space, self.__encoding = file, pretty, space, encoding
+        self.__stack = []  # [element, was its start tag written, its last sub-element (or None), is it complete]
+        self.__write(f"<?xml version='1.0' encoding='{encoding}'?>\n")
+
+    def __write(self, string: str):
+        self.__file.write(string.encode(self.__encoding, 'xmlcharrefreplace'))
+
+    def __indentation(self, level: int) -> str:
+        return '\n' + level * self.__space
+
+    def __flush_last(self, tail_level: int):
+        """
+        Write the last sub-element of the current element, with its tail (indented to tail_level, if it is blank).
+        """
+        frame = self.__stack[-1]
+        last, complete = frame[2], frame[3]
+        depth = None
+        if self.__pretty and complete:
+            depth = indent_tree(last, self.__space, len(self.__stack))
+        if self.__pretty and is_blank(last.tail):
+            last.tail = self.__indentation(tail_level)
+        self.__write(serialize(last, depth) if complete else escape_tail(last.tail))
+        frame[2] = None
+
+    def __child(self):
+        """
+        Prepare the current element for a new sub-element.
+        """
+        if not self.__stack:
+            return
+        frame = self.__stack[-1]
+        level = len(self.__stack)
+        if not frame[1]:
+            text = frame[0].text
+            if self.__pretty and is_blank(text):
+                text = self.__indentation(level)
+            self.__write(start_tag(frame[0], text))
+            frame[1] = True
+        elif frame[2] is not None:
+            self.__flush_last(level)
+
+    def start(self, elem: Element):
+        """
+        Open elem as a sub-element of the current element; its sub-elements are written until end() is called.
+        Its text may be changed until its first sub-element is written.
+        """
+        self.__child()
+        self.__stack.append([elem, False, None, False])
+
+    def element(self, elem: Element):
+        """
+        Write a complete element (with its sub-elements) as a sub-element of the current element.
+        It may be changed until the next element is written, and then it may be dropped.
+        """
+        self.__child()
+        if self.__stack:
+            self.__stack[-1][2:] = [elem, True]
+        else:
+            depth = indent_tree(elem, self.__space) if self.__pretty else None
+            self.__write(serialize(elem, depth))
+
+    def end(self):
+        """
+        Close the current element.
+        """
+        elem, started, last, _ = self.__stack[-1]
+        level = len(self.__stack) - 1
+        if started:
+            if last is not None:
+                self.__flush_last(level)
+            self.__write(f'</{elem.tag}>')
+        else:
+            shallow = Element(elem.tag, elem.attrib)
+            shallow.text = elem.text
+            self.__write(tostring(shallow, encoding='unicode'))
+        self.__stack.pop()
+        if self.__stack:
+            self.__stack[-1][2:] = [elem, False]
+        elif elem.tail:
+            self.__write(escape_tail(elem.tail))
+
+    def close(self):
+        """
+        Close all the open elements.
+        """
+        while self.__stack:
+            self.end()